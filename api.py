@@ -0,0 +1,348 @@
+import hmac
+from datetime import timedelta
+
+import mysql.connector
+from flask import Blueprint, Response, jsonify, request
+
+from db.config import SNAPSHOT_CONFIG
+from db.dashboard import fetch_dashboard, read_dashboard_params
+from db.db import get_db
+from db.engine import fast_forward
+from db.events import event_stream, read_cursor, read_events
+from db.leaderboard import leaderboard, read_leaderboard_params
+from db.procedures import CHANGED_STATUSES, PROCEDURE_MESSAGES, board_flights, call_procedure, crew_flights
+from db.routes import route_index
+from db.snapshots import SnapshotError, UnknownSnapshot, drop_snapshot, list_snapshots, restore_snapshot, save_snapshot
+from db.simulation import format_clock, read_simulation_params, run_simulation
+from db.validation import (validate_airplane, validate_airport, validate_assign_pilot, validate_flight,
+                           validate_flight_batch, validate_offer_flight, validate_person, validate_pilot_license)
+from db.views import VIEW_KEYS, ViewPage, read_page_params, view_columns
+
+# JSON versions of the reporting views and of every operation on the site.
+#
+#   GET  /api/v1/views                   view names and their sort keys
+#   GET  /api/v1/views/<view>            one page of a view as a list of objects
+#   GET  /api/v1/dashboard               the first rows of every view, read in parallel
+#   GET  /api/v1/routes/<route>          the ordered legs of a route, from the route index
+#   GET  /api/v1/leaderboard            frequent fliers by miles, ?offset=&limit= paging
+#   GET  /api/v1/leaderboard/<person>   the rank and miles of one passenger
+#   GET  /api/v1/events?after=<id>       flight events recorded after an event ID
+#   GET  /api/v1/events/stream           the same as server-sent events, as they happen
+#        ?fields=a,b                     only these columns
+#        ?<column>=<value>               only rows where column = value
+#        ?after=<key>&limit=<n>          keyset paging, as on the HTML pages
+#   POST /api/v1/<operation>             run an add_* or flight operation
+#   POST /api/v1/simulation_cycle        run simulation steps
+#   POST /api/v1/passengers_board_batch  board every flight at an airport, or a list of flights
+#   POST /api/v1/auto_crew               assign the pilots every flight at an airport (or a list) needs
+#   GET  /api/v1/admin/snapshots         named snapshots of the database (see admin_denied)
+#   POST /api/v1/admin/snapshots/<name>          save the current data as a snapshot
+#   POST /api/v1/admin/snapshots/<name>/restore  put the data back as it was in the snapshot
+#   DELETE /api/v1/admin/snapshots/<name>        drop a snapshot
+#
+# Projection and filters are applied in the SQL query, so only the requested
+# rows and columns are read from the database.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+PAGE_PARAMS = {'fields', 'after', 'limit'}
+
+# The same checks as the HTML forms; each returns the procedure's arguments in order.
+VALIDATORS = {
+    'add_airport': validate_airport,
+    'add_person': validate_person,
+    'add_airplane': validate_airplane,
+    'grant_or_revoke_pilot_license': validate_pilot_license,
+    'offer_flight': validate_offer_flight,
+    'assign_pilot': validate_assign_pilot,
+    'flight_takeoff': validate_flight,
+    'flight_landing': validate_flight,
+    'passengers_board': validate_flight,
+    'passengers_disembark': validate_flight,
+    'recycle_crew': validate_flight,
+    'retire_flight': validate_flight
+}
+
+
+def json_value(value):
+    if isinstance(value, timedelta):
+        return format_clock(value)
+    return value
+
+
+def error(message, code=400):
+    return jsonify({'error': message}), code
+
+
+@api.route('/views')
+def list_views():
+    return jsonify({view: list(keys) for view, keys in VIEW_KEYS.items()})
+
+
+@api.route('/views/<view>')
+def get_view(view):
+    if view not in VIEW_KEYS:
+        return error(f"Unknown view {view}.", 404)
+
+    try:
+        after, limit = read_page_params(view, request.args)
+        conn = get_db()
+        columns = view_columns(conn, view)
+
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        unknown = [field for field in fields if field not in columns]
+        filters = {name: value for name, value in request.args.items() if name not in PAGE_PARAMS}
+        unknown += [name for name in filters if name not in columns]
+        if unknown:
+            return error(f"Unknown column(s): {', '.join(unknown)}.")
+
+        page = ViewPage(conn, view, after, limit, fields or None, filters)
+        wanted = fields or page.columns
+        index = [page.columns.index(name) for name in wanted]
+        rows = [{name: json_value(row[i]) for name, i in zip(wanted, index)} for row in page.rows]
+    except ValueError as e:
+        return error(str(e))
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+    return jsonify({
+        'view': view,
+        'columns': wanted,
+        'rows': rows,
+        'next_after': [json_value(value) for value in page.next_after] if page.next_after else None
+    })
+
+
+@api.route('/dashboard')
+def get_dashboard():
+    try:
+        limit = read_dashboard_params(request.args)
+    except ValueError as e:
+        return error(str(e))
+
+    views = {}
+    for view, result in fetch_dashboard(limit=limit).items():
+        views[view] = {
+            'columns': result['columns'],
+            'rows': [{name: json_value(value) for name, value in zip(result['columns'], row)}
+                     for row in result['rows']],
+            'next_after': [json_value(value) for value in result['next_after']] if result['next_after'] else None,
+            'elapsed_ms': result['elapsed_ms'],
+            'error': result['error']
+        }
+    return jsonify(views)
+
+
+@api.route('/routes/<route_id>')
+def get_route(route_id):
+    try:
+        route = route_index.get(get_db(), route_id)
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+    if route is None:
+        return error(f"Unknown route {route_id}.", 404)
+
+    return jsonify({
+        'route': route.routeID,
+        'leg_count': route.leg_count,
+        'distance': route.distance,
+        'departure': route.departure(),
+        'arrival': route.arrival(),
+        'legs': route.legs
+    })
+
+
+@api.route('/leaderboard')
+def get_leaderboard():
+    try:
+        offset, limit = read_leaderboard_params(request.args)
+        rows, next_offset, passengers = leaderboard.top(get_db(), offset, limit)
+    except ValueError as e:
+        return error(str(e), 400)
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+    return jsonify({'rows': rows, 'next_offset': next_offset, 'passengers': passengers})
+
+
+@api.route('/leaderboard/<person_id>')
+def get_leaderboard_rank(person_id):
+    try:
+        row = leaderboard.rank(get_db(), person_id)
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+    if row is None:
+        return error(f"{person_id} is not a passenger with miles.", 404)
+
+    return jsonify(row)
+
+
+@api.route('/events')
+def get_events():
+    try:
+        after = read_cursor(request.args.get('after', '0'))
+        limit = read_cursor(request.args.get('limit', '0')) or None
+        events = read_events(get_db(), after, limit)
+    except ValueError as e:
+        return error(str(e))
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+    return jsonify({
+        'events': events,
+        'next_after': events[-1]['eventID'] if events else after
+    })
+
+
+@api.route('/events/stream')
+def stream_events():
+    # EventSource sends Last-Event-ID when it reconnects.
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        after = read_cursor(cursor) if cursor is not None else None
+    except ValueError as e:
+        return error(str(e))
+
+    return Response(event_stream(after), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/simulation_cycle', methods=['POST'])
+def simulation_cycle():
+    params = request.get_json(silent=True) or request.form
+    try:
+        max_steps, until, batch_size = read_simulation_params(params)
+    except ValueError as e:
+        return error(str(e))
+
+    if max_steps is None and until is None:
+        max_steps = 1
+
+    try:
+        if params.get('engine') == 'memory':
+            result = fast_forward(get_db(), max_steps, until)
+        else:
+            result = run_simulation(get_db(), max_steps, until, batch_size)
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+    return jsonify(result), 500 if result['error'] else 200
+
+
+@api.route('/passengers_board_batch', methods=['POST'])
+def passengers_board_batch():
+    values, message = validate_flight_batch(request.get_json(silent=True) or request.form)
+    if message:
+        return error(message)
+
+    try:
+        status, message, flights = board_flights(get_db(), values['airport_id'], values['flight_ids'])
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+    changed = status in CHANGED_STATUSES
+    return jsonify({
+        'status': status,
+        'message': message,
+        'changed': changed,
+        'boarded': sum(flight['boarded'] for flight in flights),
+        'flights': flights
+    }), 200 if changed else 409
+
+
+@api.route('/auto_crew', methods=['POST'])
+def auto_crew():
+    values, message = validate_flight_batch(request.get_json(silent=True) or request.form)
+    if message:
+        return error(message)
+
+    try:
+        status, message, flights = crew_flights(get_db(), values['airport_id'], values['flight_ids'])
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+    changed = status in CHANGED_STATUSES
+    return jsonify({
+        'status': status,
+        'message': message,
+        'changed': changed,
+        'assigned': sum(flight['assigned'] for flight in flights),
+        'flights': flights
+    }), 200 if changed else 409
+
+
+def admin_denied():
+    """The error response for a request that may not use the admin routes, or None.
+
+    The routes need the X-Admin-Token header to match SNAPSHOT_CONFIG['admin_token'].
+    Without a configured token they do not exist at all; the `flask snapshot`
+    commands cover local use.
+    """
+    token = SNAPSHOT_CONFIG['admin_token']
+    if not token:
+        return error("Not found.", 404)
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), token.encode('utf-8')):
+        return error("Admin routes need a valid X-Admin-Token.", 403)
+    return None
+
+
+@api.route('/admin/snapshots')
+def get_snapshots():
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        return jsonify({'snapshots': list_snapshots(get_db())})
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+
+@api.route('/admin/snapshots/<name>', methods=['POST', 'DELETE'])
+def change_snapshot(name):
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        if request.method == 'DELETE':
+            drop_snapshot(get_db(), name)
+            return jsonify({'name': name, 'dropped': True})
+        return jsonify(save_snapshot(get_db(), name))
+    except UnknownSnapshot as e:
+        return error(str(e), 404)
+    except SnapshotError as e:
+        return error(str(e))
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+
+@api.route('/admin/snapshots/<name>/restore', methods=['POST'])
+def restore(name):
+    denied = admin_denied()
+    if denied:
+        return denied
+    try:
+        return jsonify(restore_snapshot(get_db(), name))
+    except UnknownSnapshot as e:
+        return error(str(e), 404)
+    except SnapshotError as e:
+        return error(str(e))
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+
+@api.route('/<operation>', methods=['POST'])
+def run_operation(operation):
+    if operation not in VALIDATORS:
+        return error(f"Unknown operation {operation}.", 404)
+
+    params = request.get_json(silent=True) or request.form
+    values, message = VALIDATORS[operation](params)
+    if message:
+        return error(message)
+
+    try:
+        status, message = call_procedure(get_db(), operation, list(values.values()))
+    except mysql.connector.Error as err:
+        return error(f"Database error: {err.msg}", 500)
+
+    changed = status in CHANGED_STATUSES
+    return jsonify({'status': status, 'message': message, 'changed': changed}), 200 if changed else 409
@@ -1,897 +1,516 @@
-import re
 from operator import truediv
 
+import io
+import click
 import mysql
-from flask import Flask, render_template, request, redirect, flash
-from db.db import get_db_connection
+from flask import (Blueprint, Flask, Response, render_template, request, redirect, flash, jsonify, stream_template,
+                   stream_with_context)
+from api import api
+from db.bulk_import import CHUNK_SIZE, KINDS, format_for, import_rows, read_rows
+from db.cache import cache_stats
+from db.dashboard import fetch_dashboard, read_dashboard_params
+from db.config import SERVER_CONFIG
+from db.db import commit, get_db, init_app, pool_stats, pooled_connection, streamed, warm_pool
+from db.engine import compare_with_procedure, fast_forward
+from db.export import EXPORTABLE, FORMATS, Export
+from db.fragments import RenderedPage, buffered
+from db.leaderboard import leaderboard, read_leaderboard_params
+from db import compression, metrics, recording
+from db.procedures import board_flights, call_procedure, crew_flights
+from db.routes import route_index
+from db.snapshots import SnapshotError, drop_snapshot, list_snapshots, restore_snapshot, save_snapshot
+from db.simulation import parse_clock, read_simulation_params, run_simulation
+from db.views import ViewPage, read_page_params
+from db.validation import (validate_airplane, validate_airport, validate_assign_pilot, validate_flight,
+                           validate_flight_batch, validate_offer_flight, validate_person, validate_pilot_license)
 from datetime import datetime
 
-app = Flask(__name__)
-app.secret_key = 'sams_secret'
+# The pages and CLI commands live on a blueprint so that every process can
+# build its own app with create_app(); gunicorn.conf.py serves it with several
+# worker processes.  cli_group=None keeps the commands at `flask simulate`.
+pages = Blueprint('pages', __name__, cli_group=None)
 
-if __name__ == '__main__':
-    app.run(debug=True)
-
-@app.route('/')
+@pages.route('/')
 def home():
     return render_template('home.html')
 
 
-@app.route('/add_airport', methods=['GET', 'POST'])
-def add_airport():
-    if request.method == 'POST':
-        airport_id = request.form['airport_id'].strip()
-        name = request.form['name'].strip()
-        city = request.form['city'].strip()
-        state = request.form['state'].strip()
-        country = request.form['country'].strip()
-        location_id = request.form['location_id'].strip()
-
-        if not airport_id or len(airport_id) != 3:
-            flash("Airport ID must be exactly 3 characters.")
-            return redirect('/add_airport')
-        if not city or not state or not country or not location_id:
-            flash("City, state, country, and location ID are required.")
-            return redirect('/add_airport')
+@pages.route('/pool_stats')
+def pool_status():
+    return jsonify(pool_stats())
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
 
-            cursor.execute("SELECT * FROM airport WHERE airportID = %s", (airport_id,))
-            if cursor.fetchone():
-                flash("Airport ID already exists.")
-                return redirect('/add_airport')
+@pages.route('/cache_stats')
+def cache_status():
+    return jsonify(cache_stats())
 
-            cursor.execute("SELECT * FROM location WHERE locationID = %s", (location_id,))
-            if cursor.fetchone():
-                flash("Location ID is already in use.")
-                return redirect('/add_airport')
 
-            cursor.callproc('add_airport', [airport_id, name, city, state, country, location_id])
-            conn.commit()
-            flash('Airport added successfully!')
+@pages.route('/metrics')
+def metrics_endpoint():
+    pool, cache = pool_stats(), cache_stats()
+    gauges = [
+        ('sams_pool_checked_out', 'Connections currently borrowed from the pool.', pool['checked_out']),
+        ('sams_pool_idle', 'Idle connections in the pool.', pool['idle']),
+        ('sams_pool_timeouts', 'Pool acquires that timed out since start.', pool['timeouts']),
+        ('sams_cache_entries', 'Entries in the view cache.', cache['entries']),
+        ('sams_cache_hits', 'View cache hits since start.', cache['hits']),
+        ('sams_cache_misses', 'View cache misses since start.', cache['misses']),
+        ('sams_fragment_cache_entries', 'Rendered view pages cached.', cache['fragments']['entries']),
+        ('sams_fragment_cache_hits', 'Rendered view page cache hits since start.', cache['fragments']['hits'])
+    ]
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
 
 
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
-
-        return redirect('/add_airport')
+@pages.route('/dashboard')
+def dashboard():
+    start = datetime.now()
+    try:
+        limit = read_dashboard_params(request.args)
+    except ValueError as e:
+        flash(f'Error: {str(e)}')
+        return render_template('dashboard.html', views=None), 400
+    views = fetch_dashboard(limit=limit)
+    elapsed_ms = (datetime.now() - start).total_seconds() * 1000
+    return render_template('dashboard.html', views=views, limit=limit, elapsed_ms=elapsed_ms)
 
-    return render_template('add_airport.html')
 
+@pages.route('/leaderboard')
+def leaderboard_page():
+    person_id = request.args.get('person_id', '').strip()
+    try:
+        offset, limit = read_leaderboard_params(request.args)
+        rows, next_offset, passengers = leaderboard.top(get_db(), offset, limit)
+        person = leaderboard.rank(get_db(), person_id) if person_id else None
+    except ValueError as e:
+        flash(f'Error: {str(e)}')
+        return render_template('leaderboard.html', rows=None), 400
+    except mysql.connector.Error as err:
+        flash(f"Database error: {err.msg}")
+        return render_template('leaderboard.html', rows=None), 500
+    if person_id and person is None:
+        flash(f'{person_id} is not a passenger with miles.')
+    return render_template('leaderboard.html', rows=rows, next_offset=next_offset, limit=limit,
+                           passengers=passengers, person=person)
+
+
+def render_view(view, rendered=True):
+    """Stream one keyset page of a reporting view into its template.
+
+    With rendered, the template gets a RenderedPage and writes its body
+    chunks; otherwise a ViewPage whose rows it loops over itself.
+    """
+    try:
+        after, limit = read_page_params(view, request.args)
+        page = (RenderedPage if rendered else ViewPage)(get_db(), view, after, limit)
+    except ValueError as e:
+        flash(f'Error: {str(e)}')
+        return render_template(f'{view}.html', page=None), 400
+    except Exception as e:
+        flash(f'Error: {str(e)}')
+        return render_template(f'{view}.html', page=None), 500
+    return streamed(buffered(stream_template(f'{view}.html', page=page)))
 
-@app.route('/add_person', methods=['GET', 'POST'])
-def add_person():
-    if request.method == 'POST':
-        person_id = request.form['person_id'].strip()
-        first_name = request.form['first_name'].strip()
-        last_name = request.form['last_name'].strip()
-        location_id = request.form['location_id'].strip()
-        tax_id = request.form['tax_id'].strip()
-        experience = request.form.get('experience')
-        miles = request.form.get('miles')
-        funds = request.form.get('funds')
-
-        experience = int(experience) if experience else None
-        miles = int(miles) if miles else None
-        funds = float(funds) if funds else None
-
-        if not person_id:
-            flash("Person ID is required.")
-            return redirect('/add_person')
-        if not first_name:
-            flash("First name is required.")
-            return redirect('/add_person')
-        if not location_id:
-            flash("Location ID is required.")
-            return redirect('/add_person')
 
-        if tax_id is not None and experience is not None:
-            is_pilot = True
-            is_passenger = False
+def run_procedure(name, args):
+    """Call a procedure and flash the outcome it reports."""
+    try:
+        status, message = call_procedure(get_db(), name, args)
+        flash(message)
+        return status
+    except mysql.connector.Error as err:
+        flash(f"Database error: {err.msg}")
+    except Exception as e:
+        flash(f"An unexpected error occurred: {str(e)}")
 
-        if miles is not None and funds is not None:
-            is_passenger = True
-            is_pilot = False
 
-        if is_pilot and is_passenger:
-            flash("A person cannot be both a pilot and a passenger.")
-            return redirect('/add_person')
+@pages.route('/add_airport', methods=['GET', 'POST'])
+def add_airport():
+    if request.method == 'POST':
+        values, error = validate_airport(request.form)
+        if error:
+            flash(error)
+            return redirect('/add_airport')
 
-        if not is_pilot and not is_passenger:
-            flash("A person must be a pilot or a passenger.")
-            return redirect('/add_person')
+        run_procedure('add_airport', list(values.values()))
+        return redirect('/add_airport')
 
-        if experience is not None and experience < 0:
-            flash("Experience must be non-negative.")
-            return redirect('/add_person')
+    return render_template('add_airport.html')
 
-        if miles is not None and miles < 0:
-            flash("Miles must be non-negative.")
-            return redirect('/add_person')
 
-        if funds is not None and funds < 0:
-            flash("Funds must be non-negative.")
+@pages.route('/add_person', methods=['GET', 'POST'])
+def add_person():
+    if request.method == 'POST':
+        values, error = validate_person(request.form)
+        if error:
+            flash(error)
             return redirect('/add_person')
 
-        if tax_id:
-            tax_id_pattern = r'^\d{3}-\d{2}-\d{4}$'
-            if not re.match(tax_id_pattern, tax_id):
-                flash("Tax ID is in the wrong format.")
-                return redirect('/add_person')
-
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("SELECT * FROM person WHERE personID = %s", (person_id,))
-            if cursor.fetchone():
-                flash("Person ID already exists.")
-                return redirect('/add_person')
-
-            cursor.execute("SELECT * FROM location WHERE locationID = %s", (location_id,))
-            if not cursor.fetchone():
-                flash("Location ID does not exist.")
-                return redirect('/add_person')
-
-            cursor.callproc('add_person', [
-                person_id,
-                first_name,
-                last_name,
-                location_id,
-                tax_id if tax_id else None,
-                experience,
-                miles,
-                funds
-            ])
-            conn.commit()
-            flash('Person added successfully!')
-
-
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
+        run_procedure('add_person', list(values.values()))
         return redirect('/add_person')
 
     return render_template('add_person.html')
 
 
-@app.route('/add_airplane', methods=['GET', 'POST'])
+@pages.route('/add_airplane', methods=['GET', 'POST'])
 def add_airplane():
     if request.method == 'POST':
-        try:
-            airline_id = request.form.get('airline_id', '').strip()
-            tail_num = request.form.get('tail_num', '').strip()
-            seat_cap_raw = request.form.get('seat_cap', '').strip()
-            speed_raw = request.form.get('speed', '').strip()
-            location_id = request.form.get('location_id', '').strip()
-            plane_type_raw = request.form.get('plane_type', '').strip()
-            model_raw = request.form.get('model', '').strip()
-            is_neo = 'is_neo' in request.form
-            maintained = 'maintained' in request.form
-
-            seat_cap = int(seat_cap_raw) if seat_cap_raw else None
-            speed = int(speed_raw) if speed_raw else None
-            plane_type = plane_type_raw if plane_type_raw != '' else None
-            model = model_raw if model_raw != '' else None
-
-            normalized_type = plane_type.lower() if plane_type else None
-            neo_val = is_neo if normalized_type == 'airbus' else None
-            model_val = model if normalized_type == 'boeing' else None
-
-
-            if seat_cap <= 0 or speed <= 0:
-                flash("Seat capacity and speed must be greater than 0.")
-                return redirect('/add_airplane')
-
-            if plane_type is None:
-                if model is not None or is_neo:
-                    flash("Non-specified types must not include model or neo values.")
-                    return redirect('/add_airplane')
-            elif normalized_type == 'boeing':
-                if model_val is None:
-                    flash("Boeing airplanes must have a model.")
-                    return redirect('/add_airplane')
-                if is_neo:
-                    flash("Boeing airplanes must not specify neo.")
-                    return redirect('/add_airplane')
-            elif normalized_type == 'airbus':
-                if not is_neo:
-                    flash("Airbus airplanes must specify neo.")
-                    return redirect('/add_airplane')
-                if model is not None:
-                    flash("Airbus airplanes must not specify model.")
-                    return redirect('/add_airplane')
-            else:
-                if model is not None or is_neo:
-                    flash("Other airplane types must not specify model or neo.")
-                    return redirect('/add_airplane')
-
-            conn = get_db_connection()
-            cursor = conn.cursor()
+        values, error = validate_airplane(request.form)
+        if error:
+            flash(error)
+            return redirect('/add_airplane')
 
-            cursor.execute("SELECT COUNT(*) FROM airline WHERE airlineID = %s", (airline_id,))
-            if cursor.fetchone()[0] == 0:
-                flash("Airline ID does not exist.")
-                return redirect('/add_airplane')
-
-            cursor.execute("SELECT COUNT(*) FROM airplane WHERE airlineID = %s AND tail_num = %s", (airline_id, tail_num))
-            if cursor.fetchone()[0] > 0:
-                flash("This tail number already exists for the given airline.")
-                return redirect('/add_airplane')
-
-            cursor.execute("SELECT COUNT(*) FROM location WHERE locationID = %s", (location_id,))
-            if cursor.fetchone()[0] > 0:
-                flash("Location ID already exists in the database.")
-                return redirect('/add_airplane')
-
-            cursor.callproc('add_airplane', [
-                airline_id,
-                tail_num,
-                seat_cap,
-                speed,
-                location_id,
-                plane_type,
-                maintained,
-                model_val,
-                neo_val
-            ])
-            conn.commit()
-            flash("Airplane added successfully!")
-
-        except ValueError:
-            flash("Seat capacity and speed must be valid integers.")
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-        except Exception as e:
-            flash(f"Unexpected error: {str(e)}")
-        finally:
-            try:
-                cursor.close()
-                conn.close()
-            except:
-                pass
+        run_procedure('add_airplane', list(values.values()))
         return redirect('/add_airplane')
 
     return render_template('add_airplane.html')
 
 
+@pages.route('/bulk_import', methods=['GET', 'POST'])
+def bulk_import():
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in KINDS:
+            flash("Choose airports, airplanes, or people.")
+            return redirect('/bulk_import')
+        if upload is None or not upload.filename:
+            flash("Choose a file to import.")
+            return redirect('/bulk_import')
 
+        try:
+            fmt = format_for(upload.filename)
+            stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+            report = import_rows(get_db(), kind, read_rows(stream, fmt))
+        except ValueError as e:
+            flash(str(e))
+            return redirect('/bulk_import')
+        except mysql.connector.Error as err:
+            flash(f"Database error: {err.msg}")
+            return redirect('/bulk_import')
 
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(report)
+        flash(f"Imported {report['inserted']} of {report['rows']} {kind} row(s).")
+        return render_template('bulk_import.html', report=report)
 
-@app.route('/grant_or_revoke_pilot_license', methods=['GET', 'POST'])
-def grant_or_revoke_pilot_license():
-    if request.method == 'POST':
-        license_type = request.form['license_type'].strip()
-        person_id = request.form['person_id'].strip()
+    return render_template('bulk_import.html')
 
-        if not person_id:
-            flash("Person ID is required.")
-            return redirect('/grant_or_revoke_pilot_license')
-        if not license_type:
-            flash("License type is required.")
-            return redirect('/grant_or_revoke_pilot_license')
 
+@pages.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='File format; guessed from the extension by default.')
+@click.option('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows inserted per transaction.')
+def import_data_command(kind, path, fmt, chunk_size):
+    """Bulk import airports, airplanes, or people from a CSV or JSONL file."""
+    try:
+        fmt = fmt or format_for(path)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='PATH')
+    with open(path, encoding='utf-8-sig', newline='') as stream, pooled_connection() as conn:
+        report = import_rows(conn, kind, read_rows(stream, fmt), chunk_size)
+    for error in report['errors']:
+        click.echo(f"line {error['line']}: {error['error']}")
+    click.echo(f"Imported {report['inserted']} of {report['rows']} {kind} row(s).")
+
+
+@pages.route('/export/<name>.<any(csv, ndjson):fmt>')
+def export(name, fmt):
+    """Stream a whole view or base table as CSV or NDJSON."""
+    if name not in EXPORTABLE:
+        return jsonify({'error': f"Unknown view or table {name}."}), 404
+    try:
+        rows = Export(get_db(), name, fmt)
+    except mysql.connector.Error as err:
+        return jsonify({'error': f"Database error: {err.msg}"}), 500
+    response = Response(streamed(stream_with_context(rows)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
+
+@pages.cli.command('export')
+@click.argument('name', type=click.Choice(EXPORTABLE))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default=None,
+              help='File format; taken from the extension by default.')
+@click.option('--batch-size', type=int, default=None, help='Rows fetched and written at a time.')
+def export_command(name, path, fmt, batch_size):
+    """Export a view or base table to a CSV or NDJSON file ('-' for stdout)."""
+    fmt = fmt or path.rsplit('.', 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise click.BadParameter("Use a .csv or .ndjson file, or give --format.", param_hint='PATH')
+    start = datetime.now()
+    # Binary, so the CSV line endings are written as they are on every platform.
+    with pooled_connection() as conn, click.open_file(path, 'wb') as out:
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
+            rows = Export(conn, name, fmt, batch_size)
+            for text in rows:
+                out.write(text.encode('utf-8'))
+        except mysql.connector.Error as err:
+            raise click.ClickException(f"Database error: {err.msg}")
+    seconds = (datetime.now() - start).total_seconds()
+    click.echo(f"Exported {rows.rows} row(s) of {name} in {seconds:.1f}s.", err=path == '-')
 
-            cursor.execute("SELECT * FROM pilot WHERE personID = %s", (person_id,))
-            if not cursor.fetchone():
-                flash("Person ID does not exist or is not a pilot.")
-                return redirect('/grant_or_revoke_pilot_license')
 
-            cursor.callproc('grant_or_revoke_pilot_license', [person_id, license_type])
-            conn.commit()
-            flash('License granted or revoked successfully!')
+@pages.cli.group('snapshot')
+def snapshot_group():
+    """Save and restore named snapshots of the whole database."""
 
 
+@snapshot_group.command('save')
+@click.argument('name')
+def snapshot_save_command(name):
+    """Save the current data as snapshot NAME, replacing an older one."""
+    with pooled_connection() as conn:
+        try:
+            result = save_snapshot(conn, name)
+        except SnapshotError as e:
+            raise click.BadParameter(str(e), param_hint='NAME')
         except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
+            raise click.ClickException(f"Database error: {err.msg}")
+    click.echo(f"Saved {result['rows']} row(s) of {result['tables']} table(s) as {name} "
+               f"in {result['seconds']:.2f}s.")
 
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
 
-        finally:
-            cursor.close()
-            conn.close()
+@snapshot_group.command('restore')
+@click.argument('name')
+def snapshot_restore_command(name):
+    """Put the data back as it was when snapshot NAME was saved."""
+    with pooled_connection() as conn:
+        try:
+            result = restore_snapshot(conn, name)
+        except SnapshotError as e:
+            raise click.BadParameter(str(e), param_hint='NAME')
+        except mysql.connector.Error as err:
+            raise click.ClickException(f"Database error: {err.msg}")
+    click.echo(f"Restored {result['rows']} row(s) of {result['tables']} table(s) from {name} "
+               f"in {result['seconds']:.2f}s.")
+    if result['skipped']:
+        click.echo(f"Not in the snapshot, left as they are: {', '.join(result['skipped'])}.")
+
+
+@snapshot_group.command('list')
+def snapshot_list_command():
+    """List the saved snapshots."""
+    with pooled_connection() as conn:
+        snapshots = list_snapshots(conn)
+    for snapshot in snapshots:
+        click.echo(f"{snapshot['name']:<32} {snapshot['tables']:>3} tables {snapshot['rows']:>10} rows  "
+                   f"{snapshot['created_at'] or ''}")
+    if not snapshots:
+        click.echo("No snapshots.")
+
+
+@snapshot_group.command('drop')
+@click.argument('name')
+def snapshot_drop_command(name):
+    """Delete snapshot NAME."""
+    with pooled_connection() as conn:
+        try:
+            drop_snapshot(conn, name)
+        except SnapshotError as e:
+            raise click.BadParameter(str(e), param_hint='NAME')
+    click.echo(f"Dropped {name}.")
+
+
+@pages.route('/grant_or_revoke_pilot_license', methods=['GET', 'POST'])
+def grant_or_revoke_pilot_license():
+    if request.method == 'POST':
+        values, error = validate_pilot_license(request.form)
+        if error:
+            flash(error)
+            return redirect('/grant_or_revoke_pilot_license')
 
+        run_procedure('grant_or_revoke_pilot_license', list(values.values()))
         return redirect('/grant_or_revoke_pilot_license')
 
     return render_template('grant_or_revoke_pilot_license.html')
 
 
-@app.route('/offer_flight', methods=['GET', 'POST'])
+@pages.route('/offer_flight', methods=['GET', 'POST'])
 def offer_flight():
     if request.method == 'POST':
-        flight_id = request.form['flight_id'].strip()
-        route_id = request.form['route_id'].strip()
-        support_airline = request.form['support_airline'].strip()
-        support_tail = request.form['support_tail'].strip()
-        progress = request.form['progress'].strip()
-        next_time = request.form['next_time'].strip()
-        cost = request.form['cost'].strip()
-
-        if not flight_id:
-            flash("Flight ID is required.")
-            return redirect('/offer_flight')
-        if not route_id:
-            flash("Route ID is required.")
-            return redirect('/offer_flight')
-        if not progress.isdigit():
-            flash("Progress must be a non-negative integer.")
-            return redirect('/offer_flight')
-        progress = int(progress)
-        if not cost.isdigit():
-            flash("Cost must be a non-negative integer.")
-            return redirect('/offer_flight')
-        cost = int(cost)
-        if not next_time:
-            flash("Next time is required.")
-            return redirect('/offer_flight')
-
-        try:
-            datetime.strptime(next_time, '%H:%M:%S')
-        except ValueError:
-            flash("Next time must be in the correct format.")
+        values, error = validate_offer_flight(request.form)
+        if error:
+            flash(error)
             return redirect('/offer_flight')
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("SELECT * FROM flight WHERE flightID = %s", (flight_id,))
-            if cursor.fetchone():
-                flash("Flight ID already exists.")
-                return redirect('/offer_flight')
-
-            cursor.execute("SELECT * FROM route WHERE routeID = %s", (route_id,))
-            if not cursor.fetchone():
-                flash("Route ID does not exist.")
-                return redirect('/offer_flight')
-
-            cursor.execute("SELECT COUNT(*) AS stop_count FROM route_path WHERE routeID = %s", (route_id,))
-            result = cursor.fetchone()
-            if result:
-                stop_count = result[0]
-                if progress < 0 or progress >= stop_count:
-                    flash("Progress must be between 0 and the number of stops in the route minus one.")
-                    return redirect('/offer_flight')
-            else:
-                flash("Unable to retrieve route path information.")
-                return redirect('/offer_flight')
-
-            if support_airline and support_tail:
-                cursor.execute("""SELECT * FROM airplane WHERE airlineID = %s AND tail_num = %s
-                """, (support_airline, support_tail))
-                if not cursor.fetchone():
-                    flash("Specified airplane does not exist.")
-                    return redirect('/offer_flight')
-
-                cursor.execute("""
-                    SELECT * FROM flight WHERE support_airline = %s AND support_tail = %s""",
-                    (support_airline, support_tail))
-                if cursor.fetchone():
-                    flash("Specified airplane is already assigned to another flight.")
-                    return redirect('/offer_flight')
-            elif support_airline or support_tail:
-                flash("Both support airline and support tail must be provided together.")
-                return redirect('/offer_flight')
-
-            cursor.callproc('offer_flight', [
-                flight_id,
-                route_id,
-                support_airline if support_airline else None,
-                support_tail if support_tail else None,
-                progress,
-                next_time,
-                cost
-            ])
-            conn.commit()
-            flash('Flight offered successfully!')
-
-
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-
-        finally:
-            cursor.close()
-            conn.close()
-
+        run_procedure('offer_flight', list(values.values()))
         return redirect('/offer_flight')
 
     return render_template('offer_flight.html')
 
 
-@app.route('/assign_pilot', methods=['GET', 'POST'])
+@pages.route('/assign_pilot', methods=['GET', 'POST'])
 def assign_pilot():
     if request.method == 'POST':
-        flight_id = request.form.get('flight_id', '').strip()
-        person_id = request.form.get('person_id', '').strip()
-
-        if not flight_id:
-            flash("Flight ID is required.")
-            return redirect('/assign_pilot')
-        if not person_id:
-            flash("Pilot Person ID is required.")
+        values, error = validate_assign_pilot(request.form)
+        if error:
+            flash(error)
             return redirect('/assign_pilot')
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            cursor.execute("""
-                SELECT f.routeID, f.progress, f.support_airline, f.support_tail, a.plane_type, a.locationID AS plane_location
-                FROM flight f
-                LEFT JOIN airplane a ON f.support_airline = a.airlineID AND f.support_tail = a.tail_num
-                WHERE f.flightID = %s AND f.airplane_status = 'on_ground'
-            """, (flight_id,))
-            flight = cursor.fetchone()
-            if not flight:
-                flash("Flight does not exist or is not on the ground.")
-                return redirect('/assign_pilot')
-
-            cursor.execute("""
-                SELECT COUNT(*) AS total_legs
-                FROM route_path
-                WHERE routeID = %s
-            """, (flight['routeID'],))
-            route_info = cursor.fetchone()
-            if flight['progress'] >= route_info['total_legs']:
-                flash("Flight has already completed its route.")
-                return redirect('/assign_pilot')
-
-            cursor.execute("""
-                SELECT p.personID, pe.locationID AS pilot_location
-                FROM pilot p
-                JOIN person pe ON p.personID = pe.personID
-                WHERE p.personID = %s AND p.commanding_flight IS NULL
-            """, (person_id,))
-            pilot = cursor.fetchone()
-            if not pilot:
-                flash("Pilot does not exist or is already assigned to another flight.")
-                return redirect('/assign_pilot')
-
-            plane_type = flight['plane_type']
-            required_license = 'GENERAL' if not plane_type else plane_type.upper()
-
-            cursor.execute("""
-                SELECT 1
-                FROM pilot_licenses
-                WHERE personID = %s AND UPPER(license) = %s
-            """, (person_id, required_license))
-            license_check = cursor.fetchone()
-            if not license_check:
-                flash(f"Pilot does not have the required {required_license} license.")
-                return redirect('/assign_pilot')
-
-
-            cursor.callproc('assign_pilot', [flight_id, person_id])
-            conn.commit()
-            flash('Pilot assigned successfully!')
-
-
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
-
+        run_procedure('assign_pilot', list(values.values()))
         return redirect('/assign_pilot')
 
     return render_template('assign_pilot.html')
 
 
-@app.route('/flight_takeoff', methods=['GET', 'POST'])
+@pages.route('/flight_takeoff', methods=['GET', 'POST'])
 def flight_takeoff():
     if request.method == 'POST':
-        flight_id = request.form['flight_id'].strip()
-
-        if not flight_id:
-            flash("Flight ID is required.")
+        values, error = validate_flight(request.form)
+        if error:
+            flash(error)
             return redirect('/flight_takeoff')
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            cursor.execute("""
-                SELECT f.flightID, f.progress, COUNT(rp.sequence) AS total_legs
-                FROM flight f
-                JOIN route_path rp ON f.routeID = rp.routeID
-                WHERE f.flightID = %s AND f.airplane_status = 'on_ground'
-                GROUP BY f.flightID, f.progress
-            """, (flight_id,))
-            flight = cursor.fetchone()
-
-            if not flight:
-                flash("Flight does not exist or is not on the ground.")
-                return redirect('/flight_takeoff')
-
-            if flight['progress'] >= flight['total_legs']:
-                flash("Flight has already completed its route.")
-                return redirect('/flight_takeoff')
-
-            cursor.execute("""
-                SELECT support_airline, support_tail FROM flight
-                WHERE flightID = %s AND support_airline IS NOT NULL AND support_tail IS NOT NULL
-            """, (flight_id,))
-            airplane = cursor.fetchone()
-
-            if not airplane:
-                flash("Flight does not have an assigned airplane.")
-                return redirect('/flight_takeoff')
-
-            cursor.execute("""
-                SELECT a.plane_type FROM airplane a
-                JOIN flight f ON a.airlineID = f.support_airline AND a.tail_num = f.support_tail
-                WHERE f.flightID = %s
-            """, (flight_id,))
-            plane = cursor.fetchone()
-
-            if not plane:
-                flash("Assigned airplane details not found.")
-                return redirect('/flight_takeoff')
-
-            plane_type = plane['plane_type'].strip().upper()
-
-            cursor.execute("""
-                SELECT COUNT(*) AS pilot_count FROM pilot
-                WHERE commanding_flight = %s
-            """, (flight_id,))
-            pilot_info = cursor.fetchone()
-            pilot_count = pilot_info['pilot_count']
-
-            required_pilots = 2 if plane_type == 'BOEING' else 1
-
-            if pilot_count < required_pilots:
-                flash(f"Not enough pilots assigned. {plane_type} requires {required_pilots} pilot(s). Flight will be delayed by 30 minutes.")
-                cursor.callproc('flight_takeoff', [flight_id])
-                conn.commit()
-                return redirect('/flight_takeoff')
-
-            cursor.callproc('flight_takeoff', [flight_id])
-            conn.commit()
-            flash('Flight took off successfully!')
-
-
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-
-        finally:
-            cursor.close()
-            conn.close()
+        run_procedure('flight_takeoff', list(values.values()))
+        return redirect('/flight_takeoff')
 
     return render_template('flight_takeoff.html')
 
 
-@app.route('/flight_landing', methods=['GET', 'POST'])
+@pages.route('/flight_landing', methods=['GET', 'POST'])
 def flight_landing():
     if request.method == 'POST':
-        flight_id = request.form['flight_id'].strip()
-
-        if not flight_id:
-            flash("Flight ID is required.")
+        values, error = validate_flight(request.form)
+        if error:
+            flash(error)
             return redirect('/flight_landing')
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT * FROM flight 
-                WHERE flightID = %s AND airplane_status = 'in_flight'
-            """, (flight_id,))
-            if not cursor.fetchone():
-                flash("Flight does not exist or is not currently in flight.")
-                return redirect('/flight_landing')
-
-            cursor.callproc('flight_landing', [flight_id])
-            conn.commit()
-            flash('Flight landed successfully!')
-
-
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-
-        finally:
-            cursor.close()
-            conn.close()
-
+        run_procedure('flight_landing', list(values.values()))
         return redirect('/flight_landing')
 
     return render_template('flight_landing.html')
 
 
 
-@app.route('/passengers_board', methods=['GET', 'POST'])
+@pages.route('/passengers_board', methods=['GET', 'POST'])
 def passengers_board():
     if request.method == 'POST':
-        flight_id = request.form.get('flight_id', '').strip()
-        if not flight_id:
-            flash("Flight ID is required.")
+        values, error = validate_flight(request.form)
+        if error:
+            flash(error)
             return redirect('/passengers_board')
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            cursor.execute("""
-                SELECT progress, routeID FROM flight
-                WHERE flightID = %s AND airplane_status = 'on_ground'
-            """, (flight_id,))
-            flight = cursor.fetchone()
-            if not flight:
-                flash("Flight does not exist or is not on the ground.")
-                return redirect('/passengers_board')
-
-            progress = flight['progress']
-            route_id = flight['routeID']
-
-            cursor.execute("""
-                SELECT COUNT(*) AS total_legs FROM route_path
-                WHERE routeID = %s
-            """, (route_id,))
-            total_legs = cursor.fetchone()['total_legs']
-            if progress >= total_legs:
-                flash("Flight has completed all legs.")
-                return redirect('/passengers_board')
-
-            cursor.callproc('passengers_board', [flight_id])
-            conn.commit()
-            flash('Passengers boarded successfully!')
-
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
-
+        run_procedure('passengers_board', list(values.values()))
         return redirect('/passengers_board')
 
     return render_template('passengers_board.html')
 
 
-
-@app.route('/passengers_disembark', methods=['GET', 'POST'])
-def passengers_disembark():
+@pages.route('/passengers_board_batch', methods=['GET', 'POST'])
+def passengers_board_batch():
     if request.method == 'POST':
-        flight_id = request.form['flight_id'].strip()
-
-        if not flight_id:
-            flash("Flight ID is required.")
-            return redirect('/passengers_disembark')
+        values, message = validate_flight_batch(request.form)
+        if message:
+            flash(message)
+            return redirect('/passengers_board_batch')
 
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            cursor.execute("""
-                SELECT airplane_status FROM flight
-                WHERE flightID = %s
-            """, (flight_id,))
-            flight = cursor.fetchone()
+            status, message, flights = board_flights(get_db(), values['airport_id'], values['flight_ids'])
+        except mysql.connector.Error as err:
+            flash(f"Database error: {err.msg}")
+            return redirect('/passengers_board_batch')
+        flash(message)
+        return render_template('passengers_board_batch.html', flights=flights)
 
-            if not flight:
-                flash("Flight ID does not exist.")
-                return redirect('/passengers_disembark')
+    return render_template('passengers_board_batch.html')
 
-            if flight['airplane_status'] != 'on_ground':
-                flash("Flight must be on the ground to disembark passengers.")
-                return redirect('/passengers_disembark')
 
-            cursor.callproc('passengers_disembark', [flight_id])
-            conn.commit()
-            flash('Passengers disembarked successfully!')
+@pages.route('/auto_crew', methods=['GET', 'POST'])
+def auto_crew():
+    if request.method == 'POST':
+        values, message = validate_flight_batch(request.form)
+        if message:
+            flash(message)
+            return redirect('/auto_crew')
 
+        try:
+            status, message, flights = crew_flights(get_db(), values['airport_id'], values['flight_ids'])
         except mysql.connector.Error as err:
             flash(f"Database error: {err.msg}")
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
+            return redirect('/auto_crew')
+        flash(message)
+        return render_template('auto_crew.html', flights=flights)
+
+    return render_template('auto_crew.html')
+
+
+@pages.route('/passengers_disembark', methods=['GET', 'POST'])
+def passengers_disembark():
+    if request.method == 'POST':
+        values, error = validate_flight(request.form)
+        if error:
+            flash(error)
+            return redirect('/passengers_disembark')
 
+        run_procedure('passengers_disembark', list(values.values()))
         return redirect('/passengers_disembark')
 
     return render_template('passengers_disembark.html')
 
 
-@app.route('/recycle_crew', methods=['GET', 'POST'])
+@pages.route('/recycle_crew', methods=['GET', 'POST'])
 def recycle_crew():
     if request.method == 'POST':
-        flight_id = request.form['flight_id'].strip()
-
-        if not flight_id:
-            flash("Flight ID is required.")
+        values, error = validate_flight(request.form)
+        if error:
+            flash(error)
             return redirect('/recycle_crew')
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            cursor.execute("SELECT * FROM flight WHERE flightID = %s", (flight_id,))
-            flight = cursor.fetchone()
-            if not flight:
-                flash("Flight ID does not exist.")
-                return redirect('/recycle_crew')
-
-            if flight['airplane_status'].lower() != 'on_ground':
-                flash("Flight must be on the ground to recycle crew.")
-                return redirect('/recycle_crew')
-
-            cursor.execute("SELECT COUNT(*) AS total_legs FROM route_path WHERE routeID = %s", (flight['routeID'],))
-            total_legs_result = cursor.fetchone()
-            total_legs = total_legs_result['total_legs'] if total_legs_result else 0
-
-            if flight['progress'] < total_legs:
-                flash("Flight has not completed all legs of its route.")
-                return redirect('/recycle_crew')
-
-            cursor.execute("""
-                SELECT l.arrival
-                FROM route_path rp
-                JOIN leg l ON rp.legID = l.legID
-                WHERE rp.routeID = %s AND rp.sequence = %s
-                LIMIT 1
-            """, (flight['routeID'], total_legs))
-            arrival_result = cursor.fetchone()
-            if not arrival_result:
-                flash("Unable to determine arrival airport.")
-                return redirect('/recycle_crew')
-            arrival_airport = arrival_result['arrival']
-
-            cursor.execute("SELECT locationID FROM airport WHERE airportID = %s", (arrival_airport,))
-            location_result = cursor.fetchone()
-            if not location_result:
-                flash("Arrival airport location not found.")
-                return redirect('/recycle_crew')
-            arrival_location = location_result['locationID']
-
-            cursor.execute("""
-                SELECT COUNT(*) AS passenger_count
-                FROM passenger ps
-                JOIN person p ON ps.personID = p.personID
-                WHERE p.locationID = %s
-            """, (arrival_location,))
-            passenger_count_result = cursor.fetchone()
-            passenger_count = passenger_count_result['passenger_count'] if passenger_count_result else 0
-
-            if passenger_count > 0:
-                flash("Passengers are still present at the arrival location.")
-                return redirect('/recycle_crew')
-
-            cursor.execute("""
-                UPDATE person p
-                JOIN pilot pl ON p.personID = pl.personID
-                SET p.locationID = %s
-                WHERE pl.commanding_flight = %s
-            """, (arrival_location, flight_id))
-
-            cursor.execute("""
-                UPDATE pilot
-                SET commanding_flight = NULL
-                WHERE commanding_flight = %s
-            """, (flight_id,))
-
-            conn.commit()
-            flash('Crew recycled successfully.')
-
-        except Exception as e:
-            flash(f"An error occurred: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
-
+        run_procedure('recycle_crew', list(values.values()))
         return redirect('/recycle_crew')
 
     return render_template('recycle_crew.html')
 
 
 
-@app.route('/retire_flight', methods=['GET', 'POST'])
+@pages.route('/retire_flight', methods=['GET', 'POST'])
 def retire_flight():
     if request.method == 'POST':
-        flight_id = request.form['flight_id'].strip()
-
-        if not flight_id:
-            flash("Flight ID is required.")
+        values, error = validate_flight(request.form)
+        if error:
+            flash(error)
             return redirect('/retire_flight')
 
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-
-            cursor.execute("SELECT * FROM flight WHERE flightID = %s", (flight_id,))
-            flight = cursor.fetchone()
-            if not flight:
-                flash("Flight ID does not exist.")
-                return redirect('/retire_flight')
-
-            if flight['airplane_status'] != 'on_ground':
-                flash("Flight must be on the ground to be retired.")
-                return redirect('/retire_flight')
-
-            cursor.execute("SELECT COUNT(*) AS total_legs FROM route_path WHERE routeID = %s", (flight['routeID'],))
-            result = cursor.fetchone()
-            total_legs = result['total_legs'] if result else 0
-
-            if flight['progress'] != 0 and flight['progress'] != total_legs:
-                flash("Flight must be at the start or end of its route to be retired.")
-                return redirect('/retire_flight')
-
-            cursor.execute("""
-                SELECT COUNT(*) AS passenger_count
-                FROM passenger ps
-                JOIN person p ON ps.personID = p.personID
-                WHERE p.locationID = (
-                    SELECT locationID FROM airplane
-                    WHERE airlineID = %s AND tail_num = %s
-                    LIMIT 1
-                )
-            """, (flight['support_airline'], flight['support_tail']))
-            result = cursor.fetchone()
-            if result and result['passenger_count'] > 0:
-                flash("All passengers must have disembarked before retiring the flight.")
-                return redirect('/retire_flight')
-
-            cursor.execute("SELECT COUNT(*) AS pilot_count FROM pilot WHERE commanding_flight = %s", (flight_id,))
-            result = cursor.fetchone()
-            if result and result['pilot_count'] > 0:
-                flash("All pilots must be unassigned before retiring the flight.")
-                return redirect('/retire_flight')
-
-            cursor.callproc('retire_flight', [flight_id])
-            conn.commit()
-            flash("Flight retired successfully!")
-
-        except mysql.connector.Error as err:
-            flash(f"Database error: {err.msg}")
-        except Exception as e:
-            flash(f"An unexpected error occurred: {str(e)}")
-        finally:
-            cursor.close()
-            conn.close()
-
+        run_procedure('retire_flight', list(values.values()))
         return redirect('/retire_flight')
 
     return render_template('retire_flight.html')
 
 
 
-@app.route('/simulation_cycle', methods=['GET', 'POST'])
+@pages.route('/simulation_cycle', methods=['GET', 'POST'])
 def simulation_cycle():
+    if request.method == 'POST' and (request.form.get('steps') or request.form.get('until')):
+        try:
+            max_steps, until, batch_size = read_simulation_params(request.form)
+        except ValueError as e:
+            flash(str(e))
+            return redirect('/simulation_cycle')
+
+        try:
+            if request.form.get('in_memory'):
+                result = fast_forward(get_db(), max_steps, until)
+            else:
+                result = run_simulation(get_db(), max_steps, until, batch_size)
+        except Exception as e:
+            flash(f"An unexpected error occurred: {str(e)}")
+            return redirect('/simulation_cycle')
+
+        if result['error']:
+            flash(f"Database error: {result['error']}")
+        flash(f"Executed {result['executed']} simulation step(s), {result['committed']} committed "
+              f"(stopped: {result['stop_reason'].replace('_', ' ')}).")
+        return render_template('simulation_cycle.html', steps=result['steps'])
+
     if request.method == 'POST':
         try:
-            conn = get_db_connection()
+            conn = get_db()
             cursor = conn.cursor()
             cursor.callproc('simulation_cycle')
-            conn.commit()
+            commit(conn)
             flash('Simulation cycle executed successfully!')
 
         except mysql.connector.Error as err:
@@ -901,160 +520,130 @@ def simulation_cycle():
             flash(f"An unexpected error occurred: {str(e)}")
         finally:
             cursor.close()
-            conn.close()
 
         return redirect('/simulation_cycle')
 
     return render_template('simulation_cycle.html')
 
 
-@app.route('/flights_in_the_air')
-def flights_in_the_air():
+@pages.route('/simulation_cycle/run', methods=['POST'])
+def simulation_run():
+    params = request.get_json(silent=True) or request.form
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM flights_in_the_air')
-
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-
-        return render_template('flights_in_the_air.html', rows=results, columns=columns)
-
-    except Exception as e:
-        flash(f'Error: {str(e)}')
-        return render_template('flights_in_the_air.html', rows=[], columns=[])
-
-    finally:
-        cursor.close()
-        conn.close()
+        max_steps, until, batch_size = read_simulation_params(params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if max_steps is None and until is None:
+        max_steps = 1
+
+    if params.get('engine') == 'memory':
+        result = fast_forward(get_db(), max_steps, until)
+    else:
+        result = run_simulation(get_db(), max_steps, until, batch_size)
+    return jsonify(result), 500 if result['error'] else 200
+
+
+@pages.cli.command('simulate')
+@click.option('--steps', type=int, default=None, help='Maximum number of simulation steps.')
+@click.option('--until', default=None, help='Stop once the next flight is later than HH:MM:SS.')
+@click.option('--check', is_flag=True, help='Compare against simulation_cycle() without saving anything.')
+def simulate_command(steps, until, check):
+    """Fast-forward the simulation with the in-memory engine."""
+    until = parse_clock(until) if until else None
+    with pooled_connection() as conn:
+        if check:
+            differences = compare_with_procedure(conn, steps, until)
+            for table, key, engine_value, procedure_value in differences:
+                click.echo(f"{table} {key}: engine={engine_value} procedure={procedure_value}")
+            click.echo("Engine matches simulation_cycle()." if not differences
+                       else f"{len(differences)} difference(s) found.")
+            return
+
+        result = fast_forward(conn, steps, until)
+    if result['error']:
+        raise click.ClickException(f"Database error: {result['error']}")
+    click.echo(f"Executed {result['executed']} step(s) (stopped: {result['stop_reason'].replace('_', ' ')}).")
+    for table, count in result['written'].items():
+        click.echo(f"  {table}: {count} row(s) written")
+
+
+@pages.route('/flights_in_the_air')
+def flights_in_the_air():
+    return render_view('flights_in_the_air')
 
 
-@app.route('/flights_on_the_ground')
+@pages.route('/flights_on_the_ground')
 def flights_on_the_ground():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM flights_on_the_ground')
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-
-        return render_template('flights_on_the_ground.html', rows=rows, columns=columns)
-
-    except Exception as e:
-        flash(f'Error: {str(e)}')
-        return render_template('flights_on_the_ground.html', rows=[], columns=[])
-
-    finally:
-        cursor.close()
-        conn.close()
+    return render_view('flights_on_the_ground')
 
 
-
-@app.route('/people_in_the_air')
+@pages.route('/people_in_the_air')
 def people_in_the_air():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM people_in_the_air')
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-
-        return render_template('people_in_the_air.html', rows=rows, columns=columns)
-
-    except Exception as e:
-        flash(f'Error: {str(e)}')
-        return render_template('people_in_the_air.html', rows=[], columns=[])
-
-    finally:
-        cursor.close()
-        conn.close()
+    return render_view('people_in_the_air')
 
 
-
-@app.route('/people_on_the_ground')
+@pages.route('/people_on_the_ground')
 def people_on_the_ground():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM people_on_the_ground')
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-
-        return render_template('people_on_the_ground.html', rows=rows, columns=columns)
-
-    except Exception as e:
-        flash(f'Error: {str(e)}')
-        return render_template('people_on_the_ground.html', rows=[], columns=[])
-
-    finally:
-        cursor.close()
-        conn.close()
+    return render_view('people_on_the_ground')
 
 
-
-@app.route('/route_summary')
+@pages.route('/route_summary')
 def route_summary():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM route_summary')
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-
-        return render_template('route_summary.html', rows=rows, columns=columns)
-
-    except Exception as e:
-        flash(f'Error: {str(e)}')
-        return render_template('route_summary.html', rows=[], columns=[])
-
-    finally:
-        cursor.close()
-        conn.close()
+    return render_view('route_summary')
 
 
-
-@app.route('/alternative_airports')
+@pages.route('/alternative_airports')
 def alternative_airports():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('SELECT * FROM alternative_airports')
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-
-        return render_template('alternative_airports.html', rows=rows, columns=columns)
+    return render_view('alternative_airports')
 
-    except Exception as e:
-        flash(f'Error: {str(e)}')
-        return render_template('alternative_airports.html', rows=[], columns=[])
 
-    finally:
-        cursor.close()
-        conn.close()
+@pages.route('/top_frequent_fliers')
+def top_frequent_fliers():
+    return render_view('top_frequent_fliers', rendered=False)
 
 
+def warm_up(app):
+    """Compile every template, load the route index and leaderboard, and open the pool.
 
-@app.route('/top_frequent_fliers')
-def top_frequent_fliers():
+    Runs in the process that will serve requests, so the first request does
+    not pay for it.  A database that is not reachable yet is logged and left
+    for the first request to report.
+    """
+    start = datetime.now()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM top_frequent_fliers')
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
+        with pooled_connection() as conn:
+            route_index.routes(conn)
+            leaderboard.sync(conn)
+        warm_pool()
+    except mysql.connector.Error as err:
+        app.logger.warning("Warm start skipped the database: %s", err.msg)
+    app.logger.info("Warm start took %.0f ms.", (datetime.now() - start).total_seconds() * 1000)
+
+
+def create_app(config=None):
+    """Build the app; config entries override the defaults in app.config.
+
+    gunicorn.conf.py calls this once per worker process, after the fork, so
+    every worker opens its own connection pool.
+    """
+    app = Flask(__name__)
+    app.secret_key = 'sams_secret'
+    app.config['WARM_START'] = SERVER_CONFIG['warm_start']
+    if config:
+        app.config.update(config)
+    init_app(app)
+    metrics.init_app(app)
+    compression.init_app(app)
+    recording.init_app(app)
+    app.register_blueprint(api)
+    app.register_blueprint(pages)
+    if app.config['WARM_START']:
+        warm_up(app)
+    return app
 
-        return render_template('top_frequent_fliers.html', rows=rows, columns=columns)
 
-    except Exception as e:
-        flash(f'Error: {str(e)}')
-        return render_template('top_frequent_fliers.html', rows=[], columns=[])
-
-    finally:
-        cursor.close()
-        conn.close()
+if __name__ == '__main__':
+    create_app().run(debug=True)
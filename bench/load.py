@@ -0,0 +1,345 @@
+"""Drive the Flask routes and stored procedures under concurrent load.
+
+    python -m bench.load --concurrency 8 --requests 200 --save bench/baseline.json
+    python -m bench.load --concurrency 8 --requests 200 --compare bench/baseline.json
+
+Route cases go through the app in-process (Flask test client, one app for
+every case), or against a running server with --url.  Form cases post to the
+operation pages (/flight_takeoff, /assign_pilot, /offer_flight, ...) with
+flights, pilots and airplanes picked from the current data; they commit, as
+the site does, so use --restore or --skip-writes to keep the data the same.
+Procedure cases call the procedure on a pooled connection with a flight picked
+from the current data and roll the change back.  Run bench.scenario first for
+realistic sizes; the leaderboard rank case looks up one of its passengers.
+With --restore NAME the snapshot saved by `flask snapshot save NAME` is
+restored before every case, so each case starts from the same data and caches
+even when the routes under test change it.
+
+For every case the throughput and p50/p95/p99 latency are printed.  --save
+stores them as a baseline; --compare reports the change against a baseline
+and exits with status 1 when a case is slower than --tolerance allows.
+"""
+import argparse
+import itertools
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from bench.scenario import PREFIX
+from db.config import SNAPSHOT_CONFIG
+from db.db import pooled_connection
+from db.snapshots import restore_snapshot
+
+ROUTE_CASES = [
+    '/',
+    '/flights_in_the_air',
+    '/flights_on_the_ground',
+    '/people_in_the_air',
+    '/people_on_the_ground',
+    '/route_summary',
+    '/alternative_airports',
+    '/top_frequent_fliers',
+    '/leaderboard?limit=50&offset=1000',
+    '/api/v1/views/people_on_the_ground?fields=departing_from,total_people',
+    '/api/v1/views/flights_in_the_air?limit=50'
+]
+
+# The passenger whose rank is looked up: the last one bench.scenario generated,
+# or any passenger with miles when it has not been run.
+GENERATED_PASSENGER = "SELECT MAX(personID) FROM passenger WHERE personID LIKE %s"
+ANY_PASSENGER = "SELECT MIN(personID) FROM passenger WHERE miles IS NOT NULL"
+
+# Procedure -> query returning the flight IDs it is called with.
+ON_GROUND = "SELECT flightID AS flight_id FROM flight WHERE airplane_status = 'on_ground'"
+IN_FLIGHT = "SELECT flightID AS flight_id FROM flight WHERE airplane_status = 'in_flight'"
+PROCEDURE_CASES = {
+    'simulation_cycle': None,
+    'flight_takeoff': ON_GROUND,
+    'flight_landing': IN_FLIGHT,
+    'passengers_board': ON_GROUND,
+    'passengers_disembark': ON_GROUND,
+    'recycle_crew': ON_GROUND,
+    'retire_flight': ON_GROUND
+}
+
+# Operation page -> (queries whose columns are form fields, fixed fields).
+# Every request posts one random row of each query; a callable field is
+# called per request.
+FREE_PILOTS = "SELECT personID AS person_id FROM pilot WHERE commanding_flight IS NULL"
+FREE_AIRPLANES = """
+    SELECT a.airlineID AS support_airline, a.tail_num AS support_tail FROM airplane a
+    LEFT JOIN flight f ON f.support_airline = a.airlineID AND f.support_tail = a.tail_num
+    WHERE f.flightID IS NULL
+"""
+_offered = itertools.count()
+_run = time.strftime('%H%M%S')
+WRITE_CASES = {
+    '/flight_takeoff': ([ON_GROUND], {}),
+    '/flight_landing': ([IN_FLIGHT], {}),
+    '/passengers_board': ([ON_GROUND], {}),
+    '/passengers_disembark': ([ON_GROUND], {}),
+    '/recycle_crew': ([ON_GROUND], {}),
+    '/assign_pilot': ([ON_GROUND, FREE_PILOTS], {}),
+    '/offer_flight': (["SELECT routeID AS route_id FROM route", FREE_AIRPLANES], {
+        'flight_id': lambda: f"bench_{_run}_{next(_offered)}",
+        'progress': '0',
+        'next_time': '08:00:00',
+        'cost': '100'
+    })
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_case(call, requests, concurrency):
+    """Run call() requests times on concurrency threads; return the measurements."""
+    timings = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(_):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = call()
+        except Exception:
+            ok = False
+        elapsed = 1000 * (time.perf_counter() - start)
+        with lock:
+            timings.append(elapsed)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(requests)))
+    wall = time.perf_counter() - start
+
+    timings.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': requests / wall if wall else 0.0,
+        'mean_ms': statistics.fmean(timings),
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99)
+    }
+
+
+def _rows(query, params=None, dictionary=False):
+    with pooled_connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def leaderboard_path():
+    person_id = _rows(GENERATED_PASSENGER, (PREFIX.replace('_', '\\_') + '%',))[0][0]
+    if not person_id:
+        person_id = _rows(ANY_PASSENGER)[0][0]
+    return f'/api/v1/leaderboard/{person_id}' if person_id else None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def route_call(app, url, path, form=None):
+    """A call for GET path, or for POST path with the fields form() returns.
+
+    Operation pages answer a post with a redirect, which is not followed.
+    """
+    if url:
+        opener = urllib.request.build_opener(NoRedirect)
+
+        def call():
+            data = urllib.parse.urlencode(form()).encode('utf-8') if form else None
+            try:
+                response = opener.open(url.rstrip('/') + path, data)
+            except urllib.error.HTTPError as e:
+                response = e
+            with response:
+                response.read()
+                return response.status < 400
+        return call
+
+    local = threading.local()
+
+    def call():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client(use_cookies=False)
+        if form:
+            response = local.client.post(path, data=form())
+        else:
+            response = local.client.get(path)
+        response.get_data()
+        return response.status_code < 400
+    return call
+
+
+def form_fields(queries, fixed, rng):
+    """A function returning random form fields for a write case, or None if a query has no rows."""
+    choices = [_rows(query, dictionary=True) for query in queries]
+    if not all(choices):
+        return None
+
+    def form():
+        fields = {name: value() if callable(value) else value for name, value in fixed.items()}
+        for rows in choices:
+            fields.update(rng.choice(rows))
+        return fields
+    return form
+
+
+def procedure_call(name, query, rng):
+    flight_ids = [None]
+    if query:
+        flight_ids = [row[0] for row in _rows(query)]
+        if not flight_ids:
+            return None
+
+    def call():
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if query:
+                    cursor.execute(f"CALL {name}(%s)", (rng.choice(flight_ids),))
+                else:
+                    cursor.execute(f"CALL {name}()")
+                return True
+            except mysql.connector.Error:
+                return False
+            finally:
+                conn.rollback()
+                cursor.close()
+    return call
+
+
+def restore(name, url):
+    """Restore a snapshot; through the admin route when testing a running server,
+    so that the server resets its caches too."""
+    if not url:
+        with pooled_connection() as conn:
+            return restore_snapshot(conn, name)
+    if not SNAPSHOT_CONFIG['admin_token']:
+        sys.exit("--restore with --url needs SNAPSHOT_CONFIG['admin_token'] set for the server and here.")
+    request = urllib.request.Request(f"{url.rstrip('/')}/api/v1/admin/snapshots/{name}/restore", method='POST')
+    request.add_header('X-Admin-Token', SNAPSHOT_CONFIG['admin_token'])
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def report(results, baseline, tolerance):
+    header = f"{'case':<72}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+    if baseline:
+        header += f"{'p95 vs base':>13}"
+    print(header)
+
+    regressions = []
+    for name, result in results.items():
+        line = (f"{name:<72}{result['throughput']:>9.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                f"{result['p99_ms']:>9.1f}{result['errors']:>8}")
+        base = baseline.get(name) if baseline else None
+        if base:
+            change = (result['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+            line += f"{change:>+12.0%}"
+            if change > tolerance:
+                regressions.append(name)
+                line += ' !'
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100, help='Requests per case.')
+    parser.add_argument('--url', default=None, help='Base URL of a running server; in-process if omitted.')
+    parser.add_argument('--only', default=None, help='Run only cases whose name contains this text.')
+    parser.add_argument('--skip-writes', action='store_true', help='Leave out the form cases, which commit.')
+    parser.add_argument('--skip-procedures', action='store_true')
+    parser.add_argument('--seed', type=int, default=4400)
+    parser.add_argument('--save', default=None, help='Write the results to this baseline file.')
+    parser.add_argument('--compare', default=None, help='Compare against this baseline file.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown (0.2 = 20%%).')
+    parser.add_argument('--restore', default=None, help='Restore this snapshot before every case.')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = None
+    if not args.url:
+        from app import create_app
+        app = create_app()
+
+    paths = list(ROUTE_CASES)
+    rank = leaderboard_path()
+    if rank:
+        paths.insert(paths.index('/leaderboard?limit=50&offset=1000') + 1, rank)
+    cases = {f'GET {path}': route_call(app, args.url, path) for path in paths}
+    if not args.skip_writes:
+        for path, (queries, fixed) in WRITE_CASES.items():
+            form = form_fields(queries, fixed, rng)
+            if form is None:
+                print(f"Skipping POST {path}: nothing to post it with.")
+                continue
+            cases[f'POST {path}'] = route_call(app, args.url, path, form)
+    if not args.skip_procedures:
+        for name, query in PROCEDURE_CASES.items():
+            call = procedure_call(name, query, rng)
+            if call is None:
+                print(f"Skipping {name}: no flight to call it with.")
+                continue
+            cases[f'CALL {name}'] = call
+
+    results = {}
+    for name, call in cases.items():
+        if args.only and args.only not in name:
+            continue
+        if args.restore:
+            restored = restore(args.restore, args.url)
+            print(f"Restored {args.restore} in {restored['seconds']:.2f}s.")
+        results[name] = run_case(call, args.requests, args.concurrency)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    regressions = report(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'concurrency': args.concurrency,
+                'requests': args.requests,
+                'target': args.url or 'in-process',
+                'results': results
+            }, f, indent=2)
+        print(f"\nBaseline written to {args.save}.")
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}.")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
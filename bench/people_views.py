@@ -0,0 +1,158 @@
+"""Compare the people views and the simulation_cycle() flight picker before and
+after migrations/001_hot_path_indexes.sql on a scaled copy of the data.
+
+    python -m bench.people_views --people 200000 --flights 20000
+
+Extra people and flights are inserted inside a transaction that is rolled back
+at the end, so the database is left as it was.  For every query the plan
+(EXPLAIN FORMAT=TREE) and the median run time are printed.  "Before" runs the
+original query text with the new flight indexes ignored; "after" runs the
+current views and picker.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import mysql.connector
+
+from db.config import DB_CONFIG
+
+CASES = [
+    (
+        'people_on_the_ground',
+        """SELECT a.airportID AS departing_from, a.locationID, a.airport_name, a.city, a.state, a.country,
+                  SUM(CASE WHEN p.personID IN (SELECT personID FROM pilot) THEN 1 ELSE 0 END) AS num_pilots,
+                  SUM(CASE WHEN p.personID IN (SELECT personID FROM passenger) THEN 1 ELSE 0 END) AS num_passengers,
+                  COUNT(*) AS total_people,
+                  GROUP_CONCAT(p.personID ORDER BY p.personID) AS person_list
+           FROM airport a
+           JOIN person p ON p.locationID = a.locationID
+           WHERE a.airportID IS NOT NULL AND a.locationID IS NOT NULL AND a.airport_name IS NOT NULL
+             AND a.city IS NOT NULL AND a.state IS NOT NULL AND a.country IS NOT NULL
+           GROUP BY a.airportID, a.locationID, a.airport_name, a.city, a.state, a.country""",
+        "SELECT * FROM people_on_the_ground"
+    ),
+    (
+        'people_in_the_air',
+        """SELECT TRIM(l.departure) AS departing_from, TRIM(l.arrival) AS arriving_at,
+                  COUNT(DISTINCT a.locationID) AS num_airplanes,
+                  GROUP_CONCAT(DISTINCT a.locationID ORDER BY a.locationID) AS airplane_list,
+                  GROUP_CONCAT(DISTINCT f.flightID ORDER BY f.flightID) AS flight_list,
+                  MIN(f.next_time) AS earliest_arrival, MAX(f.next_time) AS latest_arrival,
+                  SUM(CASE WHEN p.personID IN (SELECT personID FROM pilot) THEN 1 ELSE 0 END) AS num_pilots,
+                  SUM(CASE WHEN p.personID IN (SELECT personID FROM passenger) THEN 1 ELSE 0 END) AS num_passengers,
+                  COUNT(DISTINCT p.personID) AS joint_pilots_passengers,
+                  GROUP_CONCAT(DISTINCT p.personID ORDER BY p.personID) AS person_list
+           FROM flight f IGNORE INDEX (flight_status, flight_next_time)
+           JOIN airplane a ON f.support_airline = a.airlineID AND f.support_tail = a.tail_num
+           JOIN route_path rp ON f.routeID = rp.routeID AND rp.sequence = f.progress
+           JOIN leg l ON rp.legID = l.legID
+           JOIN person p ON p.locationID = a.locationID
+           WHERE f.airplane_status = 'in_flight' AND l.departure IS NOT NULL
+             AND l.arrival IS NOT NULL AND a.locationID IS NOT NULL
+           GROUP BY TRIM(l.departure), TRIM(l.arrival)""",
+        "SELECT * FROM people_in_the_air"
+    ),
+    (
+        'simulation_cycle pick',
+        """SELECT flightID FROM flight IGNORE INDEX (flight_status, flight_next_time)
+           ORDER BY next_time ASC, CASE WHEN airplane_status = 'in_flight' THEN 0 ELSE 1 END, flightID ASC
+           LIMIT 1""",
+        """SELECT flightID FROM flight
+           WHERE next_time <=> (SELECT next_time FROM flight ORDER BY next_time ASC LIMIT 1)
+           ORDER BY CASE WHEN airplane_status = 'in_flight' THEN 0 ELSE 1 END, flightID ASC
+           LIMIT 1"""
+    )
+]
+
+CHUNK = 1000
+
+
+def insert_rows(cursor, sql, rows):
+    for start in range(0, len(rows), CHUNK):
+        cursor.executemany(sql, rows[start:start + CHUNK])
+
+
+def scale(cursor, people, flights, seed):
+    rng = random.Random(seed)
+    cursor.execute("SELECT locationID FROM airport WHERE locationID IS NOT NULL")
+    ports = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT locationID FROM airplane WHERE locationID IS NOT NULL")
+    planes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT routeID, COUNT(*) FROM route_path GROUP BY routeID")
+    routes = cursor.fetchall()
+
+    person_rows, pilot_rows, passenger_rows = [], [], []
+    for i in range(people):
+        person_id = f'bench_p{i}'
+        person_rows.append((person_id, 'Bench', None, rng.choice(ports if rng.random() < 0.7 else planes)))
+        if i % 5 == 0:
+            pilot_rows.append((person_id, f'bench-{i}', rng.randint(0, 40)))
+        else:
+            passenger_rows.append((person_id, rng.randint(0, 5000), rng.randint(0, 1000)))
+    insert_rows(cursor, "INSERT INTO person (personID, first_name, last_name, locationID) VALUES (%s, %s, %s, %s)",
+                person_rows)
+    insert_rows(cursor, "INSERT INTO pilot (personID, taxID, experience) VALUES (%s, %s, %s)", pilot_rows)
+    insert_rows(cursor, "INSERT INTO passenger (personID, miles, funds) VALUES (%s, %s, %s)", passenger_rows)
+
+    flight_rows = []
+    for i in range(flights):
+        route_id, legs = rng.choice(routes)
+        flight_rows.append((f'bench_f{i}', route_id, rng.randint(0, legs - 1),
+                            rng.choice(['in_flight', 'on_ground']),
+                            f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00', rng.randint(50, 500)))
+    insert_rows(cursor, """INSERT INTO flight (flightID, routeID, progress, airplane_status, next_time, cost)
+                           VALUES (%s, %s, %s, %s, %s, %s)""", flight_rows)
+
+
+def measure(cursor, sql, repeat):
+    cursor.execute("EXPLAIN FORMAT=TREE " + sql)
+    plan = cursor.fetchone()[0]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql)
+        cursor.fetchall()
+        timings.append(1000 * (time.perf_counter() - start))
+    return plan, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--people', type=int, default=100000)
+    parser.add_argument('--flights', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=4400)
+    args = parser.parse_args()
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SHOW INDEX FROM flight WHERE Key_name IN ('flight_status', 'flight_next_time')")
+        if len({row[2] for row in cursor.fetchall()}) < 2:
+            raise SystemExit("Run migrations/001_hot_path_indexes.sql first.")
+
+        start = time.perf_counter()
+        scale(cursor, args.people, args.flights, args.seed)
+        print(f"Inserted {args.people} people and {args.flights} flights "
+              f"in {time.perf_counter() - start:.1f}s (rolled back at the end).\n")
+
+        results = []
+        for name, before_sql, after_sql in CASES:
+            before_plan, before_ms = measure(cursor, before_sql, args.repeat)
+            after_plan, after_ms = measure(cursor, after_sql, args.repeat)
+            results.append((name, before_ms, after_ms))
+            print(f"== {name}\n-- before\n{before_plan}\n-- after\n{after_plan}\n")
+
+        print(f"{'query':<24}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+        for name, before_ms, after_ms in results:
+            print(f"{name:<24}{before_ms:>12.1f}{after_ms:>12.1f}{before_ms / after_ms:>9.1f}x")
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""Replay recorded traffic and report how it differs from the recording.
+
+    python -m bench.replay traffic.jsonl --restore baseline --speed 1 --concurrency 8
+    python -m bench.replay traffic.jsonl --restore baseline --speed 0 --url http://127.0.0.1:8000
+
+The log is written by db.recording (RECORDING_CONFIG['path'] or
+create_app({'RECORD_PATH': ...})).  Requests are sent in the order they were
+recorded, each at its recorded offset from the first divided by --speed: 1 is
+real time, 4 four times faster, 0 as fast as the --concurrency threads allow.
+Restore the snapshot the recording started from (--restore), so operations
+meet the same data and report the same outcomes.
+
+For every route the recorded and replayed p50/p95 latency are printed (the
+recording is timed inside the server, the replay by the client), with
+the number of requests whose outcome (status, flashed messages or JSON status)
+differs; the first --show differences are listed.  Requests that uploaded
+files cannot be replayed and are counted as skipped.  Against --url, messages
+are read from the session cookie, so a message flashed by a page that renders
+it in the same response is not seen.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from flask import message_flashed
+from itsdangerous import BadSignature
+
+from bench.load import NoRedirect, percentile, restore
+
+
+def read_log(path, limit=None):
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+                if limit and len(entries) == limit:
+                    break
+    entries.sort(key=lambda entry: entry['at'])
+    return entries
+
+
+def _target(entry):
+    return entry['path'] + ('?' + entry['query'] if entry.get('query') else '')
+
+
+def _result(data):
+    try:
+        data = json.loads(data)
+    except ValueError:
+        return None
+    return data.get('status', data.get('error')) if isinstance(data, dict) else None
+
+
+def local_sender(app):
+    """Send requests to the app in-process; flashes are caught with the message_flashed signal."""
+    local = threading.local()
+
+    def flashed(sender, message, category, **extra):
+        local.flashed.append(message)
+    message_flashed.connect(flashed, app, weak=False)
+
+    def send(entry):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client(use_cookies=False)
+        local.flashed = []
+        kwargs = {'json': entry['json']} if 'json' in entry else {'data': entry.get('form')}
+        response = local.client.open(_target(entry), method=entry['method'], **kwargs)
+        data = response.get_data()
+        return {
+            'status': response.status_code,
+            'flashed': local.flashed,
+            'result': _result(data) if response.is_json else None
+        }
+    return send
+
+
+def url_sender(app, url):
+    """Send requests to a running server; flashes are read from the session cookie."""
+    opener = urllib.request.build_opener(NoRedirect)
+    serializer = app.session_interface.get_signing_serializer(app)
+
+    def send(entry):
+        body = None
+        headers = {}
+        if 'json' in entry:
+            body = json.dumps(entry['json']).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif entry.get('form'):
+            body = urllib.parse.urlencode(entry['form'], doseq=True).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = urllib.request.Request(url.rstrip('/') + _target(entry), body, headers, method=entry['method'])
+        try:
+            response = opener.open(request)
+        except urllib.error.HTTPError as e:
+            response = e
+        with response:
+            data = response.read()
+            cookies = SimpleCookie()
+            for header in response.headers.get_all('Set-Cookie') or ():
+                cookies.load(header)
+            morsel = cookies.get(app.config['SESSION_COOKIE_NAME'])
+            try:
+                flashes = serializer.loads(morsel.value).get('_flashes', []) if morsel and morsel.value else []
+            except BadSignature:
+                flashes = []
+            return {
+                'status': response.status,
+                'flashed': [message for _, message in flashes],
+                'result': _result(data) if response.headers.get_content_type() == 'application/json' else None
+            }
+    return send
+
+
+def replay(entries, send, speed, concurrency):
+    """Send every entry at its recorded offset / speed; return (entry, outcome, latency_ms) triples."""
+    results = []
+    lock = threading.Lock()
+    pending = iter(enumerate(entries))
+    first = entries[0]['at']
+    start = time.perf_counter()
+
+    def worker():
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                return
+            index, entry = item
+            if speed:
+                delay = start + (entry['at'] - first) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            try:
+                outcome = send(entry)
+            except Exception as e:
+                outcome = {'status': None, 'flashed': [], 'result': None, 'exception': repr(e)}
+            elapsed = 1000 * (time.perf_counter() - sent)
+            with lock:
+                results.append((index, entry, outcome, elapsed))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    results.sort(key=lambda result: result[0])
+    return [result[1:] for result in results], time.perf_counter() - start
+
+
+def differences(entry, outcome):
+    """The parts of the replayed outcome that differ from the recording."""
+    diff = {}
+    if outcome.get('exception'):
+        diff['exception'] = outcome['exception']
+    if outcome['status'] != entry['status']:
+        diff['status'] = (entry['status'], outcome['status'])
+    if outcome['flashed'] != entry.get('flashed', []):
+        diff['flashed'] = (entry.get('flashed', []), outcome['flashed'])
+    if outcome['result'] != entry.get('result'):
+        diff['result'] = (entry.get('result'), outcome['result'])
+    return diff
+
+
+def report(results, skipped, wall, recorded_wall, show):
+    by_route = defaultdict(lambda: ([], [], []))
+    diffs = []
+    for entry, outcome, elapsed in results:
+        key = f"{entry['method']} {entry.get('route') or entry['path']}"
+        recorded, replayed, differing = by_route[key]
+        recorded.append(entry['latency_ms'])
+        replayed.append(elapsed)
+        diff = differences(entry, outcome)
+        if diff:
+            differing.append(diff)
+            diffs.append((entry, diff))
+
+    print(f"{'route':<52}{'count':>7}{'rec p50':>9}{'rec p95':>9}{'p50':>9}{'p95':>9}{'p95 change':>12}{'diff':>6}")
+    for key, (recorded, replayed, differing) in sorted(by_route.items()):
+        recorded.sort()
+        replayed.sort()
+        before, after = percentile(recorded, 95), percentile(replayed, 95)
+        change = (after - before) / before if before else 0.0
+        print(f"{key:<52}{len(recorded):>7}{percentile(recorded, 50):>9.1f}{before:>9.1f}"
+              f"{percentile(replayed, 50):>9.1f}{after:>9.1f}{change:>+12.0%}{len(differing):>6}")
+
+    print(f"\nReplayed {len(results)} request(s) in {wall:.1f}s (recorded over {recorded_wall:.1f}s); "
+          f"{len(diffs)} with a different outcome, {skipped} skipped.")
+    for entry, diff in diffs[:show]:
+        print(f"  {entry['method']} {_target(entry)}: " +
+              '; '.join(f"{name} {value[0]!r} -> {value[1]!r}" if isinstance(value, tuple) else f"{name} {value}"
+                        for name, value in diff.items()))
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('log', help='JSONL file written by db.recording.')
+    parser.add_argument('--speed', type=float, default=1.0, help='1 = as recorded, N = N times faster, 0 = no waits.')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--url', default=None, help='Base URL of a running server; in-process if omitted.')
+    parser.add_argument('--restore', default=None, help='Restore this snapshot before replaying.')
+    parser.add_argument('--limit', type=int, default=None, help='Replay only the first N recorded requests.')
+    parser.add_argument('--show', type=int, default=10, help='Differences to list.')
+    parser.add_argument('--strict', action='store_true', help='Exit with status 1 if any outcome differs.')
+    args = parser.parse_args()
+
+    entries = read_log(args.log, args.limit)
+    replayable = [entry for entry in entries if not entry.get('files')]
+    if not replayable:
+        print("Nothing to replay.")
+        return
+
+    from app import create_app
+    app = create_app({'WARM_START': False, 'RECORD_PATH': None})
+    send = url_sender(app, args.url) if args.url else local_sender(app)
+
+    if args.restore:
+        restored = restore(args.restore, args.url)
+        print(f"Restored {args.restore} in {restored['seconds']:.2f}s.")
+
+    results, wall = replay(replayable, send, args.speed, args.concurrency)
+    recorded_wall = replayable[-1]['at'] - replayable[0]['at']
+    diffs = report(results, len(entries) - len(replayable), wall, recorded_wall, args.show)
+    if diffs and args.strict:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
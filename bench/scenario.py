@@ -0,0 +1,301 @@
+"""Generate a consistent, scaled dataset on top of the seed data.
+
+    python -m bench.scenario --flights 10000 --passengers 1000000
+    python -m bench.scenario --clear
+
+Everything generated has a gen_ prefix (locations, legs, routes, airlines,
+airplanes, flights, people), so --clear removes exactly what an earlier run
+added.  The data follows the same rules the procedures enforce: every flight
+has its own airplane and is at a valid point of its route, flights on their
+route have a licensed crew of the right size aboard, passengers aboard fit in
+the airplane, and every passenger has one or more vacation stops.  The same
+--seed always produces the same dataset.
+"""
+import argparse
+import itertools
+import random
+import string
+import time
+
+import mysql.connector
+
+from db.config import DB_CONFIG
+
+PREFIX = 'gen_'
+CHUNK = 1000
+CITIES = 40
+
+FIRST_NAMES = ['Ava', 'Ben', 'Chloe', 'Dev', 'Elena', 'Farid', 'Grace', 'Hugo', 'Ines', 'Jonas',
+               'Kira', 'Liam', 'Maya', 'Noah', 'Olga', 'Pablo', 'Quinn', 'Rosa', 'Sami', 'Tara']
+LAST_NAMES = ['Adams', 'Brooks', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hill', 'Ito', 'Jones',
+              'Khan', 'Lopez', 'Moreau', 'Nakamura', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Wu']
+
+# Tables in foreign key order, with the condition selecting generated rows.
+GENERATED = [
+    ('airline', "airlineID LIKE 'gen\\_%'"),
+    ('location', "locationID LIKE 'gen\\_%'"),
+    ('airport', "locationID LIKE 'gen\\_%'"),
+    ('airplane', "tail_num LIKE 'gen\\_%'"),
+    ('leg', "legID LIKE 'gen\\_%'"),
+    ('route', "routeID LIKE 'gen\\_%'"),
+    ('route_path', "routeID LIKE 'gen\\_%'"),
+    ('route_summary', "route LIKE 'gen\\_%'"),
+    ('flight', "flightID LIKE 'gen\\_%'"),
+    ('person', "personID LIKE 'gen\\_%'"),
+    ('pilot', "personID LIKE 'gen\\_%'"),
+    ('pilot_licenses', "personID LIKE 'gen\\_%'"),
+    ('passenger', "personID LIKE 'gen\\_%'"),
+    ('passenger_vacations', "personID LIKE 'gen\\_%'"),
+    ('flight_event', "flightID LIKE 'gen\\_%'")
+]
+
+
+def insert_rows(conn, sql, rows):
+    """Insert an iterable of rows in chunks, committing each chunk."""
+    cursor = conn.cursor()
+    count = 0
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, CHUNK))
+            if not chunk:
+                break
+            cursor.executemany(sql, chunk)
+            conn.commit()
+            count += len(chunk)
+    finally:
+        cursor.close()
+    return count
+
+
+def clear(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE pilot SET commanding_flight = NULL WHERE commanding_flight LIKE 'gen\\_%'")
+        # Older log rows of generated passengers are replaced by one removal each.
+        cursor.execute("DELETE FROM miles_change WHERE personID LIKE 'gen\\_%'")
+        cursor.execute("INSERT INTO miles_change (personID, miles) "
+                       "SELECT personID, NULL FROM passenger WHERE personID LIKE 'gen\\_%'")
+        for table, condition in reversed(GENERATED):
+            cursor.execute(f"DELETE FROM {table} WHERE {condition}")
+            print(f"  {table}: {cursor.rowcount} row(s) removed")
+        cursor.callproc('rebuild_flight_state')
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+class Scenario:
+    def __init__(self, rng, args):
+        self.rng = rng
+        self.args = args
+
+    def airports(self, existing):
+        codes = (''.join(letters) for letters in itertools.product(string.ascii_uppercase, repeat=3))
+        codes = [code for code in codes if code.lower() not in existing]
+        self.rng.shuffle(codes)
+        self.airport_ids = codes[:self.args.airports]
+        self.airport_location = {code: f'{PREFIX}port_{i}' for i, code in enumerate(self.airport_ids)}
+        for i, code in enumerate(self.airport_ids):
+            # Several airports per city, so alternative_airports has work to do.
+            city = i % CITIES
+            yield (code, f'Generated Airport {code}', f'Gen City {city}', f'Gen State {city}', 'GEN',
+                   self.airport_location[code])
+
+    def legs_and_routes(self):
+        self.legs = {}
+        self.routes = {}
+        for r in range(self.args.routes):
+            stops = self.rng.sample(self.airport_ids, self.rng.randint(2, 5))
+            path = []
+            for departure, arrival in zip(stops, stops[1:]):
+                if (departure, arrival) not in self.legs:
+                    self.legs[departure, arrival] = (f'{PREFIX}leg_{len(self.legs)}', self.rng.randint(150, 5000))
+                path.append((departure, arrival))
+            self.routes[f'{PREFIX}route_{r}'] = path
+
+    def airplanes(self):
+        self.planes = []
+        for i in range(self.args.airplanes):
+            plane_type = self.rng.choice(['Boeing', 'Airbus', 'Airbus', None])
+            plane = {
+                'airline': f'{PREFIX}airline_{i % self.args.airlines}',
+                'tail': f'{PREFIX}t{i}',
+                'location': f'{PREFIX}plane_{i}',
+                'type': plane_type,
+                'seats': self.rng.choice([4, 6, 8, 12, 20]),
+                'speed': self.rng.choice([400, 500, 600, 800])
+            }
+            self.planes.append(plane)
+            yield (plane['airline'], plane['tail'], plane['seats'], plane['speed'], plane['location'], plane_type,
+                   self.rng.random() < 0.5,
+                   f'7{self.rng.randint(0, 8)}7' if plane_type == 'Boeing' else None,
+                   self.rng.random() < 0.5 if plane_type == 'Airbus' else None)
+
+    def flights(self):
+        self.flight_list = []
+        route_ids = list(self.routes)
+        for i, plane in enumerate(self.planes[:self.args.flights]):
+            route_id = self.rng.choice(route_ids)
+            legs = len(self.routes[route_id])
+            in_flight = self.rng.random() < 0.4
+            progress = self.rng.randint(1, legs) if in_flight else self.rng.randint(0, legs)
+            flight = {'id': f'{PREFIX}f{i}', 'route': route_id, 'plane': plane, 'progress': progress,
+                      'in_flight': in_flight}
+            self.flight_list.append(flight)
+            yield (flight['id'], route_id, plane['airline'], plane['tail'], progress,
+                   'in_flight' if in_flight else 'on_ground',
+                   f'{self.rng.randint(0, 23):02d}:{self.rng.choice([0, 15, 30, 45]):02d}:00',
+                   self.rng.randint(50, 500))
+
+    def people(self):
+        """Yield person rows, collecting the pilot and license rows on the way."""
+        self.pilot_rows, self.license_rows = [], []
+        self.passenger_count = 0
+        n = 0
+
+        def person(location):
+            nonlocal n
+            n += 1
+            return (f'{PREFIX}p{n}', self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES), location)
+
+        # Crews: flights still on their route have enough licensed pilots aboard.
+        seats = {}
+        for flight in self.flight_list:
+            plane = flight['plane']
+            seats[plane['location']] = plane['seats']
+            if flight['progress'] == len(self.routes[flight['route']]) and not flight['in_flight']:
+                continue
+            for _ in range(2 if plane['type'] == 'Boeing' else 1):
+                row = person(plane['location'])
+                self.pilot(row[0], flight['id'], plane['type'] or 'General')
+                seats[plane['location']] -= 1
+                yield row
+
+        while len(self.pilot_rows) < self.args.pilots:
+            row = person(self.airport_location[self.rng.choice(self.airport_ids)])
+            self.pilot(row[0], None, self.rng.choice(['Boeing', 'Airbus', 'General']))
+            yield row
+
+        # Passengers: some aboard flights (within seat capacity), the rest at airports.
+        planes = list(seats)
+        for _ in range(self.args.passengers):
+            location = None
+            if planes and self.rng.random() < 0.2:
+                plane_location = self.rng.choice(planes)
+                if seats[plane_location] > 0:
+                    seats[plane_location] -= 1
+                    location = plane_location
+            row = person(location or self.airport_location[self.rng.choice(self.airport_ids)])
+            self.passenger_count += 1
+            yield row
+
+    def pilot(self, person_id, flight_id, license):
+        number = len(self.pilot_rows)
+        tax_id = f'gen-{number:08d}'
+        self.pilot_rows.append((person_id, tax_id, self.rng.randint(0, 40), flight_id))
+        self.license_rows.append((person_id, license))
+        if self.rng.random() < 0.3:
+            self.license_rows.append((person_id, 'Boeing' if license != 'Boeing' else 'Airbus'))
+
+    def passengers(self, first):
+        for n in range(first, first + self.passenger_count):
+            yield (f'{PREFIX}p{n}', self.rng.randint(0, 20000), self.rng.randint(0, 2000))
+
+    def vacations(self, first):
+        for n in range(first, first + self.passenger_count):
+            for sequence, airport in enumerate(self.rng.sample(self.airport_ids, self.rng.randint(1, 3)), 1):
+                yield (f'{PREFIX}p{n}', airport, sequence)
+
+
+def generate(conn, args):
+    rng = random.Random(args.seed)
+    scenario = Scenario(rng, args)
+    cursor = conn.cursor()
+    cursor.execute("SELECT airportID FROM airport")
+    existing = {row[0].lower() for row in cursor.fetchall()}
+    cursor.close()
+
+    def step(name, sql, rows):
+        start = time.perf_counter()
+        count = insert_rows(conn, sql, rows)
+        print(f"  {name:<20}{count:>10} row(s) {time.perf_counter() - start:>8.1f}s")
+
+    airports = list(scenario.airports(existing))
+    scenario.legs_and_routes()
+    step('airline', "INSERT INTO airline (airlineID, revenue) VALUES (%s, %s)",
+         iter([(f'{PREFIX}airline_{i}', rng.randint(1000, 90000)) for i in range(args.airlines)]))
+    step('location', "INSERT INTO location (locationID) VALUES (%s)",
+         itertools.chain(((row[5],) for row in airports),
+                         ((f'{PREFIX}plane_{i}',) for i in range(args.airplanes))))
+    step('airport', "INSERT INTO airport (airportID, airport_name, city, state, country, locationID) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)", iter(airports))
+    step('airplane', "INSERT INTO airplane (airlineID, tail_num, seat_capacity, speed, locationID, plane_type, "
+                     "maintenanced, model, neo) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", scenario.airplanes())
+    step('leg', "INSERT INTO leg (legID, departure, arrival, distance) VALUES (%s, %s, %s, %s)",
+         ((leg_id, departure, arrival, distance)
+          for (departure, arrival), (leg_id, distance) in scenario.legs.items()))
+    step('route', "INSERT INTO route (routeID) VALUES (%s)", ((route_id,) for route_id in scenario.routes))
+    step('route_path', "INSERT INTO route_path (routeID, legID, sequence) VALUES (%s, %s, %s)",
+         ((route_id, scenario.legs[pair][0], sequence)
+          for route_id, path in scenario.routes.items() for sequence, pair in enumerate(path, 1)))
+    step('flight', "INSERT INTO flight (flightID, routeID, support_airline, support_tail, progress, "
+                   "airplane_status, next_time, cost) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", scenario.flights())
+    step('person', "INSERT INTO person (personID, first_name, last_name, locationID) VALUES (%s, %s, %s, %s)",
+         scenario.people())
+    step('pilot', "INSERT INTO pilot (personID, taxID, experience, commanding_flight) VALUES (%s, %s, %s, %s)",
+         iter(scenario.pilot_rows))
+    step('pilot_licenses', "INSERT INTO pilot_licenses (personID, license) VALUES (%s, %s)",
+         iter(scenario.license_rows))
+    first_passenger = len(scenario.pilot_rows) + 1
+    step('passenger', "INSERT INTO passenger (personID, miles, funds) VALUES (%s, %s, %s)",
+         scenario.passengers(first_passenger))
+    step('passenger_vacations', "INSERT INTO passenger_vacations (personID, airportID, sequence) VALUES (%s, %s, %s)",
+         scenario.vacations(first_passenger))
+
+    cursor = conn.cursor()
+    try:
+        for route_id in scenario.routes:
+            cursor.execute("""
+                INSERT INTO route_summary (route, num_legs, leg_sequence, route_length, num_flights, airport_sequence)
+                SELECT rp.routeID, COUNT(*), GROUP_CONCAT(rp.legID ORDER BY rp.sequence), SUM(l.distance), 0,
+                       GROUP_CONCAT(CONCAT(l.departure, '->', l.arrival) ORDER BY rp.sequence)
+                FROM route_path rp JOIN leg l ON rp.legID = l.legID
+                WHERE rp.routeID = %s GROUP BY rp.routeID""", (route_id,))
+            cursor.callproc('refresh_route_flights', [route_id])
+        cursor.callproc('rebuild_flight_state')
+        cursor.execute("INSERT INTO miles_change (personID, miles) "
+                       "SELECT personID, miles FROM passenger WHERE personID LIKE 'gen\\_%'")
+        conn.commit()
+    finally:
+        cursor.close()
+    print(f"  {'route_summary':<20}{len(scenario.routes):>10} row(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--airports', type=int, default=200)
+    parser.add_argument('--routes', type=int, default=1000)
+    parser.add_argument('--airlines', type=int, default=20)
+    parser.add_argument('--airplanes', type=int, default=12000)
+    parser.add_argument('--flights', type=int, default=10000)
+    parser.add_argument('--pilots', type=int, default=30000)
+    parser.add_argument('--passengers', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=4400)
+    parser.add_argument('--clear', action='store_true', help='Remove generated data and exit.')
+    args = parser.parse_args()
+    if args.flights > args.airplanes:
+        parser.error("--flights cannot exceed --airplanes (each flight needs its own airplane).")
+
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        print("Removing earlier generated data...")
+        clear(conn)
+        if not args.clear:
+            print(f"Generating scenario (seed {args.seed})...")
+            generate(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,12 @@ use flight_tracking;
 be executed is false, then simply have the procedure halt execution without changing
 the database state. Do NOT display any error messages, etc. */
 
+/* The procedures called from the web app and the JSON API also record their
+outcome in the session variable @sp_status: 'ok' (or 'granted'/'revoked'/'delayed')
+when they changed the database, otherwise a short code naming the condition that
+failed.  The app reads it right after the call instead of re-checking every
+condition itself. */
+
 -- [_] supporting functions, views and stored procedures
 -- -----------------------------------------------------------------------------
 /* Helpful library capabilities to simplify the implementation of the required
@@ -37,6 +43,77 @@ begin
 end //
 delimiter ;
 
+/* Append-only log of flight activity, read by the change feed of the web app.
+The procedures that land, take off, board, disembark, recycle a crew or retire a
+flight add a row through record_flight_event(), with the airport where it
+happened, the number of people moved (boarding, disembark, recycle_crew) and the
+flight's next_time at that moment as the simulated clock.  The table is kept
+when this script is run again. */
+create table if not exists flight_event (
+    eventID bigint unsigned not null auto_increment,
+    event_type varchar(20) not null,
+    flightID varchar(50) not null,
+    airportID char(3),
+    people integer,
+    sim_time time,
+    recorded_at timestamp(6) not null default current_timestamp(6),
+    primary key (eventID)
+) engine = innodb;
+
+drop procedure if exists record_flight_event;
+delimiter //
+create procedure record_flight_event (in ip_type varchar(20), in ip_flightID varchar(50),
+    in ip_airportID char(3), in ip_people integer)
+begin
+    insert into flight_event (event_type, flightID, airportID, people, sim_time)
+    select ip_type, flightID, ip_airportID, ip_people, next_time
+    from flight
+    where flightID = TRIM(ip_flightID);
+end //
+delimiter ;
+
+/* Append-only log of passenger miles, read by the frequent flier leaderboard of
+the web app to stay current without re-sorting every passenger.  Each row holds
+a passenger's miles after a change; miles is null when the passenger was
+removed.  add_person() logs new passengers, and flight_landing() and
+simulation_cycle() call record_flight_miles() after crediting the passengers
+on a plane.  The table is kept when this script is run again. */
+create table if not exists miles_change (
+    changeID bigint unsigned not null auto_increment,
+    personID varchar(50) not null,
+    miles integer,
+    recorded_at timestamp(6) not null default current_timestamp(6),
+    primary key (changeID)
+) engine = innodb;
+
+/* Version of the data, shared by every process of the web app.  The app bumps
+version in the same transaction as each change it commits, and generation too
+when it restores a snapshot.  Each request reads the row once: a version other
+than the one the process last saw drops its cached view pages, and a new
+generation also reloads its route index and leaderboard.  The row is kept when
+this script is run again. */
+create table if not exists data_version (
+    id tinyint not null,
+    version bigint unsigned not null default 0,
+    generation bigint unsigned not null default 0,
+    primary key (id)
+) engine = innodb;
+insert ignore into data_version (id) values (1);
+
+drop procedure if exists record_flight_miles;
+delimiter //
+create procedure record_flight_miles (in ip_flightID varchar(50))
+begin
+    insert into miles_change (personID, miles)
+    select ps.personID, ps.miles
+    from flight f
+    join airplane a on f.support_airline = a.airlineID and f.support_tail = a.tail_num
+    join person p on p.locationID = a.locationID
+    join passenger ps on ps.personID = p.personID
+    where f.flightID = TRIM(ip_flightID);
+end //
+delimiter ;
+
 -- [1] add_airplane()
 -- -----------------------------------------------------------------------------
 /* This stored procedure creates a new airplane.  A new airplane must be sponsored
@@ -64,45 +141,55 @@ sp_main: begin
        or ip_tail_num is null or TRIM(ip_tail_num) = ''
        or ip_locationID is null or TRIM(ip_locationID) = ''
        or ip_seat_capacity is null or ip_speed is null then
+         set @sp_status = 'missing_input';
          leave sp_main;
     end if;
     
     if ip_seat_capacity <= 0 or ip_speed <= 0 then
+         set @sp_status = 'bad_capacity';
          leave sp_main;
     end if;
     
     if not exists(select * from airline where airlineID = TRIM(ip_airlineID)) then
+         set @sp_status = 'no_airline';
          leave sp_main;
     end if;
     
     if exists(select * from airplane 
               where airlineID = TRIM(ip_airlineID) 
                 and tail_num = TRIM(ip_tail_num)) then
+         set @sp_status = 'airplane_exists';
          leave sp_main;
     end if;
     
     if exists(select * from location where locationID = TRIM(ip_locationID)) then
+         set @sp_status = 'location_exists';
          leave sp_main;
     end if;
     
     if ip_plane_type is null or TRIM(ip_plane_type) = '' then
          if ip_model is not null or ip_neo is not null then
+              set @sp_status = 'bad_type';
               leave sp_main;
          end if;
     else
          if UPPER(TRIM(ip_plane_type)) = 'BOEING' then
               if ip_model is null or TRIM(ip_model) = '' or ip_neo is not null then
+                   set @sp_status = 'bad_boeing';
                    leave sp_main;
               end if;
          elseif UPPER(TRIM(ip_plane_type)) = 'AIRBUS' then
               if ip_neo is null then
+                   set @sp_status = 'airbus_neo';
                    leave sp_main;
               end if;
               if ip_model is not null and TRIM(ip_model) <> '' then
+                   set @sp_status = 'airbus_model';
                    leave sp_main;
               end if;
          else
               if (ip_model is not null and TRIM(ip_model) <> '') or ip_neo is not null then
+                   set @sp_status = 'bad_type';
                    leave sp_main;
               end if;
          end if;
@@ -117,6 +204,7 @@ sp_main: begin
         TRIM(ip_locationID), TRIM(ip_plane_type), ip_maintenanced, ip_model, ip_neo
     );
     
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -138,19 +226,24 @@ sp_main: begin
        or ip_state is null or TRIM(ip_state) = ''
        or ip_country is null or TRIM(ip_country) = ''
        or ip_locationID is null or TRIM(ip_locationID) = '' then
+         set @sp_status = 'missing_input';
          leave sp_main;
     end if;
     
     if exists(select * from airport where airportID = TRIM(ip_airportID)) then
+         set @sp_status = 'airport_exists';
          leave sp_main;
     end if;
     if exists(select * from location where locationID = TRIM(ip_locationID)) then
+         set @sp_status = 'location_exists';
          leave sp_main;
     end if;
     
     insert into location (locationID) values (TRIM(ip_locationID));
     insert into airport (airportID, airport_name, city, state, country, locationID)
     values (TRIM(ip_airportID), ip_airport_name, TRIM(ip_city), TRIM(ip_state), TRIM(ip_country), TRIM(ip_locationID));
+    
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -177,34 +270,43 @@ sp_main: begin
     if ip_personID is null or TRIM(ip_personID) = '' 
        or ip_first_name is null or TRIM(ip_first_name) = '' 
        or ip_locationID is null or TRIM(ip_locationID) = '' then
+         set @sp_status = 'missing_input';
          leave sp_main;
     end if;
     
     if not exists(select * from location where locationID = TRIM(ip_locationID)) then
+         set @sp_status = 'no_location';
          leave sp_main;
     end if;
     
     if exists(select * from person where personID = TRIM(ip_personID)) then
+         set @sp_status = 'person_exists';
          leave sp_main;
     end if;
     
     if ((ip_taxID is not null or ip_experience is not null) and (ip_miles is not null or ip_funds is not null)) then
+         set @sp_status = 'both_roles';
          leave sp_main;
     end if;
     if ( (ip_taxID is not null and ip_experience is null) or (ip_taxID is null and ip_experience is not null) ) then
+         set @sp_status = 'bad_pilot';
          leave sp_main;
     end if;
     if ( (ip_miles is not null and ip_funds is null) or (ip_miles is null and ip_funds is not null) ) then
+         set @sp_status = 'bad_passenger';
          leave sp_main;
     end if;
     
     if ip_experience is not null and ip_experience < 0 then
+         set @sp_status = 'negative_experience';
          leave sp_main;
     end if;
     if ip_miles is not null and ip_miles < 0 then
+         set @sp_status = 'negative_miles';
          leave sp_main;
     end if;
     if ip_funds is not null and ip_funds < 0 then
+         set @sp_status = 'negative_funds';
          leave sp_main;
     end if;
     
@@ -213,6 +315,7 @@ sp_main: begin
     
     if ip_taxID is not null and ip_experience is not null then
          if TRIM(ip_taxID) = '' then
+             set @sp_status = 'missing_tax_id';
              leave sp_main;
          end if;
          insert into pilot (personID, taxID, experience)
@@ -222,8 +325,10 @@ sp_main: begin
     if ip_miles is not null and ip_funds is not null then
          insert into passenger (personID, miles, funds)
          values (TRIM(ip_personID), ip_miles, ip_funds);
+         insert into miles_change (personID, miles) values (TRIM(ip_personID), ip_miles);
     end if;
     
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -239,10 +344,12 @@ sp_main: begin
 
     if ip_personID is null or TRIM(ip_personID) = '' 
        or ip_license is null or TRIM(ip_license) = '' then
+        set @sp_status = 'missing_input';
         leave sp_main;
     end if;
     
     if not exists(select * from pilot where personID = TRIM(ip_personID)) then
+        set @sp_status = 'not_pilot';
         leave sp_main;
     end if;
     
@@ -251,9 +358,11 @@ sp_main: begin
                 and license = TRIM(ip_license)) then
         delete from pilot_licenses 
         where personID = TRIM(ip_personID) and license = TRIM(ip_license);
+        set @sp_status = 'revoked';
     else
         insert into pilot_licenses (personID, license)
         values (TRIM(ip_personID), TRIM(ip_license));
+        set @sp_status = 'granted';
     end if;
 end //
 delimiter ;
@@ -279,43 +388,61 @@ sp_main: begin
     -- Ensure that the progress is less than the length of the route
     -- Create the flight with the airplane starting in on the ground
     
+    declare locked_tail varchar(50);
+
     if ip_flightID is null or TRIM(ip_flightID) = '' 
        or ip_routeID is null or TRIM(ip_routeID) = '' 
        or ip_next_time is null 
        or ip_progress is null 
        or ip_cost is null then
+        set @sp_status = 'missing_input';
         leave sp_main;
     end if;
     
     if ip_cost < 0 then
+        set @sp_status = 'bad_cost';
         leave sp_main;
     end if;
     
+    -- Lock the airplane before anything else is read, so that a concurrent
+    -- offer of the same airplane waits here and then finds it in use
+    if ip_support_airline is not null and ip_support_tail is not null then
+        select tail_num into locked_tail from airplane
+        where airlineID = TRIM(ip_support_airline) and tail_num = TRIM(ip_support_tail)
+        for update;
+    end if;
+    
     if not exists(select * from route where routeID = TRIM(ip_routeID)) then
+        set @sp_status = 'no_route';
         leave sp_main;
     end if;
     
     if exists(select * from flight where flightID = TRIM(ip_flightID)) then
+        set @sp_status = 'flight_exists';
         leave sp_main;
     end if;
     
     if ip_progress < 0 
        or ip_progress >= (select count(*) from route_path where routeID = TRIM(ip_routeID)) then
+        set @sp_status = 'bad_progress';
         leave sp_main;
     end if;
     
     if ip_support_airline is not null and ip_support_tail is not null then
         if TRIM(ip_support_airline) = '' or TRIM(ip_support_tail) = '' then
+            set @sp_status = 'missing_airplane';
             leave sp_main;
         end if;
         if not exists(select * from airplane 
                       where airlineID = TRIM(ip_support_airline) 
                         and tail_num = TRIM(ip_support_tail)) then
+            set @sp_status = 'no_airplane';
             leave sp_main;
         end if;
         if exists(select * from flight 
                   where support_airline = TRIM(ip_support_airline) 
                     and support_tail = TRIM(ip_support_tail)) then
+            set @sp_status = 'airplane_in_use';
             leave sp_main;
         end if;
     end if;
@@ -329,6 +456,11 @@ sp_main: begin
         case when ip_support_tail is not null then TRIM(ip_support_tail) else null end,
         ip_progress, 'on_ground', ip_next_time, ip_cost
     );
+    
+    call refresh_route_flights(TRIM(ip_routeID));
+    call refresh_flight_state(ip_flightID);
+    
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -354,24 +486,28 @@ sp_main: begin
 		-- Hint: use addtime()
         
     declare leg_distance int;
+    declare arrival_airport char(3);
 
     if ip_flightID is null or TRIM(ip_flightID) = '' then
+        set @sp_status = 'missing_input';
         leave sp_main;
     end if;
     
     if not exists(select * from flight 
                   where flightID = TRIM(ip_flightID) 
                     and airplane_status = 'in_flight') then
+        set @sp_status = 'not_in_flight';
         leave sp_main;
     end if;
     
-    select l.distance into leg_distance
+    select l.distance, l.arrival into leg_distance, arrival_airport
     from flight f
     join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress
     join leg l on rp.legID = l.legID
     where f.flightID = TRIM(ip_flightID);
     
     if leg_distance is null or leg_distance <= 0 then
+        set @sp_status = 'no_leg';
         leave sp_main;
     end if;
     
@@ -388,11 +524,17 @@ sp_main: begin
         join person p on p.locationID = a.locationID
         where f.flightID = TRIM(ip_flightID)
     );
+    call record_flight_miles(ip_flightID);
+    
+    call record_flight_event('landing', ip_flightID, arrival_airport, null);
     
     update flight
     set airplane_status = 'on_ground',
         next_time = addtime(next_time, '01:00:00')
     where flightID = TRIM(ip_flightID);
+    call refresh_flight_state(ip_flightID);
+    
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -425,20 +567,24 @@ sp_main: begin
     declare plane_type varchar(100);
     declare pilot_count int;
     declare leg_duration time;
+    declare departure_airport char(3);
 
     if ip_flightID is null or TRIM(ip_flightID) = '' then
+        set @sp_status = 'missing_input';
         leave sp_main;
     end if;
     
     if not exists(select * from flight 
                   where flightID = TRIM(ip_flightID) 
                     and airplane_status = 'on_ground') then
+        set @sp_status = 'not_on_ground';
         leave sp_main;
     end if;
     
     if (select progress from flight where flightID = TRIM(ip_flightID))
        >= (select count(*) from route_path 
            where routeID = (select routeID from flight where flightID = TRIM(ip_flightID))) then
+        set @sp_status = 'route_complete';
         leave sp_main;
     end if;
     
@@ -446,6 +592,7 @@ sp_main: begin
                   where flightID = TRIM(ip_flightID)
                     and support_airline is not null 
                     and support_tail is not null) then
+        set @sp_status = 'no_airplane';
         leave sp_main;
     end if;
     
@@ -455,6 +602,7 @@ sp_main: begin
     where f.flightID = TRIM(ip_flightID);
     
     if plane_speed is null or plane_speed <= 0 then
+        set @sp_status = 'bad_airplane';
         leave sp_main;
     end if;
     
@@ -467,26 +615,34 @@ sp_main: begin
         update flight
         set next_time = addtime(next_time, '00:30:00')
         where flightID = TRIM(ip_flightID);
+        call refresh_flight_state(ip_flightID);
+        set @sp_status = 'delayed';
         leave sp_main;
     end if;
     
-    select l.distance into leg_distance
+    select l.distance, l.departure into leg_distance, departure_airport
     from flight f
     join route_path rp on f.routeID = rp.routeID and f.progress = rp.sequence - 1
     join leg l on rp.legID = l.legID
     where f.flightID = TRIM(ip_flightID);
     
     if leg_distance is null or leg_distance <= 0 then
+        set @sp_status = 'no_leg';
         leave sp_main;
     end if;
     
     set leg_duration = leg_time(leg_distance, plane_speed);
     
+    call record_flight_event('takeoff', ip_flightID, departure_airport, null);
+    
     update flight
     set progress = progress + 1,
         airplane_status = 'in_flight',
         next_time = addtime(next_time, leg_duration)
     where flightID = TRIM(ip_flightID);
+    call refresh_flight_state(ip_flightID);
+    
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -520,21 +676,35 @@ sp_main: begin
     declare current_plane_location varchar(50);
     declare flight_cost int;
     declare next_destination char(3);
+    declare departure_airport char(3);
     declare num_eligible int;
+    declare locked_id varchar(50);
 
     if ip_flightID is null or TRIM(ip_flightID) = '' then
+        set @sp_status = 'missing_input';
         leave sp_main;
     end if;
     
+    -- Lock the flight and then its airplane before anything else is read, so
+    -- that two boardings of one airplane cannot both pass the seat check
+    select flightID into locked_id from flight where flightID = TRIM(ip_flightID) for update;
+    select a.tail_num into locked_id
+    from flight f
+    join airplane a on f.support_airline = a.airlineID and f.support_tail = a.tail_num
+    where f.flightID = TRIM(ip_flightID)
+    for update;
+    
     if not exists(select * from flight 
                   where flightID = TRIM(ip_flightID) 
                     and airplane_status = 'on_ground') then
+        set @sp_status = 'not_on_ground';
         leave sp_main;
     end if;
     
     if (select progress from flight where flightID = TRIM(ip_flightID))
        >= (select count(*) from route_path 
            where routeID = (select routeID from flight where flightID = TRIM(ip_flightID))) then
+        set @sp_status = 'route_complete';
         leave sp_main;
     end if;
     
@@ -544,21 +714,24 @@ sp_main: begin
     where f.flightID = TRIM(ip_flightID);
     
     if current_plane_location is null or seat_capacity is null then
+        set @sp_status = 'no_airplane';
         leave sp_main;
     end if;
     
     select cost into flight_cost from flight where flightID = TRIM(ip_flightID);
     if flight_cost is null or flight_cost < 0 then
+        set @sp_status = 'bad_cost';
         leave sp_main;
     end if;
     
-    select l.arrival into next_destination
+    select l.arrival, l.departure into next_destination, departure_airport
     from flight f
     join route_path rp on f.routeID = rp.routeID and f.progress = rp.sequence - 1
     join leg l on rp.legID = l.legID
     where f.flightID = TRIM(ip_flightID);
     
     if next_destination is null then
+        set @sp_status = 'no_leg';
         leave sp_main;
     end if;
     
@@ -589,6 +762,7 @@ sp_main: begin
     
     if num_eligible > seat_capacity then
         drop temporary table if exists temp_boarding_passengers;
+        set @sp_status = 'over_capacity';
         leave sp_main;
     end if;
     
@@ -610,6 +784,198 @@ sp_main: begin
     where personID in (select personID from temp_boarding_passengers);
     
     drop temporary table if exists temp_boarding_passengers;
+    
+    if num_eligible > 0 then
+        call record_flight_event('boarding', ip_flightID, departure_airport, num_eligible);
+    end if;
+    
+    set @sp_status = 'ok';
+end //
+delimiter ;
+
+
+-- [8a] passengers_board_batch()
+-- -----------------------------------------------------------------------------
+/* This stored procedure boards passengers onto several flights in one call: all
+flights on the ground whose next leg departs from ip_airportID, or the flights
+in the comma-separated list ip_flightIDs (restricted to that airport if both are
+given).  Every flight follows the rules of passengers_board(): all of its eligible
+passengers board, or none of them if they do not fit in the free seats.  Flights
+are handled in flightID order and a passenger boards at most one flight, which is
+what calling passengers_board() for each flight in turn would do.  The candidates
+of all flights are found with one set of joins, and the passenger, person and
+passenger_vacations rows of everyone boarding are updated together.  The result
+set lists every flight considered with its status and the number boarded. */
+-- -----------------------------------------------------------------------------
+drop procedure if exists passengers_board_batch;
+delimiter //
+create procedure passengers_board_batch (in ip_airportID char(3), in ip_flightIDs text)
+sp_main: begin
+    declare next_flight varchar(50);
+    declare seats_left int;
+    declare num_eligible int;
+    declare num_locked int;
+
+    drop temporary table if exists batch_board_flights;
+    drop temporary table if exists batch_board_candidates;
+    drop temporary table if exists batch_board_passengers;
+
+    set ip_airportID = nullif(trim(ip_airportID), '');
+    set ip_flightIDs = nullif(replace(ip_flightIDs, ' ', ''), '');
+
+    if ip_airportID is null and ip_flightIDs is null then
+        set @sp_status = 'missing_input';
+        leave sp_main;
+    end if;
+
+    -- Lock the flights and then their airplanes before anything else is read,
+    -- as passengers_board() does, so that a boarding running alongside cannot
+    -- pass the same seat check
+    select count(*) into num_locked
+    from flight f
+    left join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress + 1
+    left join leg l on rp.legID = l.legID
+    where (ip_flightIDs is null or find_in_set(f.flightID, ip_flightIDs))
+      and (ip_airportID is null or l.departure = ip_airportID)
+      and (ip_flightIDs is not null or f.airplane_status = 'on_ground')
+    for update of f;
+
+    select count(*) into num_locked
+    from flight f
+    join airplane a on f.support_airline = a.airlineID and f.support_tail = a.tail_num
+    left join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress + 1
+    left join leg l on rp.legID = l.legID
+    where (ip_flightIDs is null or find_in_set(f.flightID, ip_flightIDs))
+      and (ip_airportID is null or l.departure = ip_airportID)
+      and (ip_flightIDs is not null or f.airplane_status = 'on_ground')
+    for update of a;
+
+    -- Each flight with the checks and values passengers_board() derives for it
+    create temporary table batch_board_flights (
+        flightID varchar(50) primary key,
+        status varchar(20),
+        plane_location varchar(50),
+        departure_location varchar(50),
+        departure_airport char(3),
+        next_destination char(3),
+        cost int,
+        free_seats int,
+        boarded int default 0
+    );
+
+    insert into batch_board_flights (flightID, status, plane_location, departure_location,
+        departure_airport, next_destination, cost, free_seats)
+    select f.flightID,
+           case when f.airplane_status <> 'on_ground' then 'not_on_ground'
+                when f.progress >= (select count(*) from route_path where routeID = f.routeID) then 'route_complete'
+                when a.locationID is null or a.seat_capacity is null then 'no_airplane'
+                when f.cost is null or f.cost < 0 then 'bad_cost'
+                when l.arrival is null then 'no_leg'
+                else 'pending' end,
+           a.locationID, ap.locationID, l.departure, l.arrival, f.cost,
+           a.seat_capacity - (select count(*) from person where locationID = a.locationID)
+    from flight f
+    left join airplane a on f.support_airline = a.airlineID and f.support_tail = a.tail_num
+    left join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress + 1
+    left join leg l on rp.legID = l.legID
+    left join airport ap on l.departure = ap.airportID
+    where (ip_flightIDs is null or find_in_set(f.flightID, ip_flightIDs))
+      and (ip_airportID is null or l.departure = ip_airportID)
+      and (ip_flightIDs is not null or f.airplane_status = 'on_ground');
+
+    if not exists (select * from batch_board_flights) then
+        drop temporary table if exists batch_board_flights;
+        set @sp_status = 'no_flights';
+        leave sp_main;
+    end if;
+
+    -- Every (flight, passenger) pair passengers_board() would accept
+    create temporary table batch_board_candidates (
+        flightID varchar(50),
+        personID varchar(50),
+        primary key (flightID, personID)
+    );
+
+    insert into batch_board_candidates
+    select bf.flightID, p.personID
+    from batch_board_flights bf
+    join person pe on pe.locationID = bf.departure_location
+    join passenger p on p.personID = pe.personID
+    join passenger_vacations v on v.personID = p.personID and v.sequence = 1
+    where bf.status = 'pending'
+      and v.airportID = bf.next_destination
+      and p.funds >= bf.cost;
+
+    -- The passengers boarding, each on the first flight that takes them
+    create temporary table batch_board_passengers (
+        personID varchar(50) primary key,
+        flightID varchar(50),
+        cost int
+    );
+
+    flight_loop: loop
+        set next_flight = null;
+        select min(flightID) into next_flight from batch_board_flights where status = 'pending';
+        if next_flight is null then
+            leave flight_loop;
+        end if;
+
+        select count(*) into num_eligible
+        from batch_board_candidates c
+        left join batch_board_passengers b on c.personID = b.personID
+        where c.flightID = next_flight and b.personID is null;
+
+        select free_seats into seats_left from batch_board_flights where flightID = next_flight;
+
+        if num_eligible > seats_left then
+            update batch_board_flights set status = 'over_capacity' where flightID = next_flight;
+        else
+            insert ignore into batch_board_passengers (personID, flightID, cost)
+            select c.personID, c.flightID, bf.cost
+            from batch_board_candidates c
+            join batch_board_flights bf on c.flightID = bf.flightID
+            where c.flightID = next_flight;
+
+            update batch_board_flights set status = 'ok', boarded = num_eligible where flightID = next_flight;
+        end if;
+    end loop;
+
+    update passenger p
+    join batch_board_passengers b on p.personID = b.personID
+    set p.funds = p.funds - b.cost;
+
+    update person pe
+    join batch_board_passengers b on pe.personID = b.personID
+    join batch_board_flights bf on b.flightID = bf.flightID
+    set pe.locationID = bf.plane_location;
+
+    delete v from passenger_vacations v
+    join batch_board_passengers b on v.personID = b.personID
+    where v.sequence = 1;
+
+    update passenger_vacations
+    set sequence = sequence - 1
+    where personID in (select personID from batch_board_passengers)
+    order by personID, sequence;
+
+    insert into flight_event (event_type, flightID, airportID, people, sim_time)
+    select 'boarding', f.flightID, bf.departure_airport, bf.boarded, f.next_time
+    from batch_board_flights bf
+    join flight f on f.flightID = bf.flightID
+    where bf.status = 'ok' and bf.boarded > 0
+    order by bf.flightID;
+
+    select flightID, status, boarded from batch_board_flights order by flightID;
+
+    if exists (select * from batch_board_flights where status = 'ok') then
+        set @sp_status = 'ok';
+    else
+        set @sp_status = 'none_boarded';
+    end if;
+
+    drop temporary table if exists batch_board_flights;
+    drop temporary table if exists batch_board_candidates;
+    drop temporary table if exists batch_board_passengers;
 end //
 delimiter ;
 
@@ -639,8 +1005,10 @@ sp_main: begin
     declare plane_location varchar(50);
     declare arrival_airport char(3);
     declare arrival_airport_location varchar(50);
+    declare num_disembarking int;
 
     if ip_flightID is null or TRIM(ip_flightID) = '' then
+         set @sp_status = 'missing_input';
          leave sp_main;
     end if;
     
@@ -648,6 +1016,7 @@ sp_main: begin
          select * from flight 
          where flightID = TRIM(ip_flightID) and airplane_status = 'on_ground'
     ) then
+         set @sp_status = 'not_on_ground';
          leave sp_main;
     end if;
     
@@ -658,6 +1027,7 @@ sp_main: begin
     limit 1;
     
     if plane_location is null or TRIM(plane_location) = '' then
+         set @sp_status = 'no_airplane';
          leave sp_main;
     end if;
     
@@ -669,6 +1039,7 @@ sp_main: begin
     limit 1;
     
     if arrival_airport is null or TRIM(arrival_airport) = '' then
+         set @sp_status = 'no_leg';
          leave sp_main;
     end if;
     
@@ -678,6 +1049,7 @@ sp_main: begin
     limit 1;
     
     if arrival_airport_location is null or TRIM(arrival_airport_location) = '' then
+         set @sp_status = 'no_airport';
          leave sp_main;
     end if;
     
@@ -691,8 +1063,11 @@ sp_main: begin
     where pe.locationID = TRIM(plane_location)
       and v.airportID = TRIM(arrival_airport);
     
-    if (select count(*) from temp_disembark) = 0 then
+    select count(*) into num_disembarking from temp_disembark;
+    
+    if num_disembarking = 0 then
          drop temporary table if exists temp_disembark;
+         set @sp_status = 'no_passengers';
          leave sp_main;
     end if;
     
@@ -710,6 +1085,10 @@ sp_main: begin
     where personID in (select personID from temp_disembark);
     
     drop temporary table if exists temp_disembark;
+    
+    call record_flight_event('disembark', ip_flightID, arrival_airport, num_disembarking);
+    
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -738,16 +1117,24 @@ sp_main: begin
     declare plane_location varchar(50);
     declare pilot_location varchar(50);
     declare license_ok int default 0;
+    declare locked_id varchar(50);
 
     if ip_flightID is null or TRIM(ip_flightID) = '' 
        or ip_personID is null or TRIM(ip_personID) = '' then
+         set @sp_status = 'missing_input';
          leave sp_main;
     end if;
 
+    -- Lock the flight and then the pilot before anything else is read, so
+    -- that a pilot cannot be assigned to two flights at once
+    select flightID into locked_id from flight where flightID = TRIM(ip_flightID) for update;
+    select personID into locked_id from pilot where personID = TRIM(ip_personID) for update;
+
     if not exists (
         select * from flight
         where flightID = TRIM(ip_flightID) and airplane_status = 'on_ground'
     ) then
+         set @sp_status = 'not_on_ground';
          leave sp_main;
     end if;
 
@@ -758,12 +1145,14 @@ sp_main: begin
             select routeID from flight where flightID = TRIM(ip_flightID)
         )
     ) then
+         set @sp_status = 'route_complete';
          leave sp_main;
     end if;
 
     if not exists (
         select * from pilot where personID = TRIM(ip_personID) and commanding_flight is null
     ) then
+         set @sp_status = 'pilot_unavailable';
          leave sp_main;
     end if;
 
@@ -785,6 +1174,7 @@ sp_main: begin
     end if;
     
     if license_ok = 0 then
+         set @sp_status = 'no_license';
          leave sp_main;
     end if;
 
@@ -796,6 +1186,7 @@ sp_main: begin
     if not exists (
          select * from airport where locationID = TRIM(pilot_location)
     ) then
+         set @sp_status = 'pilot_not_at_airport';
          leave sp_main;
     end if;
 
@@ -807,10 +1198,194 @@ sp_main: begin
     set locationID = TRIM(plane_location)
     where personID = TRIM(ip_personID);
     
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
 
+-- [10a] auto_crew()
+-- -----------------------------------------------------------------------------
+/* This stored procedure crews several flights in one call: all flights on the
+ground whose next leg departs from ip_airportID, or the flights in the comma-
+separated list ip_flightIDs (restricted to that airport if both are given).  Each
+flight gets the pilots it still needs to take off under the rule flight_takeoff()
+applies (two for a Boeing, one for an Airbus or a plane without a type).  Its
+pilots are taken from the unassigned pilots at the flight's airport who hold the
+license for the plane type ('general' for a plane without a type), lowest
+personID first.  A flight is crewed completely or not at all, so pilots are not
+tied up on a flight that would still be delayed.  Flights are handled in
+flightID order and a pilot is assigned to at most one flight.  The eligible
+pilots of all flights are found with one set of indexed joins (person by
+location, pilot and pilot_licenses by primary key), and the pilot and person
+rows of everyone assigned are updated together.  The result set lists every
+flight considered with its status, the pilots it needed and the number assigned. */
+-- -----------------------------------------------------------------------------
+drop procedure if exists auto_crew;
+delimiter //
+create procedure auto_crew (in ip_airportID char(3), in ip_flightIDs text)
+sp_main: begin
+    declare next_flight varchar(50);
+    declare pilots_needed int;
+    declare num_eligible int;
+    declare num_locked int;
+
+    drop temporary table if exists crew_flights;
+    drop temporary table if exists crew_candidates;
+    drop temporary table if exists crew_pilots;
+
+    set ip_airportID = nullif(trim(ip_airportID), '');
+    set ip_flightIDs = nullif(replace(ip_flightIDs, ' ', ''), '');
+
+    if ip_airportID is null and ip_flightIDs is null then
+        set @sp_status = 'missing_input';
+        leave sp_main;
+    end if;
+
+    -- Lock the flights and then their airplanes before anything else is read,
+    -- in the order assign_pilot() and passengers_board() use; the pilots are
+    -- locked once the flights' airports are known
+    select count(*) into num_locked
+    from flight f
+    left join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress + 1
+    left join leg l on rp.legID = l.legID
+    where (ip_flightIDs is null or find_in_set(f.flightID, ip_flightIDs))
+      and (ip_airportID is null or l.departure = ip_airportID)
+      and (ip_flightIDs is not null or f.airplane_status = 'on_ground')
+    for update of f;
+
+    select count(*) into num_locked
+    from flight f
+    join airplane a on f.support_airline = a.airlineID and f.support_tail = a.tail_num
+    left join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress + 1
+    left join leg l on rp.legID = l.legID
+    where (ip_flightIDs is null or find_in_set(f.flightID, ip_flightIDs))
+      and (ip_airportID is null or l.departure = ip_airportID)
+      and (ip_flightIDs is not null or f.airplane_status = 'on_ground')
+    for update of a;
+
+    -- Each flight with the license its plane needs and the pilots it is short
+    create temporary table crew_flights (
+        flightID varchar(50) primary key,
+        status varchar(20),
+        plane_location varchar(50),
+        airport_location varchar(50),
+        license varchar(100),
+        needed int,
+        assigned int default 0
+    );
+
+    insert into crew_flights (flightID, status, plane_location, airport_location, license, needed)
+    select f.flightID,
+           case when f.airplane_status <> 'on_ground' then 'not_on_ground'
+                when f.progress >= (select count(*) from route_path where routeID = f.routeID) then 'route_complete'
+                when a.locationID is null then 'no_airplane'
+                when ap.locationID is null then 'no_leg'
+                else 'pending' end,
+           a.locationID, ap.locationID, coalesce(a.plane_type, 'general'),
+           case when UPPER(TRIM(a.plane_type)) = 'BOEING' then 2
+                when UPPER(TRIM(a.plane_type)) = 'AIRBUS' or a.plane_type is null then 1
+                else 0 end
+               - (select count(*) from pilot where commanding_flight = f.flightID)
+    from flight f
+    left join airplane a on f.support_airline = a.airlineID and f.support_tail = a.tail_num
+    left join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress + 1
+    left join leg l on rp.legID = l.legID
+    left join airport ap on l.departure = ap.airportID
+    where (ip_flightIDs is null or find_in_set(f.flightID, ip_flightIDs))
+      and (ip_airportID is null or l.departure = ip_airportID)
+      and (ip_flightIDs is not null or f.airplane_status = 'on_ground');
+
+    if not exists (select * from crew_flights) then
+        drop temporary table if exists crew_flights;
+        set @sp_status = 'no_flights';
+        leave sp_main;
+    end if;
+
+    update crew_flights set status = 'crewed', needed = 0 where status = 'pending' and needed <= 0;
+
+    -- Lock the licensed pilots at those airports before reading whether they
+    -- are free, so that a concurrent assignment cannot take the same pilot
+    select count(*) into num_locked
+    from crew_flights cf
+    join person pe on pe.locationID = cf.airport_location
+    join pilot p on p.personID = pe.personID
+    join pilot_licenses pl on pl.personID = p.personID and pl.license = cf.license
+    where cf.status = 'pending'
+    for update of p;
+
+    -- Every (flight, pilot) pair assign_pilot() would accept at the flight's airport
+    create temporary table crew_candidates (
+        flightID varchar(50),
+        personID varchar(50),
+        primary key (flightID, personID)
+    );
+
+    insert into crew_candidates
+    select cf.flightID, p.personID
+    from crew_flights cf
+    join person pe on pe.locationID = cf.airport_location
+    join pilot p on p.personID = pe.personID
+    join pilot_licenses pl on pl.personID = p.personID and pl.license = cf.license
+    where cf.status = 'pending'
+      and p.commanding_flight is null;
+
+    -- The pilots assigned, each to the first flight that takes them
+    create temporary table crew_pilots (
+        personID varchar(50) primary key,
+        flightID varchar(50)
+    );
+
+    flight_loop: loop
+        set next_flight = null;
+        select min(flightID) into next_flight from crew_flights where status = 'pending';
+        if next_flight is null then
+            leave flight_loop;
+        end if;
+
+        select needed into pilots_needed from crew_flights where flightID = next_flight;
+        select count(*) into num_eligible from crew_candidates where flightID = next_flight;
+
+        if num_eligible < pilots_needed then
+            update crew_flights set status = 'short_crew' where flightID = next_flight;
+        else
+            insert into crew_pilots (personID, flightID)
+            select personID, flightID
+            from crew_candidates
+            where flightID = next_flight
+            order by personID
+            limit pilots_needed;
+
+            -- A pilot assigned here is no longer a candidate for later flights
+            delete c from crew_candidates c
+            join crew_pilots cp on c.personID = cp.personID;
+
+            update crew_flights set status = 'ok', assigned = pilots_needed where flightID = next_flight;
+        end if;
+    end loop;
+
+    update pilot p
+    join crew_pilots cp on p.personID = cp.personID
+    set p.commanding_flight = cp.flightID;
+
+    update person pe
+    join crew_pilots cp on pe.personID = cp.personID
+    join crew_flights cf on cp.flightID = cf.flightID
+    set pe.locationID = cf.plane_location;
+
+    select flightID, status, needed, assigned from crew_flights order by flightID;
+
+    if exists (select * from crew_flights where status = 'ok') then
+        set @sp_status = 'ok';
+    else
+        set @sp_status = 'none_assigned';
+    end if;
+
+    drop temporary table if exists crew_flights;
+    drop temporary table if exists crew_candidates;
+    drop temporary table if exists crew_pilots;
+end //
+delimiter ;
+
 -- [11] recycle_crew()
 -- -----------------------------------------------------------------------------
 /* This stored procedure releases the assignments for a given flight crew.  The
@@ -829,12 +1404,15 @@ DECLARE v_routeID VARCHAR(50);
     DECLARE v_passengers INT;
     DECLARE v_arrival_airport CHAR(3);
     DECLARE v_new_location VARCHAR(50);
+    DECLARE v_crew INT;
 
     if ip_flightID is null or TRIM(ip_flightID) = '' then
+         set @sp_status = 'missing_input';
          leave sp_main;
     end if;
     
     if not exists (select 1 from flight where flightID = TRIM(ip_flightID)) then
+         set @sp_status = 'not_found';
          leave sp_main;
     end if;
     
@@ -845,6 +1423,7 @@ DECLARE v_routeID VARCHAR(50);
     limit 1;
     
     if v_status <> 'on_ground' then
+         set @sp_status = 'not_on_ground';
          leave sp_main;
     end if;
     
@@ -853,6 +1432,7 @@ DECLARE v_routeID VARCHAR(50);
     where routeID = TRIM(v_routeID);
     
     if v_progress < v_total_legs then
+         set @sp_status = 'route_incomplete';
          leave sp_main;
     end if;
     
@@ -863,6 +1443,7 @@ DECLARE v_routeID VARCHAR(50);
     limit 1;
     
     if v_arrival_airport is null or TRIM(v_arrival_airport) = '' then
+         set @sp_status = 'no_arrival';
          leave sp_main;
     end if;
     
@@ -872,6 +1453,7 @@ DECLARE v_routeID VARCHAR(50);
     limit 1;
     
     if v_new_location is null or TRIM(v_new_location) = '' then
+         set @sp_status = 'no_arrival_location';
          leave sp_main;
     end if;
     
@@ -881,9 +1463,14 @@ DECLARE v_routeID VARCHAR(50);
     where p.locationID = TRIM(v_new_location);
     
     if v_passengers > 0 then
+         set @sp_status = 'passengers_present';
          leave sp_main;
     end if;
     
+    select count(*) into v_crew
+    from pilot
+    where commanding_flight = TRIM(ip_flightID);
+    
     update person p
     join pilot pl on p.personID = pl.personID
     set p.locationID = TRIM(v_new_location)
@@ -892,6 +1479,12 @@ DECLARE v_routeID VARCHAR(50);
     update pilot
     set commanding_flight = null
     where commanding_flight = TRIM(ip_flightID);
+    
+    if v_crew > 0 then
+         call record_flight_event('recycle_crew', ip_flightID, v_arrival_airport, v_crew);
+    end if;
+    
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -913,12 +1506,15 @@ DECLARE v_routeID VARCHAR(50);
     DECLARE v_passengers INT;
     DECLARE v_pilots INT;
     DECLARE v_status VARCHAR(100);
+    DECLARE v_airport CHAR(3);
 
     if ip_flightID is null or TRIM(ip_flightID) = '' then
+         set @sp_status = 'missing_input';
          leave sp_main;
     end if;
     
     if not exists(select 1 from flight where flightID = TRIM(ip_flightID)) then
+         set @sp_status = 'not_found';
          leave sp_main;
     end if;
     
@@ -929,6 +1525,7 @@ DECLARE v_routeID VARCHAR(50);
     limit 1;
     
     if v_status <> 'on_ground' then
+         set @sp_status = 'not_on_ground';
          leave sp_main;
     end if;
     
@@ -937,6 +1534,7 @@ DECLARE v_routeID VARCHAR(50);
     where routeID = TRIM(v_routeID);
     
     if v_progress <> 0 and v_progress <> v_total_legs then
+         set @sp_status = 'mid_route';
          leave sp_main;
     end if;
     
@@ -950,6 +1548,7 @@ DECLARE v_routeID VARCHAR(50);
     );
     
     if v_passengers > 0 then
+         set @sp_status = 'passengers_aboard';
          leave sp_main;
     end if;
     
@@ -958,11 +1557,26 @@ DECLARE v_routeID VARCHAR(50);
     where commanding_flight = TRIM(ip_flightID);
     
     if v_pilots > 0 then
+         set @sp_status = 'pilots_assigned';
          leave sp_main;
     end if;
     
+    -- Where the flight ends: the start of its route if it never left
+    select case when v_progress = 0 then l.departure else l.arrival end into v_airport
+    from route_path rp
+    join leg l on rp.legID = l.legID
+    where rp.routeID = TRIM(v_routeID) and rp.sequence = greatest(v_progress, 1)
+    limit 1;
+    
+    call record_flight_event('retire', ip_flightID, v_airport, null);
+    
     delete from flight
     where flightID = TRIM(ip_flightID);
+    
+    call refresh_route_flights(v_routeID);
+    call refresh_flight_state(ip_flightID);
+    
+    set @sp_status = 'ok';
 end //
 delimiter ;
 
@@ -1005,13 +1619,16 @@ DECLARE v_flightID VARCHAR(50);
     DECLARE v_leg_distance INT;
     DECLARE v_arrival_airport CHAR(3);
     DECLARE v_new_location VARCHAR(50);
+    DECLARE v_departure_airport CHAR(3);
+    DECLARE v_disembarked INT;
 
-    -- Select the flight with the smallest next_time.
+    -- Select the flight with the smallest next_time.  The earliest time is read
+    -- from the next_time index first, so only the flights due at that time are sorted.
     select flightID, airplane_status, next_time, routeID, progress, support_airline, support_tail
       into v_flightID, v_status, v_next_time, v_routeID, v_progress, v_airlineID, v_tail_num
     from flight
-    order by next_time asc,
-             case when airplane_status = 'in_flight' then 0 else 1 end,
+    where next_time <=> (select next_time from flight order by next_time asc limit 1)
+    order by case when airplane_status = 'in_flight' then 0 else 1 end,
              flightID asc
     limit 1;
     
@@ -1043,6 +1660,7 @@ DECLARE v_flightID VARCHAR(50);
              where airlineID = TRIM(v_airlineID) and tail_num = TRIM(v_tail_num)
              limit 1
          );
+         call record_flight_miles(v_flightID);
          
          select l.arrival into v_arrival_airport
          from route_path rp
@@ -1063,6 +1681,8 @@ DECLARE v_flightID VARCHAR(50);
               leave sp_main;
          end if;
          
+         call record_flight_event('landing', v_flightID, v_arrival_airport, null);
+         
          update person p
          join passenger_vacations pv on p.personID = pv.personID and pv.sequence = 1
          join passenger ps on p.personID = ps.personID
@@ -1073,6 +1693,11 @@ DECLARE v_flightID VARCHAR(50);
              limit 1
          )
          and pv.airportID = TRIM(v_arrival_airport);
+         set v_disembarked = row_count();
+         
+         if v_disembarked > 0 then
+              call record_flight_event('disembark', v_flightID, v_arrival_airport, v_disembarked);
+         end if;
          
          call passengers_disembark(v_flightID);
          
@@ -1080,6 +1705,7 @@ DECLARE v_flightID VARCHAR(50);
          set airplane_status = 'on_ground',
              next_time = addtime(v_next_time, '01:00:00')
          where flightID = TRIM(v_flightID);
+         call refresh_flight_state(v_flightID);
          
     elseif v_status = 'on_ground' then
          select count(*) into v_total_legs
@@ -1092,7 +1718,7 @@ DECLARE v_flightID VARCHAR(50);
          else
               call passengers_board(v_flightID);
               
-              select l.distance into v_legDistance
+              select l.distance, l.departure into v_legDistance, v_departure_airport
               from route_path rp
               join leg l on rp.legID = l.legID
               where rp.routeID = TRIM(v_routeID) and rp.sequence = (v_progress + 1)
@@ -1114,11 +1740,14 @@ DECLARE v_flightID VARCHAR(50);
               set v_duration_secs = floor((v_legDistance / v_speed) * 3600);
               set v_new_next_time = addtime(v_next_time, sec_to_time(v_duration_secs));
               
+              call record_flight_event('takeoff', v_flightID, v_departure_airport, null);
+              
               update flight
               set airplane_status = 'in_flight',
                   progress = progress + 1,
                   next_time = v_new_next_time
               where flightID = TRIM(v_flightID);
+              call refresh_flight_state(v_flightID);
          end if;
     else
          leave sp_main;
@@ -1133,26 +1762,79 @@ We need to display what airports these flights are departing from, what airports
 they are arriving at, the number of flights that are flying between the 
 departure and arrival airport, the list of those flights (ordered by their 
 flight IDs), the earliest and latest arrival times for the destinations and the 
-list of planes (by their respective flight IDs) flying these flights. */
+list of planes (by their respective flight IDs) flying these flights.
+
+flights_in_the_air and flights_on_the_ground are stored in tables instead of
+being regrouped over the whole fleet on every read.  flight_position keeps the
+leg or airport each flight is at, and refresh_flight_state() is called whenever
+flight_takeoff(), flight_landing(), offer_flight(), retire_flight() or
+simulation_cycle() changes a flight.  It recomputes only the rows of the two
+tables the flight left and joined, from the flights in those groups. */
 -- -----------------------------------------------------------------------------
-CREATE OR REPLACE VIEW flights_in_the_air AS
-SELECT 
-    TRIM(l.departure) AS departure_airport,
-    TRIM(l.arrival) AS arrival_airport,
-    COUNT(*) AS num_flights,
-    GROUP_CONCAT(f.flightID ORDER BY f.flightID) AS flight_list,
-    MIN(f.next_time) AS earliest_arrival,
-    MAX(f.next_time) AS latest_arrival,
-    GROUP_CONCAT(a.locationID ORDER BY f.flightID) AS plane_locations
-FROM flight f
-JOIN route_path rp ON f.routeID = rp.routeID AND rp.sequence = f.progress
-JOIN leg l ON rp.legID = l.legID
-JOIN airplane a ON f.support_airline = a.airlineID AND f.support_tail = a.tail_num
-WHERE f.airplane_status = 'in_flight'
-  AND l.departure IS NOT NULL
-  AND l.arrival IS NOT NULL
-  AND a.locationID IS NOT NULL
-GROUP BY TRIM(l.departure), TRIM(l.arrival);
+create or replace view flight_position_source as
+select f.flightID,
+       f.airplane_status,
+       case when f.airplane_status = 'in_flight' then TRIM(l.departure) end as departure_airport,
+       case when f.airplane_status = 'in_flight' then TRIM(l.arrival) end as arrival_airport,
+       case when f.airplane_status = 'on_ground' then
+            case when f.progress = 0 then TRIM(first_leg.departure) else TRIM(l.arrival) end
+       end as current_airport,
+       f.next_time,
+       a.locationID as plane_location
+from flight f
+join airplane a on f.support_airline = a.airlineID and f.support_tail = a.tail_num
+left join route_path rp on f.routeID = rp.routeID and rp.sequence = f.progress
+left join leg l on rp.legID = l.legID
+left join route_path first_rp on f.routeID = first_rp.routeID and first_rp.sequence = 1
+left join leg first_leg on first_rp.legID = first_leg.legID;
+
+drop table if exists flight_position;
+create table flight_position (
+    flightID varchar(50),
+    airplane_status varchar(100),
+    departure_airport char(3),
+    arrival_airport char(3),
+    current_airport char(3),
+    next_time time,
+    plane_location varchar(50),
+    primary key (flightID),
+    key flight_position_air (airplane_status, departure_airport, arrival_airport),
+    key flight_position_ground (airplane_status, current_airport)
+) engine = innodb;
+
+drop table if exists flights_in_the_air;
+drop view if exists flights_in_the_air;
+create table flights_in_the_air (
+    departure_airport char(3),
+    arrival_airport char(3),
+    num_flights integer not null,
+    flight_list text,
+    earliest_arrival time,
+    latest_arrival time,
+    plane_locations text,
+    primary key (departure_airport, arrival_airport)
+) engine = innodb;
+
+drop procedure if exists refresh_flights_in_the_air;
+delimiter //
+create procedure refresh_flights_in_the_air (in ip_departure char(3), in ip_arrival char(3))
+begin
+    delete from flights_in_the_air
+    where departure_airport = ip_departure and arrival_airport = ip_arrival;
+
+    insert into flights_in_the_air
+    select departure_airport, arrival_airport, count(*),
+           group_concat(flightID order by flightID),
+           min(next_time), max(next_time),
+           group_concat(plane_location order by flightID)
+    from flight_position
+    where airplane_status = 'in_flight'
+      and departure_airport = ip_departure
+      and arrival_airport = ip_arrival
+      and plane_location is not null
+    group by departure_airport, arrival_airport;
+end //
+delimiter ;
 
 -- [15] flights_on_the_ground()
 -- ------------------------------------------------------------------------------
@@ -1161,49 +1843,117 @@ located. We need to display what airports these flights are departing from, how
 many flights are departing from each airport, the list of flights departing from 
 each airport (ordered by their flight IDs), the earliest and latest arrival time 
 amongst all of these flights at each airport, and the list of planes (by their 
-respective flight IDs) that are departing from each airport.*/
+respective flight IDs) that are departing from each airport.
+
+Maintained together with flights_in_the_air, see above. */
 -- ------------------------------------------------------------------------------
-CREATE OR REPLACE VIEW flights_on_the_ground AS
-SELECT 
-    LOWER(current_airport) AS departing_from,
-    COUNT(*) AS num_flights,
-    GROUP_CONCAT(flightID ORDER BY flightID) AS flight_list,
-    MIN(next_time) AS earliest_arrival,
-    MAX(next_time) AS latest_arrival,
-    GROUP_CONCAT(airplane_location ORDER BY flightID) AS airplane_list
-FROM (
-    SELECT 
-         f.flightID,
-         f.next_time,
-         f.airplane_status,
-         f.progress,
-         f.routeID,
-         f.support_airline,
-         f.support_tail,
-         a.locationID AS airplane_location,
-         CASE 
-           WHEN f.progress = 0 THEN 
-             (SELECT TRIM(l.departure)
-              FROM route_path rp 
-              JOIN leg l ON rp.legID = l.legID
-              WHERE rp.routeID = f.routeID 
-                AND rp.sequence = 1
-                AND l.departure IS NOT NULL)
-           ELSE 
-             (SELECT TRIM(l.arrival)
-              FROM route_path rp 
-              JOIN leg l ON rp.legID = l.legID
-              WHERE rp.routeID = f.routeID 
-                AND rp.sequence = f.progress
-                AND l.arrival IS NOT NULL)
-         END AS current_airport
-    FROM flight f
-    JOIN airplane a ON f.support_airline = a.airlineID AND f.support_tail = a.tail_num
-    WHERE f.airplane_status = 'on_ground'
-      AND a.locationID IS NOT NULL
-) AS sub
-WHERE current_airport IS NOT NULL
-GROUP BY LOWER(current_airport);
+drop table if exists flights_on_the_ground;
+drop view if exists flights_on_the_ground;
+create table flights_on_the_ground (
+    departing_from char(3),
+    num_flights integer not null,
+    flight_list text,
+    earliest_arrival time,
+    latest_arrival time,
+    airplane_list text,
+    primary key (departing_from)
+) engine = innodb;
+
+drop procedure if exists refresh_flights_on_the_ground;
+delimiter //
+create procedure refresh_flights_on_the_ground (in ip_airport char(3))
+begin
+    delete from flights_on_the_ground where departing_from = ip_airport;
+
+    insert into flights_on_the_ground
+    select LOWER(current_airport), count(*),
+           group_concat(flightID order by flightID),
+           min(next_time), max(next_time),
+           group_concat(plane_location order by flightID)
+    from flight_position
+    where airplane_status = 'on_ground'
+      and current_airport = ip_airport
+      and plane_location is not null
+    group by LOWER(current_airport);
+end //
+delimiter ;
+
+drop procedure if exists refresh_flight_state;
+delimiter //
+create procedure refresh_flight_state (in ip_flightID varchar(50))
+sp_main: begin
+    declare old_departure, old_arrival, old_airport char(3);
+    declare new_departure, new_arrival, new_airport char(3);
+
+    if ip_flightID is null or TRIM(ip_flightID) = '' then
+        leave sp_main;
+    end if;
+
+    set old_departure = (select departure_airport from flight_position where flightID = TRIM(ip_flightID));
+    set old_arrival = (select arrival_airport from flight_position where flightID = TRIM(ip_flightID));
+    set old_airport = (select current_airport from flight_position where flightID = TRIM(ip_flightID));
+
+    delete from flight_position where flightID = TRIM(ip_flightID);
+    insert into flight_position
+    select * from flight_position_source where flightID = TRIM(ip_flightID);
+
+    set new_departure = (select departure_airport from flight_position where flightID = TRIM(ip_flightID));
+    set new_arrival = (select arrival_airport from flight_position where flightID = TRIM(ip_flightID));
+    set new_airport = (select current_airport from flight_position where flightID = TRIM(ip_flightID));
+
+    if old_departure is not null and old_arrival is not null then
+        call refresh_flights_in_the_air(old_departure, old_arrival);
+    end if;
+    if new_departure is not null and new_arrival is not null
+       and not (new_departure <=> old_departure and new_arrival <=> old_arrival) then
+        call refresh_flights_in_the_air(new_departure, new_arrival);
+    end if;
+    if old_airport is not null then
+        call refresh_flights_on_the_ground(old_airport);
+    end if;
+    if new_airport is not null and not (new_airport <=> old_airport) then
+        call refresh_flights_on_the_ground(new_airport);
+    end if;
+end //
+delimiter ;
+
+-- Rebuilds flight_position and both tables from scratch, for bulk changes made
+-- outside the procedures (the in-memory simulation engine, generated data).
+drop procedure if exists rebuild_flight_state;
+delimiter //
+create procedure rebuild_flight_state ()
+begin
+    delete from flight_position;
+    insert into flight_position select * from flight_position_source;
+
+    delete from flights_in_the_air;
+    insert into flights_in_the_air
+    select departure_airport, arrival_airport, count(*),
+           group_concat(flightID order by flightID),
+           min(next_time), max(next_time),
+           group_concat(plane_location order by flightID)
+    from flight_position
+    where airplane_status = 'in_flight'
+      and departure_airport is not null
+      and arrival_airport is not null
+      and plane_location is not null
+    group by departure_airport, arrival_airport;
+
+    delete from flights_on_the_ground;
+    insert into flights_on_the_ground
+    select LOWER(current_airport), count(*),
+           group_concat(flightID order by flightID),
+           min(next_time), max(next_time),
+           group_concat(plane_location order by flightID)
+    from flight_position
+    where airplane_status = 'on_ground'
+      and current_airport is not null
+      and plane_location is not null
+    group by LOWER(current_airport);
+end //
+delimiter ;
+
+call rebuild_flight_state();
 
 
 
@@ -1226,8 +1976,8 @@ SELECT
     GROUP_CONCAT(DISTINCT f.flightID ORDER BY f.flightID) AS flight_list,
     MIN(f.next_time) AS earliest_arrival,
     MAX(f.next_time) AS latest_arrival,
-    SUM(CASE WHEN p.personID IN (SELECT personID FROM pilot) THEN 1 ELSE 0 END) AS num_pilots,
-    SUM(CASE WHEN p.personID IN (SELECT personID FROM passenger) THEN 1 ELSE 0 END) AS num_passengers,
+    COUNT(pl.personID) AS num_pilots,
+    COUNT(pa.personID) AS num_passengers,
     COUNT(DISTINCT p.personID) AS joint_pilots_passengers,
     GROUP_CONCAT(DISTINCT p.personID ORDER BY p.personID) AS person_list
 FROM flight f
@@ -1235,6 +1985,8 @@ JOIN airplane a ON f.support_airline = a.airlineID AND f.support_tail = a.tail_n
 JOIN route_path rp ON f.routeID = rp.routeID AND rp.sequence = f.progress
 JOIN leg l ON rp.legID = l.legID
 JOIN person p ON p.locationID = a.locationID
+LEFT JOIN pilot pl ON pl.personID = p.personID
+LEFT JOIN passenger pa ON pa.personID = p.personID
 WHERE f.airplane_status = 'in_flight'
   AND l.departure IS NOT NULL
   AND l.arrival IS NOT NULL
@@ -1258,12 +2010,14 @@ SELECT
     a.city,
     a.state,
     a.country,
-    SUM(CASE WHEN p.personID IN (SELECT personID FROM pilot) THEN 1 ELSE 0 END) AS num_pilots,
-    SUM(CASE WHEN p.personID IN (SELECT personID FROM passenger) THEN 1 ELSE 0 END) AS num_passengers,
+    COUNT(pl.personID) AS num_pilots,
+    COUNT(pa.personID) AS num_passengers,
     COUNT(*) AS total_people,
     GROUP_CONCAT(p.personID ORDER BY p.personID) AS person_list
 FROM airport a
 JOIN person p ON p.locationID = a.locationID
+LEFT JOIN pilot pl ON pl.personID = p.personID
+LEFT JOIN passenger pa ON pa.personID = p.personID
 WHERE a.airportID IS NOT NULL
   AND a.locationID IS NOT NULL
   AND a.airport_name IS NOT NULL
@@ -1278,9 +2032,27 @@ GROUP BY a.airportID, a.locationID, a.airport_name, a.city, a.state, a.country;
 /* This view gives a summary of every route. It includes the route ID, number of legs,
 the leg sequence (as a comma‐separated list of leg IDs), total distance, number of flights on the route,
 a list of flight IDs, and the sequence of departure airports along the route.
+
+The summary is stored in a table instead of being re-aggregated on every read.
+The leg columns never change once a route exists, and the flight columns of a
+single route are refreshed by refresh_route_flights() whenever offer_flight()
+or retire_flight() adds or removes one of its flights.
 */
 -- -----------------------------------------------------------------------------
-CREATE OR REPLACE VIEW route_summary AS
+drop table if exists route_summary;
+drop view if exists route_summary;
+create table route_summary (
+    route varchar(50),
+    num_legs integer not null,
+    leg_sequence text,
+    route_length integer,
+    num_flights integer not null default 0,
+    flight_list text,
+    airport_sequence text,
+    primary key (route)
+) engine = innodb;
+
+INSERT INTO route_summary (route, num_legs, leg_sequence, route_length, num_flights, flight_list, airport_sequence)
 SELECT 
     r.routeID AS route,
     COUNT(rp.sequence) AS num_legs,
@@ -1297,6 +2069,22 @@ WHERE l.departure IS NOT NULL
   AND l.distance IS NOT NULL
 GROUP BY r.routeID;
 
+drop procedure if exists refresh_route_flights;
+delimiter //
+create procedure refresh_route_flights (in ip_routeID varchar(50))
+sp_main: begin
+
+    if ip_routeID is null or TRIM(ip_routeID) = '' then
+        leave sp_main;
+    end if;
+
+    update route_summary
+    set num_flights = (select count(*) from flight where routeID = TRIM(ip_routeID)),
+        flight_list = (select group_concat(flightID order by flightID) from flight where routeID = TRIM(ip_routeID))
+    where route = TRIM(ip_routeID);
+end //
+delimiter ;
+
 
 
 -- [19] alternative_airports()
@@ -1322,18 +2110,24 @@ HAVING COUNT(*) > 1;
 
 
 -- extra view for phase IV
+/* The five passengers with the most miles.  The top rows are read from the end
+of the passenger_miles index (migrations/002) and each one's rank is the number
+of passengers with more miles plus one, which is the same as RANK() but counts
+only the index entries above the row instead of sorting every passenger.  Larger
+boards, paging and the rank of any passenger are served by db/leaderboard.py. */
 CREATE OR REPLACE VIEW top_frequent_fliers AS
-SELECT 
-    RANK() OVER (ORDER BY SUM(pa.miles) DESC) AS miles_rank,
+SELECT
+    (SELECT COUNT(*) FROM passenger above WHERE above.miles > top.miles) + 1 AS miles_rank,
     p.personID,
     p.first_name,
     p.last_name,
-    SUM(pa.miles) AS total_miles
-FROM person p
-JOIN passenger pa ON p.personID = pa.personID
-GROUP BY p.personID
-ORDER BY total_miles DESC
-LIMIT 5;
+    top.miles AS total_miles
+FROM (SELECT personID, miles FROM passenger
+      WHERE miles IS NOT NULL
+      ORDER BY miles DESC, personID
+      LIMIT 5) top
+JOIN person p ON p.personID = top.personID
+ORDER BY total_miles DESC, p.personID;
 
 
 
@@ -0,0 +1,230 @@
+import csv
+import json
+from itertools import islice
+
+import mysql.connector
+
+from db.db import commit
+from db.validation import validate_airplane, validate_airport, validate_person
+
+# Bulk loading of airports, airplanes and people from CSV (with a header row)
+# or JSONL files.  Column names are the field names of the matching add_* form.
+# Rows are validated like the forms, checked against the database with one
+# IN (...) query per table and chunk, and inserted with multi-row INSERTs, one
+# transaction per chunk.  A chunk that the database rejects is retried row by
+# row so only the offending rows are reported.
+
+CHUNK_SIZE = 500
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+def format_for(filename):
+    for extension, fmt in FORMATS.items():
+        if filename.lower().endswith(extension):
+            return fmt
+    raise ValueError("File must be .csv, .jsonl or .ndjson.")
+
+
+def read_rows(stream, fmt):
+    """Yield (line, row, error) for every record of a CSV or JSONL text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_no, None, "Line is not valid JSON."
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "Line must be a JSON object."
+            continue
+        yield line_no, row, None
+
+
+def _lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def _existing(cursor, table, columns, keys):
+    """Return which of keys (tuples of column values) already exist in table."""
+    keys = list(keys)
+    if not keys:
+        return set()
+    if len(columns) == 1:
+        target, placeholder = columns[0], '%s'
+    else:
+        target = f"({', '.join(columns)})"
+        placeholder = f"({', '.join(['%s'] * len(columns))})"
+    cursor.execute(
+        f"SELECT {', '.join(columns)} FROM {table} WHERE {target} IN ({', '.join([placeholder] * len(keys))})",
+        [value for key in keys for value in key]
+    )
+    return {tuple(_lower(value) for value in row) for row in cursor.fetchall()}
+
+
+class _Checker:
+    """Collects the first error per line while running set-based checks."""
+
+    def __init__(self, rows, seen):
+        self.rows = rows
+        self.seen = seen
+        self.errors = {}
+
+    def key(self, values, *names):
+        return tuple(_lower(values[name]) for name in names)
+
+    def keys(self, *names):
+        return {self.key(values, *names) for line, values in self.rows if line not in self.errors}
+
+    def reject(self, test, message, *names):
+        for line, values in self.rows:
+            if line not in self.errors and test(self.key(values, *names)):
+                self.errors[line] = message
+
+    def unique_in_file(self, group, message, *names):
+        seen = self.seen.setdefault(group, set())
+        for line, values in self.rows:
+            if line in self.errors:
+                continue
+            key = self.key(values, *names)
+            if key in seen:
+                self.errors[line] = message
+            else:
+                seen.add(key)
+
+
+def _check_airports(cursor, checker):
+    airports = _existing(cursor, 'airport', ['airportID'], checker.keys('airport_id'))
+    checker.reject(lambda key: key in airports, "Airport ID already exists.", 'airport_id')
+    locations = _existing(cursor, 'location', ['locationID'], checker.keys('location_id'))
+    checker.reject(lambda key: key in locations, "Location ID is already in use.", 'location_id')
+    checker.unique_in_file('airport', "Airport ID appears more than once in the file.", 'airport_id')
+    checker.unique_in_file('location', "Location ID is already in use.", 'location_id')
+
+
+def _insert_airports(cursor, rows):
+    cursor.executemany("INSERT INTO location (locationID) VALUES (%s)", [(v['location_id'],) for v in rows])
+    cursor.executemany(
+        "INSERT INTO airport (airportID, airport_name, city, state, country, locationID) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        [(v['airport_id'], v['name'], v['city'], v['state'], v['country'], v['location_id']) for v in rows]
+    )
+
+
+def _check_airplanes(cursor, checker):
+    airlines = _existing(cursor, 'airline', ['airlineID'], checker.keys('airline_id'))
+    checker.reject(lambda key: key not in airlines, "Airline ID does not exist.", 'airline_id')
+    planes = _existing(cursor, 'airplane', ['airlineID', 'tail_num'], checker.keys('airline_id', 'tail_num'))
+    checker.reject(lambda key: key in planes, "This tail number already exists for the given airline.",
+                   'airline_id', 'tail_num')
+    locations = _existing(cursor, 'location', ['locationID'], checker.keys('location_id'))
+    checker.reject(lambda key: key in locations, "Location ID already exists in the database.", 'location_id')
+    checker.unique_in_file('airplane', "This tail number appears more than once for the airline in the file.",
+                           'airline_id', 'tail_num')
+    checker.unique_in_file('location', "Location ID already exists in the database.", 'location_id')
+
+
+def _insert_airplanes(cursor, rows):
+    cursor.executemany("INSERT INTO location (locationID) VALUES (%s)", [(v['location_id'],) for v in rows])
+    cursor.executemany(
+        "INSERT INTO airplane (airlineID, tail_num, seat_capacity, speed, locationID, plane_type, "
+        "maintenanced, model, neo) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        [(v['airline_id'], v['tail_num'], v['seat_cap'], v['speed'], v['location_id'], v['plane_type'],
+          v['maintained'], v['model'], v['neo']) for v in rows]
+    )
+
+
+def _check_people(cursor, checker):
+    people = _existing(cursor, 'person', ['personID'], checker.keys('person_id'))
+    checker.reject(lambda key: key in people, "Person ID already exists.", 'person_id')
+    locations = _existing(cursor, 'location', ['locationID'], checker.keys('location_id'))
+    checker.reject(lambda key: key not in locations, "Location ID does not exist.", 'location_id')
+    tax_ids = _existing(cursor, 'pilot', ['taxID'], checker.keys('tax_id') - {(None,)})
+    checker.reject(lambda key: key in tax_ids, "Tax ID already belongs to another pilot.", 'tax_id')
+    checker.unique_in_file('person', "Person ID appears more than once in the file.", 'person_id')
+
+
+def _insert_people(cursor, rows):
+    cursor.executemany(
+        "INSERT INTO person (personID, first_name, last_name, locationID) VALUES (%s, %s, %s, %s)",
+        [(v['person_id'], v['first_name'], v['last_name'], v['location_id']) for v in rows]
+    )
+    pilots = [(v['person_id'], v['tax_id'], v['experience']) for v in rows if v['experience'] is not None]
+    if pilots:
+        cursor.executemany("INSERT INTO pilot (personID, taxID, experience) VALUES (%s, %s, %s)", pilots)
+    passengers = [(v['person_id'], v['miles'], v['funds']) for v in rows if v['miles'] is not None]
+    if passengers:
+        cursor.executemany("INSERT INTO passenger (personID, miles, funds) VALUES (%s, %s, %s)", passengers)
+        cursor.executemany("INSERT INTO miles_change (personID, miles) VALUES (%s, %s)",
+                           [(person_id, miles) for person_id, miles, _ in passengers])
+
+
+KINDS = {
+    'airports': (validate_airport, _check_airports, _insert_airports),
+    'airplanes': (validate_airplane, _check_airplanes, _insert_airplanes),
+    'people': (validate_person, _check_people, _insert_people)
+}
+
+
+def import_rows(conn, kind, records, chunk_size=CHUNK_SIZE):
+    """Import (line, row, error) records of one kind; see read_rows().
+
+    Returns a report with the number of rows read and inserted and the error
+    for every rejected line.  Accepted rows are committed chunk by chunk, so a
+    bad row never undoes the rest of the file.
+    """
+    validate, check, insert = KINDS[kind]
+    report = {'kind': kind, 'rows': 0, 'inserted': 0, 'errors': []}
+    seen = {}
+    records = iter(records)
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        report['rows'] += len(chunk)
+
+        valid = []
+        errors = {}
+        for line, row, error in chunk:
+            if error is None:
+                values, error = validate(row)
+            if error:
+                errors[line] = error
+            else:
+                valid.append((line, values))
+
+        cursor = conn.cursor()
+        try:
+            checker = _Checker(valid, seen)
+            check(cursor, checker)
+            errors.update(checker.errors)
+            accepted = [(line, values) for line, values in valid if line not in checker.errors]
+
+            try:
+                if accepted:
+                    insert(cursor, [values for _, values in accepted])
+                    commit(conn)
+                report['inserted'] += len(accepted)
+            except mysql.connector.Error:
+                conn.rollback()
+                for line, values in accepted:
+                    try:
+                        insert(cursor, [values])
+                        commit(conn)
+                        report['inserted'] += 1
+                    except mysql.connector.Error as err:
+                        conn.rollback()
+                        errors[line] = f"Database error: {err.msg}"
+        finally:
+            cursor.close()
+
+        report['errors'].extend({'line': line, 'error': errors[line]} for line in sorted(errors))
+
+    return report
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+from db.config import CACHE_CONFIG, FRAGMENT_CACHE_CONFIG
+
+
+class ViewCache:
+    """Bounded LRU cache of query results tagged with the data version.
+
+    Every committed change bumps the version, which makes all cached entries
+    stale at once.  An optional ttl (seconds) also expires entries, for changes
+    made outside this process (other workers, CLI commands).
+    """
+
+    def __init__(self, max_entries=64, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            return self.version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, stored_at, value = entry
+                if version == self.version and (self.ttl is None or time.monotonic() - stored_at < self.ttl):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version=None):
+        with self._lock:
+            # A result read before a concurrent bump must not be stored as current.
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (self.version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            version = self.version
+            value = loader()
+            self.put(key, value, version)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+
+view_cache = ViewCache(**CACHE_CONFIG)
+fragment_cache = ViewCache(**FRAGMENT_CACHE_CONFIG)
+
+
+def bump_data_version():
+    fragment_cache.bump()
+    return view_cache.bump()
+
+
+def cache_stats():
+    stats = view_cache.stats()
+    stats['fragments'] = fragment_cache.stats()
+    return stats
@@ -0,0 +1,57 @@
+import gzip
+import zlib
+
+from flask import request
+
+from db.config import COMPRESSION_CONFIG
+
+# gzip for responses, installed by init_app().  A buffered response is
+# compressed in one go once it is at least min_size bytes.  A streamed response
+# (the view pages) is compressed piece by piece with a sync flush after each
+# piece, so the browser can render the rows it has while the rest is on its way.
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        yield b''
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        # Closing the compressed stream must close the body, which releases
+        # its connection (see db.db.streamed).
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _compress(response):
+    if response.status_code != 200 or response.direct_passthrough \
+            or 'Content-Encoding' in response.headers \
+            or response.mimetype not in COMPRESSION_CONFIG['mimetypes']:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip']:
+        return response
+
+    if response.is_streamed:
+        stream = _gzip_stream(response.response, COMPRESSION_CONFIG['level'])
+        # Started, so that closing it unread still closes the body.
+        next(stream)
+        response.response = stream
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_CONFIG['min_size']:
+            return response
+        response.set_data(gzip.compress(data, COMPRESSION_CONFIG['level']))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def init_app(app):
+    app.after_request(_compress)
@@ -3,4 +3,150 @@ DB_CONFIG = {
     'password': '0228',
     'host': 'localhost',
     'database': 'flight_tracking'
-}
\ No newline at end of file
+}
+
+# Connection pool settings used by db.db.get_db().
+#   pool_size    - connections kept open between requests
+#   max_overflow - extra connections opened under burst load, closed on release
+#   timeout      - seconds a request waits for a free connection before failing
+#   recycle      - seconds after which a connection is closed and replaced
+#   pre_ping     - check that an idle connection is still alive before handing it out
+#   lock_wait_timeout - seconds a statement waits for a row lock before it fails and
+#                  its transaction is retried (RETRY_CONFIG); None keeps the server's 50
+POOL_CONFIG = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'timeout': 30,
+    'recycle': 3600,
+    'pre_ping': True,
+    'lock_wait_timeout': 5
+}
+
+# Retrying a procedure call that lost a deadlock or timed out waiting for a lock (db.db.retry_transaction).
+#   attempts    - tries in all before the error is reported
+#   backoff     - seconds slept before the first retry; doubled for each one after
+#   max_backoff - longest sleep between tries; each sleep is a random part of the current step
+RETRY_CONFIG = {
+    'attempts': 4,
+    'backoff': 0.02,
+    'max_backoff': 0.5
+}
+
+# Result cache for the reporting views (db.cache).
+#   max_entries - cached results kept before the least recently used is dropped
+#   ttl         - optional maximum age in seconds, for writes made outside the app; the
+#                 app's own commits reach every worker through the data_version row
+CACHE_CONFIG = {
+    'max_entries': 64,
+    'ttl': None
+}
+
+# Paging and rendering of the reporting view routes (db.views, db.fragments).
+#   page_size     - rows per page when the request gives no ?limit=
+#   max_page_size - largest ?limit= accepted
+#   chunk_rows    - table rows rendered into one HTML chunk
+#   flush_bytes   - a streamed page is sent in pieces of at least this many bytes
+VIEW_CONFIG = {
+    'page_size': 500,
+    'max_page_size': 5000,
+    'chunk_rows': 100,
+    'flush_bytes': 8192
+}
+
+# Rendered table bodies of the view pages (db.fragments), dropped on every
+# committed change like the view cache.
+FRAGMENT_CACHE_CONFIG = {
+    'max_entries': 64,
+    'ttl': None
+}
+
+# gzip compression of responses (db.compression).
+#   min_size  - smaller responses are sent as they are; streamed ones are always compressed
+#   level     - zlib compression level, 1 (fastest) to 9 (smallest)
+#   mimetypes - response types that are compressed; event streams are left alone
+COMPRESSION_CONFIG = {
+    'min_size': 1024,
+    'level': 6,
+    'mimetypes': ('text/html', 'application/json', 'text/plain', 'text/csv', 'application/x-ndjson')
+}
+
+# Operations dashboard (db.dashboard).
+#   rows    - rows shown per view when the request gives no ?limit=
+#   timeout - seconds a view may take before it is reported as timed out
+#   workers - threads fetching views in parallel, each on its own pooled connection
+DASHBOARD_CONFIG = {
+    'rows': 10,
+    'timeout': 5,
+    'workers': 7
+}
+
+# In-process index of routes and their legs (db.routes).
+#   ttl - seconds before the index is reloaded, for route changes made outside the app
+ROUTE_INDEX_CONFIG = {
+    'ttl': 300
+}
+
+# Change feed of flight events (db.events).
+#   poll_interval  - seconds between reads of new events while a stream is open
+#   batch_size     - most events read at once, and per /api/v1/events page
+#   stream_seconds - an event stream is closed after this long; browsers reconnect
+#                    on their own and resume from the Last-Event-ID they received
+EVENTS_CONFIG = {
+    'poll_interval': 1.0,
+    'batch_size': 500,
+    'stream_seconds': 300
+}
+
+# Frequent flier leaderboard (db.leaderboard).
+#   size         - passengers per page when the request gives no ?limit=
+#   max_size     - largest ?limit= accepted
+#   ttl          - seconds before the board is read again in full
+#   batch_size   - miles_change rows read at once while catching up
+#   reload_after - re-read the board instead of applying more than this many changes
+LEADERBOARD_CONFIG = {
+    'size': 10,
+    'max_size': 1000,
+    'ttl': 3600,
+    'batch_size': 5000,
+    'reload_after': 50000
+}
+
+# CSV / NDJSON exports (db.export).
+#   batch_size        - rows fetched and written at a time
+#   net_write_timeout - seconds the server waits on a slow reader during an export
+EXPORT_CONFIG = {
+    'batch_size': 1000,
+    'net_write_timeout': 600
+}
+
+# Named snapshots of the whole database (db.snapshots).
+#   admin_token - token the /api/v1/admin/snapshots routes require in an X-Admin-Token
+#                 header; with None the routes are turned off and answer 404
+#                 (use `flask snapshot` on the server instead)
+SNAPSHOT_CONFIG = {
+    'admin_token': None
+}
+
+# Traffic recording for bench.replay (db.recording).
+#   path - JSONL file every request is appended to; None turns recording off.
+#          app.config['RECORD_PATH'] overrides it, e.g. create_app({'RECORD_PATH': ...})
+#   skip - path prefixes that are not recorded: monitoring, admin and long-lived streams
+RECORDING_CONFIG = {
+    'path': None,
+    'skip': ('/metrics', '/pool_stats', '/cache_stats', '/api/v1/admin', '/api/v1/events/stream', '/static')
+}
+
+# Production serving (app.create_app and gunicorn.conf.py).
+#   bind       - address gunicorn listens on
+#   workers    - worker processes; each has its own connection pool, so the
+#                server may hold up to workers * (pool_size + max_overflow) connections
+#   threads    - request threads per worker; keep at or below pool_size.  An open
+#                /api/v1/events/stream holds one thread for as long as it is connected
+#   warm_start - compile the templates, load the route index and leaderboard and open
+#                the pool's connections when the app is created, before the first request
+SERVER_CONFIG = {
+    'bind': '0.0.0.0:8000',
+    'workers': 4,
+    'threads': 4,
+    'warm_start': True
+}
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import mysql.connector
+
+from db.config import DASHBOARD_CONFIG, VIEW_CONFIG
+from db.db import pooled_connection, sync_caches
+from db.views import VIEW_KEYS, ViewPage
+
+# The operations dashboard shows the first rows of every reporting view.  Each
+# view is read on its own pooled connection by a shared thread pool, so the
+# dashboard takes about as long as its slowest view instead of the sum of all
+# of them.  A view that fails or runs past the timeout is reported as an error
+# and the others are still shown.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DASHBOARD_CONFIG['workers'],
+                                               thread_name_prefix='dashboard')
+    return _executor
+
+
+def _reset_after_fork():
+    # The parent's worker threads do not exist in a forked child.
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def read_dashboard_params(args):
+    """Return the rows per view from ?limit=, or raise ValueError."""
+    limit = args.get('limit', '').strip()
+    if not limit:
+        return DASHBOARD_CONFIG['rows']
+    if not limit.isdigit() or not 0 < int(limit) <= VIEW_CONFIG['max_page_size']:
+        raise ValueError(f"limit must be between 1 and {VIEW_CONFIG['max_page_size']}.")
+    return int(limit)
+
+
+def _fetch(view, limit, timeout):
+    start = time.perf_counter()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        # The server stops the query at the timeout, so a slow view does not
+        # keep its worker and connection after the dashboard has given up on it.
+        cursor.execute("SET SESSION max_execution_time = %s", (int(timeout * 1000),))
+        try:
+            page = ViewPage(conn, view, None, limit)
+            rows = list(page.rows)
+        finally:
+            try:
+                cursor.execute("SET SESSION max_execution_time = DEFAULT")
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+    return {
+        'columns': page.columns,
+        'rows': rows,
+        'next_after': page.next_after,
+        'elapsed_ms': 1000 * (time.perf_counter() - start),
+        'error': None
+    }
+
+
+def _failed(message):
+    return {'columns': [], 'rows': [], 'next_after': None, 'elapsed_ms': None, 'error': message}
+
+
+def fetch_dashboard(views=None, limit=None, timeout=None):
+    """Read the first limit rows of each view in parallel.
+
+    Returns {view: {columns, rows, next_after, elapsed_ms, error}} in the order
+    of VIEW_KEYS.  Views not finished after timeout seconds get an error.
+    """
+    views = views or list(VIEW_KEYS)
+    limit = limit or DASHBOARD_CONFIG['rows']
+    timeout = timeout or DASHBOARD_CONFIG['timeout']
+
+    with pooled_connection() as conn:
+        sync_caches(conn)
+    executor = get_executor()
+    futures = {view: executor.submit(_fetch, view, limit, timeout) for view in views}
+    done, _ = wait(futures.values(), timeout=timeout)
+
+    results = {}
+    for view, future in futures.items():
+        if future not in done:
+            future.cancel()
+            results[view] = _failed(f"Timed out after {timeout:g}s.")
+            continue
+        try:
+            results[view] = future.result()
+        except mysql.connector.Error as err:
+            results[view] = _failed(f"Database error: {err.msg}")
+        except Exception as e:
+            results[view] = _failed(str(e))
+    return results
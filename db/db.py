@@ -1,5 +1,368 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import mysql.connector
-from db.config import DB_CONFIG
+from flask import g
+from db.cache import bump_data_version
+from db.config import DB_CONFIG, POOL_CONFIG, RETRY_CONFIG
+from db.leaderboard import leaderboard
+from db.metrics import InstrumentedConnection, transaction_conflicts, transaction_retries
+from db.routes import invalidate_routes
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Fixed-size pool of MySQL connections with a bounded overflow.
+
+    Up to pool_size connections are kept open between requests.  When they are
+    all in use, up to max_overflow extra connections are opened and closed again
+    as soon as they are released.  Idle connections older than recycle seconds
+    are replaced, and with pre_ping an idle connection is checked before use.
+    New connections get lock_wait_timeout as their innodb_lock_wait_timeout.
+    """
+
+    def __init__(self, db_config, pool_size=5, max_overflow=10, timeout=30, recycle=3600, pre_ping=True,
+                 lock_wait_timeout=None):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.lock_wait_timeout = lock_wait_timeout
+
+        self._idle = deque()
+        self._created_at = {}
+        self._checked_out = 0
+        self._lock = threading.Condition()
+
+        self._acquire_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._opened = 0
+        self._recycled = 0
+        self._failed_pings = 0
+        self._peak_checked_out = 0
+
+    def _open(self):
+        conn = mysql.connector.connect(**self.db_config)
+        if self.lock_wait_timeout is not None:
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION innodb_lock_wait_timeout = %s", (self.lock_wait_timeout,))
+            cursor.close()
+        self._created_at[id(conn)] = time.monotonic()
+        self._opened += 1
+        return conn
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def _is_stale(self, conn):
+        created = self._created_at.get(id(conn), 0)
+        if self.recycle is not None and time.monotonic() - created > self.recycle:
+            self._recycled += 1
+            return True
+        if self.pre_ping and not conn.is_connected():
+            self._failed_pings += 1
+            return True
+        return False
+
+    @property
+    def capacity(self):
+        return self.pool_size + self.max_overflow
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._lock:
+            while not self._idle and self._checked_out >= self.capacity:
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s.")
+                self._lock.wait(remaining)
+
+            conn = self._idle.popleft() if self._idle else None
+            self._checked_out += 1
+            self._peak_checked_out = max(self._peak_checked_out, self._checked_out)
+
+        try:
+            if conn is not None and self._is_stale(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._lock:
+                self._checked_out -= 1
+                self._lock.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._acquire_count += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn):
+        # Anything the route did not commit is thrown away before reuse.
+        try:
+            conn.rollback()
+            keep = True
+        except mysql.connector.Error:
+            keep = False
+
+        with self._lock:
+            self._checked_out -= 1
+            if keep and len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                conn = None
+            self._lock.notify()
+
+        if conn is not None:
+            self._discard(conn)
+
+    def fill(self, count=None):
+        """Open idle connections until count (default pool_size) are ready; return how many were opened."""
+        count = self.pool_size if count is None else min(count, self.pool_size)
+        opened = 0
+        while True:
+            with self._lock:
+                if len(self._idle) + self._checked_out >= count:
+                    return opened
+                self._checked_out += 1
+            try:
+                conn = self._open()
+            finally:
+                with self._lock:
+                    self._checked_out -= 1
+            with self._lock:
+                self._idle.append(conn)
+                self._lock.notify()
+            opened += 1
+
+    def dispose(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'checked_out': self._checked_out,
+                'idle': len(self._idle),
+                'peak_checked_out': self._peak_checked_out,
+                'utilization': self._checked_out / self.capacity if self.capacity else 0.0,
+                'acquired': self._acquire_count,
+                'wait_avg_ms': 1000 * self._wait_total / self._acquire_count if self._acquire_count else 0.0,
+                'wait_max_ms': 1000 * self._wait_max,
+                'timeouts': self._timeouts,
+                'opened': self._opened,
+                'recycled': self._recycled,
+                'failed_pings': self._failed_pings
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    return _pool
+
+
+def _reset_after_fork():
+    # A forked worker must not share the parent's sockets.  The inherited pool
+    # is left unused rather than closed (closing would end the parent's
+    # sessions) and kept referenced so it is never garbage collected here.
+    global _pool, _pool_lock
+    if _pool is not None:
+        _inherited_pools.append(_pool)
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+_inherited_pools = []
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def warm_pool(count=None):
+    """Open the pool's connections ahead of the first requests."""
+    return get_pool().fill(count)
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def get_db():
+    """Return the connection borrowed for the current request.
+
+    The connection is taken from the pool on first use and handed back by
+    close_db() when the app context is torn down, so routes must not close it.
+    """
+    if 'db' not in g:
+        g.db = InstrumentedConnection(get_pool().acquire())
+        sync_caches(g.db)
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().release(conn.raw)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
+def streamed(body):
+    """Hand the request's connection over to a streamed response body.
+
+    Flask tears the request down once when the view returns and again after a
+    stream_with_context body has been sent.  The connection is detached from
+    the request so the first teardown does not return it to the pool while
+    rows are still being read; it is released when the body is done.  g.streaming
+    tells other teardown hooks that the request is not finished yet.
+    """
+    conn = g.pop('db', None)
+    g.streaming = True
+
+    def generate():
+        try:
+            yield b''
+            yield from body
+        finally:
+            if conn is not None:
+                get_pool().release(conn.raw)
+
+    stream = generate()
+    # Start the generator so that closing an unread body still releases.
+    next(stream)
+    return stream
+
+
+# Every worker has its own caches, so changes are announced through the
+# data_version row: commit() bumps it in the same transaction, and each request
+# reads it once through sync_caches() before using a cache.
+VERSION_SQL = "SELECT version, generation FROM data_version WHERE id = 1"
+BUMP_SQL = "UPDATE data_version SET version = version + 1 WHERE id = 1"
+RELOAD_SQL = "UPDATE data_version SET version = version + 1, generation = generation + 1 WHERE id = 1"
+
+_seen = None
+_seen_lock = threading.Lock()
+
+
+def _read_version(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(VERSION_SQL)
+        return tuple(cursor.fetchone())
+    finally:
+        cursor.close()
+
+
+def sync_caches(conn):
+    """Drop the caches of this process that another process's commits have made stale.
+
+    A new version clears the view and fragment caches; a new generation (a
+    snapshot restore) also reloads the route index and leaderboard.  The read
+    is ended at once: under the scripts' SERIALIZABLE default it share-locks
+    the row, which would hold up every commit.
+    """
+    global _seen
+    current = _read_version(conn)
+    conn.rollback()
+    with _seen_lock:
+        seen, _seen = _seen, current
+    if seen is None or seen == current:
+        return
+    if seen[0] != current[0]:
+        bump_data_version()
+    if seen[1] != current[1]:
+        invalidate_routes()
+        leaderboard.invalidate()
+
+
+def commit(conn, reload=False):
+    """Commit, bumping the shared data version, and invalidate cached view results.
+
+    With reload, other processes also reload their route index and leaderboard.
+    """
+    global _seen
+    cursor = conn.cursor()
+    try:
+        cursor.execute(RELOAD_SQL if reload else BUMP_SQL)
+    finally:
+        cursor.close()
+    current = _read_version(conn)
+    conn.commit()
+    bump_data_version()
+    with _seen_lock:
+        _seen = current
+
+
+# MySQL errors after which the whole transaction can be run again.  The victim
+# of a deadlock has already been rolled back; a lock wait timeout undoes only
+# the statement that waited, so the rest is rolled back before retrying.
+RETRY_ERRORS = {1213: 'deadlock', 1205: 'lock_wait_timeout'}
+
+
+def retry_transaction(conn, name, work):
+    """Return work(), running it again after a deadlock or lock wait timeout.
+
+    work must be one whole transaction on conn that commits or rolls back
+    itself.  Tries are spaced by exponential backoff with jitter
+    (RETRY_CONFIG) and counted in the sams_transaction_* metrics by name.
+    """
+    attempts, step = RETRY_CONFIG['attempts'], RETRY_CONFIG['backoff']
+    for attempt in range(1, attempts + 1):
+        try:
+            return work()
+        except mysql.connector.Error as err:
+            reason = RETRY_ERRORS.get(err.errno)
+            if reason is None:
+                raise
+            conn.rollback()
+            if attempt == attempts:
+                transaction_conflicts.inc((name, reason))
+                raise
+            transaction_retries.inc((name, reason))
+            time.sleep(random.uniform(0, min(step, RETRY_CONFIG['max_backoff'])))
+            step *= 2
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a pooled connection outside of a request (CLI commands, threads)."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield InstrumentedConnection(conn)
+    finally:
+        pool.release(conn)
+
 
 def get_db_connection():
     return mysql.connector.connect(**DB_CONFIG)
@@ -0,0 +1,550 @@
+import heapq
+import math
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import mysql.connector
+
+from db.db import commit, retry_transaction
+from db.routes import route_index
+from db.simulation import MAX_STEPS, format_clock, run_simulation
+
+# An in-memory copy of simulation_cycle() and the procedures it calls
+# (passengers_board, recycle_crew, retire_flight).  Every early "leave sp_main"
+# of the procedures is reproduced, including the ones that happen after some
+# rows were already updated, so a run leaves exactly the state the procedure
+# would.  Identifiers are compared case-insensitively like the database does.
+# Routes and legs come from the in-process route index.
+#
+# The rows are locked as they are loaded, in the order the procedures lock them
+# (flight, airplane, pilot, then the people they move), and stay locked until
+# flush() has written the result back in the same transaction.  An operation
+# that commits while the steps run would otherwise be overwritten by the write
+# back; instead it waits for it.
+
+LOAD_QUERIES = {
+    'flights': """SELECT flightID, routeID, support_airline, support_tail, progress,
+                         airplane_status, next_time, cost FROM flight FOR UPDATE""",
+    'airplanes': "SELECT airlineID, tail_num, seat_capacity, speed, locationID FROM airplane FOR UPDATE",
+    'pilots': "SELECT personID, experience, commanding_flight FROM pilot FOR UPDATE",
+    'people': "SELECT personID, locationID FROM person FOR UPDATE",
+    'passengers': "SELECT personID, miles, funds FROM passenger FOR UPDATE",
+    'vacations': "SELECT personID, airportID, sequence FROM passenger_vacations FOR UPDATE",
+    'airports': "SELECT airportID, locationID FROM airport"
+}
+
+FOUR_PLACES = Decimal('0.0001')
+WRITE_CHUNK = 1000
+
+
+def _k(value):
+    return value.lower() if value is not None else None
+
+
+def _seconds(value):
+    if value is None:
+        return None
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    return int(value)
+
+
+def _add(seconds, delta):
+    return None if seconds is None else seconds + delta
+
+
+def flight_seconds(distance, speed):
+    """Flight time in seconds as simulation_cycle() computes it.
+
+    MySQL divides the two integers to a DECIMAL rounded to four places before
+    multiplying by 3600 and flooring, so e.g. 500 / 600 gives 2999 seconds.
+    """
+    quotient = (Decimal(distance) / Decimal(speed)).quantize(FOUR_PLACES, rounding=ROUND_HALF_UP)
+    return math.floor(quotient * 3600)
+
+
+class SimulationEngine:
+    """Runs simulation_cycle() steps against an in-memory copy of the database.
+
+    Build it with load(conn), advance it with step() or run(), then write the
+    changed rows back with flush(conn).
+    """
+
+    def __init__(self, flights, legs, airplanes, airports, people, pilots, passengers, vacations):
+        self.flights = {}
+        for row in flights:
+            flight = dict(row)
+            flight['next_time'] = _seconds(flight['next_time'])
+            self.flights[_k(flight['flightID'])] = flight
+        self.retired = {}
+
+        self.routes = {}
+        for row in legs:
+            self.routes.setdefault(_k(row['routeID']), {})[row['sequence']] = row
+
+        self.airplanes = {(_k(row['airlineID']), _k(row['tail_num'])): row for row in airplanes}
+        self.airport_locations = {_k(row['airportID']): row['locationID'] for row in airports}
+
+        self.people = {_k(row['personID']): dict(row) for row in people}
+        self.pilots = {_k(row['personID']): dict(row) for row in pilots}
+        self.passengers = {_k(row['personID']): dict(row) for row in passengers}
+
+        self.vacations = {}
+        for row in vacations:
+            self.vacations.setdefault(_k(row['personID']), {})[row['sequence']] = row['airportID']
+
+        # Who is at each location, and who commands each flight.
+        self.occupants = {}
+        self.passengers_at = {}
+        for key, person in self.people.items():
+            self._place(key, person['locationID'])
+        self.crews = {}
+        for key, pilot in self.pilots.items():
+            if pilot['commanding_flight'] is not None:
+                self.crews.setdefault(_k(pilot['commanding_flight']), set()).add(key)
+
+        # flight_event rows the procedures would have added, in order.
+        self.events = []
+
+        self._original = self.state()
+        self._queue = []
+        self._versions = {}
+        for key in self.flights:
+            self._schedule(key)
+
+    @classmethod
+    def load(cls, conn):
+        rows = {'legs': [leg for route in route_index.routes(conn).values() for leg in route.legs]}
+        cursor = conn.cursor(dictionary=True)
+        try:
+            for name, query in LOAD_QUERIES.items():
+                cursor.execute(query)
+                rows[name] = cursor.fetchall()
+        finally:
+            cursor.close()
+        return cls(**rows)
+
+    def state(self):
+        """Snapshot of everything simulation_cycle() can change, for diffing."""
+        return {
+            'flight': {key: (f['progress'], f['airplane_status'], f['next_time']) for key, f in self.flights.items()},
+            'person': {key: p['locationID'] for key, p in self.people.items()},
+            'pilot': {key: (p['experience'], p['commanding_flight']) for key, p in self.pilots.items()},
+            'passenger': {key: (p['miles'], p['funds']) for key, p in self.passengers.items()},
+            'passenger_vacations': {key: dict(v) for key, v in self.vacations.items() if v}
+        }
+
+    # -- bookkeeping -----------------------------------------------------------
+
+    def _place(self, person_key, location):
+        self.occupants.setdefault(_k(location), set()).add(person_key)
+        if person_key in self.passengers:
+            self.passengers_at.setdefault(_k(location), set()).add(person_key)
+
+    def _move(self, person_key, location):
+        person = self.people[person_key]
+        old = _k(person['locationID'])
+        self.occupants.get(old, set()).discard(person_key)
+        self.passengers_at.get(old, set()).discard(person_key)
+        person['locationID'] = location
+        self._place(person_key, location)
+
+    def _passengers_at(self, location):
+        if location is None:
+            return set()
+        return self.passengers_at.get(_k(location), set())
+
+    def _airplane(self, flight):
+        return self.airplanes.get((_k(flight['support_airline']), _k(flight['support_tail'])))
+
+    def _route_length(self, flight):
+        return len(self.routes.get(_k(flight['routeID']), {}))
+
+    def _leg(self, flight, sequence):
+        return self.routes.get(_k(flight['routeID']), {}).get(sequence)
+
+    def _schedule(self, key):
+        flight = self.flights[key]
+        version = self._versions.get(key, 0) + 1
+        self._versions[key] = version
+        next_time = flight['next_time']
+        sort_key = (
+            next_time is not None,
+            next_time if next_time is not None else 0,
+            0 if _k(flight['airplane_status']) == 'in_flight' else 1,
+            key
+        )
+        heapq.heappush(self._queue, (sort_key, version, key))
+
+    def _record(self, event_type, flight, airport, people=None):
+        self.events.append((event_type, flight['flightID'], airport, people, flight['next_time']))
+
+    def _next_flight(self):
+        while self._queue:
+            _, version, key = self._queue[0]
+            if key in self.flights and self._versions.get(key) == version:
+                return key
+            heapq.heappop(self._queue)
+        return None
+
+    # -- procedures ------------------------------------------------------------
+
+    def _land(self, key, flight):
+        leg = self._leg(flight, flight['progress'])
+        distance = leg['distance'] if leg else None
+        if distance is None or distance <= 0:
+            return
+
+        for pilot_key in self.crews.get(key, ()):
+            pilot = self.pilots[pilot_key]
+            if pilot['experience'] is not None:
+                pilot['experience'] += 1
+
+        airplane = self._airplane(flight)
+        on_board = list(self._passengers_at(airplane['locationID'] if airplane else None))
+        for person_key in on_board:
+            passenger = self.passengers[person_key]
+            if passenger['miles'] is not None:
+                passenger['miles'] += distance
+
+        arrival = leg['arrival']
+        if arrival is None or arrival.strip() == '':
+            return
+        new_location = self.airport_locations.get(_k(arrival))
+        if new_location is None or new_location.strip() == '':
+            return
+
+        self._record('landing', flight, arrival)
+
+        # The procedure then calls passengers_disembark(), which does nothing
+        # because the flight is still in the air at that point.
+        disembarked = 0
+        for person_key in on_board:
+            if _k(self.vacations.get(person_key, {}).get(1)) == _k(arrival):
+                self._move(person_key, new_location)
+                disembarked += 1
+        if disembarked:
+            self._record('disembark', flight, arrival, disembarked)
+
+        flight['airplane_status'] = 'on_ground'
+        flight['next_time'] = _add(flight['next_time'], 3600)
+
+    def _board(self, flight):
+        if flight['progress'] >= self._route_length(flight):
+            return
+        airplane = self._airplane(flight)
+        if airplane is None or airplane['locationID'] is None or airplane['seat_capacity'] is None:
+            return
+        cost = flight['cost']
+        if cost is None or cost < 0:
+            return
+        leg = self._leg(flight, flight['progress'] + 1)
+        if leg is None or leg['arrival'] is None:
+            return
+
+        destination = _k(leg['arrival'])
+        departure_location = self.airport_locations.get(_k(leg['departure']))
+        eligible = [
+            person_key for person_key in self._passengers_at(departure_location)
+            if _k(self.vacations.get(person_key, {}).get(1)) == destination
+            and self.passengers[person_key]['funds'] is not None
+            and self.passengers[person_key]['funds'] >= cost
+        ]
+
+        seats = airplane['seat_capacity'] - len(self.occupants.get(_k(airplane['locationID']), ()))
+        if len(eligible) > seats:
+            return
+
+        for person_key in eligible:
+            self.passengers[person_key]['funds'] -= cost
+            self._move(person_key, airplane['locationID'])
+            remaining = self.vacations.get(person_key, {})
+            self.vacations[person_key] = {seq - 1: airport for seq, airport in remaining.items() if seq != 1}
+        if eligible:
+            self._record('boarding', flight, leg['departure'], len(eligible))
+
+    def _recycle_crew(self, key, flight):
+        total_legs = self._route_length(flight)
+        if flight['progress'] < total_legs:
+            return
+        leg = self._leg(flight, total_legs)
+        arrival = leg['arrival'] if leg else None
+        if arrival is None or arrival.strip() == '':
+            return
+        new_location = self.airport_locations.get(_k(arrival))
+        if new_location is None or new_location.strip() == '':
+            return
+        if self._passengers_at(new_location):
+            return
+
+        crew = self.crews.pop(key, set())
+        for pilot_key in crew:
+            self._move(pilot_key, new_location)
+            self.pilots[pilot_key]['commanding_flight'] = None
+        if crew:
+            self._record('recycle_crew', flight, arrival, len(crew))
+
+    def _retire(self, key, flight):
+        total_legs = self._route_length(flight)
+        if flight['progress'] != 0 and flight['progress'] != total_legs:
+            return
+        airplane = self._airplane(flight)
+        if self._passengers_at(airplane['locationID'] if airplane else None):
+            return
+        if self.crews.get(key):
+            return
+        leg = self._leg(flight, max(flight['progress'], 1))
+        self._record('retire', flight, (leg['departure'] if flight['progress'] == 0 else leg['arrival']) if leg else None)
+        self.retired[key] = self.flights.pop(key)
+
+    def _take_off(self, flight):
+        self._board(flight)
+        leg = self._leg(flight, flight['progress'] + 1)
+        distance = leg['distance'] if leg else None
+        if distance is None or distance <= 0:
+            return
+        airplane = self._airplane(flight)
+        speed = airplane['speed'] if airplane else None
+        if speed is None or speed <= 0:
+            return
+
+        self._record('takeoff', flight, leg['departure'])
+        flight['airplane_status'] = 'in_flight'
+        flight['progress'] += 1
+        flight['next_time'] = _add(flight['next_time'], flight_seconds(distance, speed))
+
+    def step(self):
+        """Run one simulation_cycle() step.
+
+        Returns the step summary, or None when there is no flight left.  The
+        summary's 'stalled' flag is set when the flight was left unchanged.
+        """
+        key = self._next_flight()
+        if key is None:
+            return None
+        flight = self.flights[key]
+        before = (flight['airplane_status'], flight['next_time'], flight['progress'])
+        status = _k(flight['airplane_status'])
+        branch = None
+
+        if status == 'in_flight':
+            branch = 'landing'
+            self._land(key, flight)
+        elif status == 'on_ground' and flight['progress'] is not None:
+            if flight['progress'] == self._route_length(flight):
+                branch = 'retire'
+                self._recycle_crew(key, flight)
+                self._retire(key, flight)
+            else:
+                branch = 'takeoff'
+                self._take_off(flight)
+
+        retired = key not in self.flights
+        if not retired:
+            self._schedule(key)
+        return {
+            'flight': flight['flightID'],
+            'branch': branch,
+            'time': format_clock(timedelta(seconds=before[1])) if before[1] is not None else None,
+            'next_time': None if retired else format_clock(
+                timedelta(seconds=flight['next_time']) if flight['next_time'] is not None else None),
+            'retired': retired,
+            'stalled': not retired and before == (flight['airplane_status'], flight['next_time'], flight['progress'])
+        }
+
+    def run(self, max_steps=None, until=None):
+        """Run steps with the same stopping rules as db.simulation.run_simulation()."""
+        if max_steps is None:
+            max_steps = MAX_STEPS
+        until = _seconds(until)
+        steps = []
+        stop_reason = 'max_steps'
+
+        while len(steps) < max_steps:
+            key = self._next_flight()
+            if key is None:
+                stop_reason = 'no_flights'
+                break
+            next_time = self.flights[key]['next_time']
+            if until is not None and next_time is not None and next_time > until:
+                stop_reason = 'reached_time'
+                break
+
+            summary = self.step()
+            if summary.pop('stalled'):
+                stop_reason = 'stalled'
+                break
+            summary['step'] = len(steps) + 1
+            steps.append(summary)
+
+        return {'steps': steps, 'executed': len(steps), 'stop_reason': stop_reason}
+
+    # -- write back ------------------------------------------------------------
+
+    def changes(self):
+        """Rows that differ from what was loaded, grouped by table."""
+        before, after = self._original, self.state()
+        return {
+            'flight': [self.flights[key] for key, row in after['flight'].items() if before['flight'].get(key) != row],
+            'retired': [flight['flightID'] for flight in self.retired.values()],
+            'person': [self.people[key] for key, row in after['person'].items() if before['person'][key] != row],
+            'pilot': [key for key, row in after['pilot'].items() if before['pilot'][key] != row],
+            'passenger': [key for key, row in after['passenger'].items() if before['passenger'][key] != row],
+            'passenger_vacations': [
+                key for key in set(before['passenger_vacations']) | set(after['passenger_vacations'])
+                if before['passenger_vacations'].get(key) != after['passenger_vacations'].get(key)
+            ]
+        }
+
+    def flush(self, conn):
+        """Write every changed row back with set-based statements.
+
+        Does not commit.  Returns the number of rows written per table.
+        """
+        changes = self.changes()
+        cursor = conn.cursor()
+        try:
+            _bulk_update(cursor, 'pilot', ['personID'], ['experience', 'commanding_flight'], [
+                (self.pilots[key]['personID'], self.pilots[key]['experience'], self.pilots[key]['commanding_flight'])
+                for key in changes['pilot']
+            ])
+            _bulk_update(cursor, 'flight', ['flightID'], ['progress', 'airplane_status', 'next_time'], [
+                (f['flightID'], f['progress'], f['airplane_status'],
+                 timedelta(seconds=f['next_time']) if f['next_time'] is not None else None)
+                for f in changes['flight']
+            ])
+            for chunk in _chunks(changes['retired']):
+                cursor.execute(
+                    f"DELETE FROM flight WHERE flightID IN ({', '.join(['%s'] * len(chunk))})", chunk)
+            for route in sorted({flight['routeID'] for flight in self.retired.values()}):
+                cursor.callproc('refresh_route_flights', [route])
+            if changes['flight'] or changes['retired']:
+                cursor.callproc('rebuild_flight_state')
+            _bulk_update(cursor, 'person', ['personID'], ['locationID'], [
+                (p['personID'], p['locationID']) for p in changes['person']
+            ])
+            _bulk_update(cursor, 'passenger', ['personID'], ['miles', 'funds'], [
+                (self.passengers[key]['personID'], self.passengers[key]['miles'], self.passengers[key]['funds'])
+                for key in changes['passenger']
+            ])
+
+            people = [self.people[key]['personID'] for key in changes['passenger_vacations']]
+            for chunk in _chunks(people):
+                cursor.execute(
+                    f"DELETE FROM passenger_vacations WHERE personID IN ({', '.join(['%s'] * len(chunk))})", chunk)
+            rows = [
+                (self.people[key]['personID'], airport, seq)
+                for key in changes['passenger_vacations']
+                for seq, airport in sorted(self.vacations.get(key, {}).items())
+            ]
+            for chunk in _chunks(rows):
+                cursor.executemany(
+                    "INSERT INTO passenger_vacations (personID, airportID, sequence) VALUES (%s, %s, %s)", chunk)
+
+            for chunk in _chunks([(self.passengers[key]['personID'], self.passengers[key]['miles'])
+                                  for key in changes['passenger']]):
+                cursor.executemany("INSERT INTO miles_change (personID, miles) VALUES (%s, %s)", chunk)
+            for chunk in _chunks(self._event_rows()):
+                cursor.executemany(
+                    "INSERT INTO flight_event (event_type, flightID, airportID, people, sim_time) "
+                    "VALUES (%s, %s, %s, %s, %s)", chunk)
+        finally:
+            cursor.close()
+
+        written = {table: len(rows) for table, rows in changes.items()}
+        written['flight_event'] = len(self.events)
+        return written
+
+    def _event_rows(self):
+        return [
+            (event_type, flight_id, airport, people, timedelta(seconds=sim_time) if sim_time is not None else None)
+            for event_type, flight_id, airport, people, sim_time in self.events
+        ]
+
+
+def _chunks(rows, size=WRITE_CHUNK):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _bulk_update(cursor, table, keys, columns, rows):
+    """UPDATE many rows of table in a few statements via a temporary table."""
+    if not rows:
+        return
+    names = keys + columns
+    staging = f"sim_{table}_changes"
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+    cursor.execute(f"CREATE TEMPORARY TABLE {staging} AS SELECT {', '.join(names)} FROM {table} LIMIT 0")
+    insert = f"INSERT INTO {staging} ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))})"
+    for chunk in _chunks(rows):
+        cursor.executemany(insert, chunk)
+    cursor.execute(
+        f"UPDATE {table} t JOIN {staging} s ON {' AND '.join(f't.{c} = s.{c}' for c in keys)} "
+        f"SET {', '.join(f't.{c} = s.{c}' for c in columns)}"
+    )
+    cursor.execute(f"DROP TEMPORARY TABLE {staging}")
+
+
+def fast_forward(conn, max_steps=None, until=None):
+    """Run the simulation in memory and write the result back in one transaction.
+
+    The load, the steps and the write back are run again after a deadlock or
+    lock wait timeout (retry_transaction).
+    """
+    attempt = {}
+
+    def work():
+        engine = SimulationEngine.load(conn)
+        attempt['result'] = result = engine.run(max_steps, until)
+        result['written'] = engine.flush(conn)
+        commit(conn)
+        return result
+
+    try:
+        result = retry_transaction(conn, 'fast_forward', work)
+    except mysql.connector.Error as err:
+        conn.rollback()
+        if 'result' not in attempt:
+            raise
+        result = attempt['result']
+        result.pop('written', None)
+        result.update(committed=0, error=err.msg, stop_reason='error')
+        return result
+    result.update(committed=result['executed'], error=None)
+    return result
+
+
+def compare_with_procedure(conn, max_steps=None, until=None):
+    """Run the same steps in memory and through simulation_cycle(), then diff.
+
+    The procedure run is rolled back, so the database is left untouched.
+    Returns a list of (table, key, engine value, procedure value) differences.
+    """
+    engine = SimulationEngine.load(conn)
+    engine.run(max_steps, until)
+    expected = engine.state()
+    expected_events = engine._event_rows()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(eventID), 0) FROM flight_event")
+        last_event = cursor.fetchone()[0]
+        run_simulation(conn, max_steps, until, commit=False)
+        actual = SimulationEngine.load(conn).state()
+        cursor.execute("SELECT event_type, flightID, airportID, people, sim_time FROM flight_event "
+                       "WHERE eventID > %s ORDER BY eventID", (last_event,))
+        actual_events = [tuple(row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.rollback()
+
+    differences = []
+    for table, rows in expected.items():
+        for key in sorted(set(rows) | set(actual[table])):
+            if rows.get(key) != actual[table].get(key):
+                differences.append((table, key, rows.get(key), actual[table].get(key)))
+    for number in range(max(len(expected_events), len(actual_events))):
+        event = expected_events[number] if number < len(expected_events) else None
+        actual_event = actual_events[number] if number < len(actual_events) else None
+        if event != actual_event:
+            differences.append(('flight_event', number + 1, event, actual_event))
+    return differences
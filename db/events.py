@@ -0,0 +1,89 @@
+import json
+import time
+
+from db.config import EVENTS_CONFIG
+from db.db import pooled_connection
+from db.simulation import format_clock
+
+# Landings, takeoffs, boardings, disembarkations, crew recycles and retirements
+# are appended to flight_event by the stored procedures (and by the in-memory
+# engine when it writes back).  Readers follow the log by eventID, which only
+# touches the primary key of flight_event, never the flight or person tables.
+
+EVENT_COLUMNS = ['eventID', 'event_type', 'flightID', 'airportID', 'people', 'sim_time', 'recorded_at']
+
+
+def read_events(conn, after=0, limit=None):
+    """Events with eventID > after, oldest first, as dicts ready for JSON."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT {', '.join(EVENT_COLUMNS)} FROM flight_event "
+                       f"WHERE eventID > %s ORDER BY eventID LIMIT %s",
+                       (after, limit or EVENTS_CONFIG['batch_size']))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    events = []
+    for row in rows:
+        event = dict(zip(EVENT_COLUMNS, row))
+        event['sim_time'] = format_clock(event['sim_time'])
+        event['recorded_at'] = event['recorded_at'].isoformat() if event['recorded_at'] else None
+        events.append(event)
+    return events
+
+
+def latest_event_id(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(eventID), 0) FROM flight_event")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def read_cursor(value):
+    """Parse an event cursor (?after= or Last-Event-ID), or raise ValueError."""
+    value = (value or '').strip()
+    if not value.isdigit():
+        raise ValueError("The event cursor must be a non-negative integer.")
+    return int(value)
+
+
+def format_event(event):
+    return f"id: {event['eventID']}\nevent: {event['event_type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def event_stream(after=None, poll_interval=None, duration=None):
+    """Server-sent events for everything recorded after the given eventID.
+
+    Without a cursor the stream starts at the newest event, so only new
+    activity is sent.  A connection is borrowed from the pool for each read
+    only, so open streams do not hold connections while they wait.
+    """
+    poll_interval = poll_interval or EVENTS_CONFIG['poll_interval']
+    deadline = time.monotonic() + (duration or EVENTS_CONFIG['stream_seconds'])
+
+    if after is None:
+        with pooled_connection() as conn:
+            after = latest_event_id(conn)
+    yield f"retry: {int(poll_interval * 1000)}\n\n"
+
+    while True:
+        with pooled_connection() as conn:
+            events = read_events(conn, after)
+            # Reading ends the snapshot, so the next poll sees new commits.
+            conn.rollback()
+        for event in events:
+            yield format_event(event)
+        if events:
+            after = events[-1]['eventID']
+            if len(events) == EVENTS_CONFIG['batch_size']:
+                continue
+        else:
+            # A comment line keeps proxies from closing an idle stream.
+            yield ": keep-alive\n\n"
+
+        if time.monotonic() >= deadline:
+            return
+        time.sleep(poll_interval)
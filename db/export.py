@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import mysql.connector
+
+from db.config import EXPORT_CONFIG
+from db.simulation import format_clock
+from db.views import VIEW_KEYS
+
+# CSV and NDJSON exports of the reporting views and base tables, for the
+# /export/<name>.<format> routes and the `flask export` command.  Rows come off
+# an unbuffered cursor batch_size at a time and each batch is formatted and
+# handed on before the next is read, so memory stays the same for any size.
+#
+# The export reads one consistent snapshot without locking.  The site runs
+# SERIALIZABLE, where every plain SELECT takes shared locks, so a long export
+# would otherwise hold up every write to the table until it finished.
+
+BASE_TABLES = (
+    'airline', 'location', 'airport', 'airplane', 'leg', 'route', 'route_path', 'flight',
+    'person', 'pilot', 'pilot_licenses', 'passenger', 'passenger_vacations',
+    'flight_event', 'miles_change'
+)
+EXPORTABLE = tuple(VIEW_KEYS) + BASE_TABLES
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+def _value(value):
+    if isinstance(value, timedelta):
+        return format_clock(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class Export:
+    """The text of one export, produced one batch of rows per item.
+
+    The query runs when the export is created, so database errors surface
+    before a response starts.  columns are the column names and rows the number
+    of rows produced so far.  The connection is left in a read-only snapshot
+    transaction, which the caller rolls back or releases.
+    """
+
+    def __init__(self, conn, name, fmt, batch_size=None):
+        if name not in EXPORTABLE:
+            raise ValueError(f"Unknown view or table {name}.")
+        if fmt not in FORMATS:
+            raise ValueError(f"Format must be one of {', '.join(FORMATS)}.")
+        self.conn = conn
+        self.name = name
+        self.fmt = fmt
+        self.batch_size = batch_size or EXPORT_CONFIG['batch_size']
+        self.rows = 0
+
+        conn.rollback()
+        self._cursor = conn.cursor(buffered=False)
+        try:
+            self._cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            self._cursor.execute("START TRANSACTION READ ONLY, WITH CONSISTENT SNAPSHOT")
+            # A client that reads slowly stalls the cursor; give it longer than
+            # the default minute before the server gives up on the connection.
+            self._cursor.execute("SET SESSION net_write_timeout = %s", (EXPORT_CONFIG['net_write_timeout'],))
+            self._cursor.execute(f"SELECT * FROM {name}")
+        except mysql.connector.Error:
+            self.close()
+            raise
+        self.columns = list(self._cursor.column_names)
+
+    def __iter__(self):
+        try:
+            if self.fmt == 'csv':
+                yield _csv([self.columns])
+            while True:
+                batch = self._cursor.fetchmany(self.batch_size)
+                if not batch:
+                    break
+                self.rows += len(batch)
+                if self.fmt == 'csv':
+                    yield _csv(batch)
+                else:
+                    yield ''.join(json.dumps(dict(zip(self.columns, map(_value, row)))) + '\n' for row in batch)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._cursor is None:
+            return
+        try:
+            self._cursor.close()
+            cursor = self.conn.cursor()
+            cursor.execute("SET SESSION net_write_timeout = DEFAULT")
+            cursor.close()
+        except mysql.connector.Error:
+            pass
+        self._cursor = None
+
+
+def _csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in rows:
+        writer.writerow([_value(value) for value in row])
+    return out.getvalue()
@@ -0,0 +1,72 @@
+from markupsafe import Markup, escape
+
+from db.cache import fragment_cache
+from db.config import VIEW_CONFIG
+from db.views import ViewPage, page_key
+
+# The view pages render their table body here rather than in a Jinja loop: rows
+# are turned into HTML chunk_rows at a time, so a streamed page is sent in a few
+# large pieces instead of one write per cell.  A fully rendered body is kept in
+# the fragment cache until the next committed change, so a repeat visit skips
+# both the query and the rendering.
+
+
+class RenderedPage:
+    """One page of a reporting view with its table body rendered to HTML.
+
+    body yields Markup chunks of <tr> rows.  columns and limit are set at once;
+    next_after is known once body has been consumed, as on ViewPage.
+    """
+
+    def __init__(self, conn, view, after=None, limit=None, chunk_rows=None):
+        self.view = view
+        self.after = after
+        self.limit = limit or VIEW_CONFIG['page_size']
+        self.chunk_rows = chunk_rows or VIEW_CONFIG['chunk_rows']
+        self._key = page_key(view, after, self.limit)
+
+        cached = fragment_cache.get(self._key)
+        if cached is not None:
+            self.columns, chunks, self.next_after = cached
+            self.body = iter(chunks)
+            return
+
+        self._version = fragment_cache.version
+        self._page = ViewPage(conn, view, after, self.limit)
+        self.columns = self._page.columns
+        self.next_after = None
+        self.body = self._render()
+
+    def _render(self):
+        chunks = []
+        rows = []
+        for row in self._page.rows:
+            rows.append('<tr>' + ''.join(f'<td>{escape(item)}</td>' for item in row) + '</tr>')
+            if len(rows) == self.chunk_rows:
+                chunks.append(Markup('\n'.join(rows)))
+                rows = []
+                yield chunks[-1]
+        if rows:
+            chunks.append(Markup('\n'.join(rows)))
+            yield chunks[-1]
+        self.next_after = self._page.next_after
+        fragment_cache.put(self._key, (self.columns, chunks, self.next_after), self._version)
+
+
+def buffered(stream, size=None):
+    """Join the many small strings of a template stream into pieces of at least size bytes."""
+    size = size or VIEW_CONFIG['flush_bytes']
+    pending = []
+    length = 0
+    try:
+        for piece in stream:
+            pending.append(piece)
+            length += len(piece)
+            if length >= size:
+                yield ''.join(pending)
+                pending = []
+                length = 0
+        if pending:
+            yield ''.join(pending)
+    finally:
+        stream.close()
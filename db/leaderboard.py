@@ -0,0 +1,170 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from db.config import LEADERBOARD_CONFIG
+
+# Frequent flier leaderboard.  Every passenger's miles are read once and kept
+# sorted in memory; after that only the miles_change log (written by the
+# procedures, the in-memory engine and the bulk import whenever miles change)
+# is read to stay current.  A page of K passengers costs O(K + log n) and the
+# rank of one passenger O(log n), instead of sorting every passenger per read.
+
+LOAD_SQL = "SELECT personID, miles FROM passenger WHERE miles IS NOT NULL"
+LATEST_CHANGE_SQL = "SELECT COALESCE(MAX(changeID), 0) FROM miles_change"
+CHANGES_SQL = """
+    SELECT changeID, personID, miles FROM miles_change
+    WHERE changeID > %s ORDER BY changeID LIMIT %s
+"""
+
+
+class Leaderboard:
+    """Passengers ordered by miles, most first, like RANK() in top_frequent_fliers.
+
+    _order holds (-miles, lower-cased personID) in ascending order, so a
+    passenger's rank is one more than the number of entries with more miles,
+    found by bisecting for (-miles,).  _entries maps the lower-cased personID
+    to (miles, personID).  _position is the last miles_change row applied.
+    """
+
+    def __init__(self, size=10, max_size=1000, ttl=None, batch_size=5000, reload_after=50000):
+        self.size = size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.reload_after = reload_after
+        self._order = None
+        self._entries = None
+        self._position = 0
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.changes_applied = 0
+
+    def _stale(self):
+        return self._order is None or \
+            (self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl)
+
+    def _load(self, cursor, latest):
+        # The log position is taken before the passengers are read, so a change
+        # made in between is applied again on the next sync; applying a change
+        # only sets the passenger's miles, so that is harmless.
+        cursor.execute(LOAD_SQL)
+        entries = {person_id.lower(): (miles, person_id) for person_id, miles in cursor.fetchall()}
+        self._order = sorted((-miles, key) for key, (miles, _) in entries.items())
+        self._entries = entries
+        self._position = latest
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    def _apply(self, person_id, miles):
+        key = person_id.lower()
+        old = self._entries.pop(key, None)
+        if old is not None:
+            del self._order[bisect_left(self._order, (-old[0], key))]
+        if miles is not None:
+            self._entries[key] = (miles, person_id)
+            insort(self._order, (-miles, key))
+        self.changes_applied += 1
+
+    def sync(self, conn):
+        """Apply the miles changes logged since the last sync, or reload.
+
+        The board is reloaded when it is empty, older than ttl, more than
+        reload_after changes behind (a bulk change is cheaper to re-read), or
+        ahead of the log, which happens when a snapshot has been restored.
+        """
+        cursor = conn.cursor()
+        try:
+            with self._lock:
+                cursor.execute(LATEST_CHANGE_SQL)
+                latest = cursor.fetchone()[0]
+                if self._stale() or not 0 <= latest - self._position <= self.reload_after:
+                    self._load(cursor, latest)
+                    return
+                while self._position < latest:
+                    cursor.execute(CHANGES_SQL, (self._position, self.batch_size))
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    for change_id, person_id, miles in rows:
+                        self._apply(person_id, miles)
+                        self._position = change_id
+        finally:
+            cursor.close()
+
+    def _rank(self, miles):
+        return bisect_left(self._order, (-miles,)) + 1
+
+    def top(self, conn, offset=0, limit=None):
+        """One page of the board: (rows, next_offset, passengers).
+
+        Each row is a dict with the columns of top_frequent_fliers; next_offset
+        is None on the last page.
+        """
+        limit = limit or self.size
+        self.sync(conn)
+        with self._lock:
+            page = []
+            rank = None
+            for position, (negative_miles, key) in enumerate(self._order[offset:offset + limit], offset):
+                miles = -negative_miles
+                if rank is None:
+                    rank = self._rank(miles)
+                elif miles != page[-1]['total_miles']:
+                    rank = position + 1
+                page.append({'miles_rank': rank, 'personID': self._entries[key][1], 'total_miles': miles})
+            passengers = len(self._order)
+        _add_names(conn, page)
+        next_offset = offset + limit if offset + limit < passengers else None
+        return page, next_offset, passengers
+
+    def rank(self, conn, person_id):
+        """The board row of one passenger, or None if they have no miles."""
+        self.sync(conn)
+        with self._lock:
+            entry = self._entries.get(person_id.strip().lower())
+            if entry is None:
+                return None
+            miles, person_id = entry
+            row = {'miles_rank': self._rank(miles), 'personID': person_id, 'total_miles': miles}
+            passengers = len(self._order)
+        _add_names(conn, [row])
+        row['passengers'] = passengers
+        return row
+
+    def invalidate(self):
+        with self._lock:
+            self._order = None
+
+
+def _add_names(conn, rows):
+    if not rows:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT personID, first_name, last_name FROM person "
+            f"WHERE personID IN ({', '.join(['%s'] * len(rows))})",
+            [row['personID'] for row in rows])
+        names = {person_id.lower(): (first, last) for person_id, first, last in cursor.fetchall()}
+    finally:
+        cursor.close()
+    for row in rows:
+        row['first_name'], row['last_name'] = names.get(row['personID'].lower(), (None, None))
+
+
+def read_leaderboard_params(args):
+    """Return (offset, limit) from the query string, or raise ValueError."""
+    offset = args.get('offset', '').strip()
+    if offset and not offset.isdigit():
+        raise ValueError("offset must be a non-negative integer.")
+    limit = args.get('limit', '').strip()
+    if not limit:
+        return int(offset or 0), leaderboard.size
+    if not limit.isdigit() or not 0 < int(limit) <= leaderboard.max_size:
+        raise ValueError(f"limit must be between 1 and {leaderboard.max_size}.")
+    return int(offset or 0), int(limit)
+
+
+leaderboard = Leaderboard(**LEADERBOARD_CONFIG)
@@ -0,0 +1,238 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+
+# In-process metrics in the Prometheus text format, served at /metrics.
+#
+# Connections handed out by db.db are wrapped in InstrumentedConnection, whose
+# cursors time every statement.  The Flask hooks installed by init_app() time
+# each request and attach the per-request SQL totals to its route.  Recording
+# a sample is a perf_counter() pair, a bisect and a dict update under a lock.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CALL_PATTERN = re.compile(r'\s*CALL\s+(\w+)', re.IGNORECASE)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total}')
+                lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+requests_total = Counter('sams_requests_total', 'Requests handled, by route and status.',
+                         ('route', 'method', 'status'))
+request_duration = Histogram('sams_request_duration_seconds', 'Request latency by route.', ('route', 'method'))
+request_queries = Histogram('sams_request_queries', 'SQL statements executed per request.', ('route',),
+                            COUNT_BUCKETS)
+request_sql_time = Histogram('sams_request_sql_seconds', 'Time spent in SQL per request.', ('route',))
+query_duration = Histogram('sams_query_duration_seconds', 'SQL statement latency by statement type.',
+                           ('statement',))
+procedure_duration = Histogram('sams_procedure_duration_seconds', 'Stored procedure latency by name.',
+                               ('procedure',))
+rows_returned = Counter('sams_rows_returned_total', 'Rows fetched from MySQL, by route.', ('route',))
+transaction_retries = Counter('sams_transaction_retries_total',
+                              'Transactions run again after a deadlock or lock wait timeout.',
+                              ('procedure', 'reason'))
+transaction_conflicts = Counter('sams_transaction_conflicts_failed_total',
+                                'Transactions that still conflicted after every retry.', ('procedure', 'reason'))
+
+METRICS = [requests_total, request_duration, request_queries, request_sql_time, query_duration,
+           procedure_duration, rows_returned, transaction_retries, transaction_conflicts]
+
+
+def _route():
+    if has_request_context():
+        return request.url_rule.rule if request.url_rule else 'unmatched'
+    return 'none'
+
+
+def _statement_type(operation):
+    words = operation.split(None, 1)
+    return words[0].upper() if words else ''
+
+
+def _record_statement(statement, elapsed, procedure=None):
+    query_duration.observe(elapsed, (statement,))
+    if procedure:
+        procedure_duration.observe(elapsed, (procedure,))
+    if has_request_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+        g.sql_seconds += elapsed
+
+
+def _record_rows(count):
+    if count:
+        rows_returned.inc((_route(),), count)
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times statements and counts fetched rows."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            call = CALL_PATTERN.match(operation)
+            _record_statement(_statement_type(operation), time.perf_counter() - start,
+                              call.group(1) if call else None)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            _record_statement(_statement_type(operation), time.perf_counter() - start)
+
+    def callproc(self, procname, args=()):
+        start = time.perf_counter()
+        try:
+            return self._cursor.callproc(procname, args)
+        finally:
+            _record_statement('CALL', time.perf_counter() - start, procname)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        _record_rows(row is not None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        _record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        _record_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        count = 0
+        try:
+            for row in self._cursor:
+                count += 1
+                yield row
+        finally:
+            _record_rows(count)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are instrumented; .raw is the real connection."""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs))
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+
+
+def _after_request(response):
+    g.response_status = response.status_code
+    return response
+
+
+def _teardown_request(exc=None):
+    # A streamed response is torn down twice (see db.db.streamed); only the
+    # second teardown, after the body has been sent, is recorded.
+    if g.pop('streaming', False) or 'request_start' not in g:
+        return
+    route = _route()
+    status = g.get('response_status', 500)
+    requests_total.inc((route, request.method, str(status)))
+    request_duration.observe(time.perf_counter() - g.request_start, (route, request.method))
+    request_queries.observe(g.sql_queries, (route,))
+    request_sql_time.observe(g.sql_seconds, (route,))
+    del g.request_start
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def render(gauges=()):
+    """Metrics in Prometheus text format; gauges are (name, help, value) triples."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for name, help, value in gauges:
+        lines.extend([f'# HELP {name} {help}', f'# TYPE {name} gauge', f'{name} {value}'])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,250 @@
+from db.db import commit, retry_transaction
+
+# Outcomes the stored procedures leave in @sp_status, and the message shown for
+# each.  Statuses in CHANGED_STATUSES mean the procedure modified the database
+# and must be committed; every other status means it halted without changes.
+
+CHANGED_STATUSES = {'ok', 'granted', 'revoked', 'delayed'}
+
+NOT_ON_GROUND = "Flight does not exist or is not on the ground."
+ROUTE_COMPLETE = "Flight has already completed its route."
+NO_AIRPLANE = "Flight does not have an assigned airplane."
+
+PROCEDURE_MESSAGES = {
+    'add_airplane': {
+        'ok': "Airplane added successfully!",
+        'missing_input': "Airline ID, tail number, seat capacity, speed, and location ID are required.",
+        'bad_capacity': "Seat capacity and speed must be greater than 0.",
+        'no_airline': "Airline ID does not exist.",
+        'airplane_exists': "This tail number already exists for the given airline.",
+        'location_exists': "Location ID already exists in the database.",
+        'bad_type': "Only Boeing and Airbus airplanes may specify model or neo values.",
+        'bad_boeing': "Boeing airplanes must have a model and must not specify neo.",
+        'airbus_neo': "Airbus airplanes must specify neo.",
+        'airbus_model': "Airbus airplanes must not specify model."
+    },
+    'add_airport': {
+        'ok': "Airport added successfully!",
+        'missing_input': "Airport ID must be exactly 3 characters, and city, state, country, "
+                         "and location ID are required.",
+        'airport_exists': "Airport ID already exists.",
+        'location_exists': "Location ID is already in use."
+    },
+    'add_person': {
+        'ok': "Person added successfully!",
+        'missing_input': "Person ID, first name, and location ID are required.",
+        'no_location': "Location ID does not exist.",
+        'person_exists': "Person ID already exists.",
+        'both_roles': "A person cannot be both a pilot and a passenger.",
+        'bad_pilot': "Pilots must have both a tax ID and experience.",
+        'bad_passenger': "Passengers must have both miles and funds.",
+        'negative_experience': "Experience must be non-negative.",
+        'negative_miles': "Miles must be non-negative.",
+        'negative_funds': "Funds must be non-negative.",
+        'missing_tax_id': "Pilots must have both a tax ID and experience."
+    },
+    'grant_or_revoke_pilot_license': {
+        'granted': "License granted successfully!",
+        'revoked': "License revoked successfully!",
+        'missing_input': "Person ID and license type are required.",
+        'not_pilot': "Person ID does not exist or is not a pilot."
+    },
+    'offer_flight': {
+        'ok': "Flight offered successfully!",
+        'missing_input': "Flight ID, route ID, progress, next time, and cost are required.",
+        'bad_cost': "Cost must be a non-negative integer.",
+        'no_route': "Route ID does not exist.",
+        'flight_exists': "Flight ID already exists.",
+        'bad_progress': "Progress must be between 0 and the number of stops in the route minus one.",
+        'missing_airplane': "Both support airline and support tail must be provided together.",
+        'no_airplane': "Specified airplane does not exist.",
+        'airplane_in_use': "Specified airplane is already assigned to another flight."
+    },
+    'flight_landing': {
+        'ok': "Flight landed successfully!",
+        'missing_input': "Flight ID is required.",
+        'not_in_flight': "Flight does not exist or is not currently in flight.",
+        'no_leg': "Unable to determine the leg the flight is on."
+    },
+    'flight_takeoff': {
+        'ok': "Flight took off successfully!",
+        'delayed': "Not enough pilots assigned (Boeing requires 2, other airplanes 1). "
+                   "Flight will be delayed by 30 minutes.",
+        'missing_input': "Flight ID is required.",
+        'not_on_ground': NOT_ON_GROUND,
+        'route_complete': ROUTE_COMPLETE,
+        'no_airplane': NO_AIRPLANE,
+        'bad_airplane': "Assigned airplane details not found.",
+        'no_leg': "Unable to determine the next leg of the route."
+    },
+    'passengers_board': {
+        'ok': "Passengers boarded successfully!",
+        'missing_input': "Flight ID is required.",
+        'not_on_ground': NOT_ON_GROUND,
+        'route_complete': "Flight has completed all legs.",
+        'no_airplane': NO_AIRPLANE,
+        'bad_cost': "Flight cost is not set.",
+        'no_leg': "Unable to determine the next leg of the route.",
+        'over_capacity': "Not enough seats for all boarding passengers."
+    },
+    'passengers_board_batch': {
+        'ok': "Batch boarding finished.",
+        'missing_input': "An airport ID or a list of flight IDs is required.",
+        'no_flights': "No matching flights were found.",
+        'none_boarded': "None of the flights could board passengers."
+    },
+    'passengers_disembark': {
+        'ok': "Passengers disembarked successfully!",
+        'missing_input': "Flight ID is required.",
+        'not_on_ground': NOT_ON_GROUND,
+        'no_airplane': NO_AIRPLANE,
+        'no_leg': "Unable to determine the leg the flight is on.",
+        'no_airport': "Arrival airport location not found.",
+        'no_passengers': "No passengers are disembarking at this airport."
+    },
+    'assign_pilot': {
+        'ok': "Pilot assigned successfully!",
+        'missing_input': "Flight ID and pilot person ID are required.",
+        'not_on_ground': NOT_ON_GROUND,
+        'route_complete': ROUTE_COMPLETE,
+        'pilot_unavailable': "Pilot does not exist or is already assigned to another flight.",
+        'no_license': "Pilot does not have the required license for this airplane.",
+        'pilot_not_at_airport': "Pilot must be at an airport to be assigned."
+    },
+    'auto_crew': {
+        'ok': "Crew assignment finished.",
+        'missing_input': "An airport ID or a list of flight IDs is required.",
+        'no_flights': "No matching flights were found.",
+        'none_assigned': "None of the flights could be crewed."
+    },
+    'recycle_crew': {
+        'ok': "Crew recycled successfully.",
+        'missing_input': "Flight ID is required.",
+        'not_found': "Flight ID does not exist.",
+        'not_on_ground': "Flight must be on the ground to recycle crew.",
+        'route_incomplete': "Flight has not completed all legs of its route.",
+        'no_arrival': "Unable to determine arrival airport.",
+        'no_arrival_location': "Arrival airport location not found.",
+        'passengers_present': "Passengers are still present at the arrival location."
+    },
+    'retire_flight': {
+        'ok': "Flight retired successfully!",
+        'missing_input': "Flight ID is required.",
+        'not_found': "Flight ID does not exist.",
+        'not_on_ground': "Flight must be on the ground to be retired.",
+        'mid_route': "Flight must be at the start or end of its route to be retired.",
+        'passengers_aboard': "All passengers must have disembarked before retiring the flight.",
+        'pilots_assigned': "All pilots must be unassigned before retiring the flight."
+    }
+}
+
+
+# Outcome of each flight in an auto_crew result set.
+CREW_MESSAGES = {
+    'ok': "Pilots assigned.",
+    'crewed': "Flight already has the pilots it needs.",
+    'short_crew': "Not enough licensed pilots available at the airport.",
+    'not_on_ground': NOT_ON_GROUND,
+    'route_complete': ROUTE_COMPLETE,
+    'no_airplane': NO_AIRPLANE,
+    'no_leg': "Unable to determine the next leg of the route."
+}
+
+
+def call_procedure(conn, name, args):
+    """Call a stored procedure and return (status, message) for its outcome.
+
+    The procedure checks its own preconditions, so the call and the read of
+    @sp_status are the only statements sent.  Changes are committed only when
+    the procedure reports that it made some.  A call that loses a deadlock or
+    times out waiting for a row lock is run again (see retry_transaction).
+    """
+    def work():
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"CALL {name}({', '.join(['%s'] * len(args))})", list(args))
+            cursor.execute("SELECT @sp_status")
+            status = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+        if status in CHANGED_STATUSES:
+            commit(conn)
+        else:
+            conn.rollback()
+        return status
+
+    status = retry_transaction(conn, name, work)
+    return status, PROCEDURE_MESSAGES[name].get(status, f"{name} made no changes ({status}).")
+
+
+def _call_batch(conn, name, airport_id, flight_ids):
+    """Call a batch procedure; return (status, rows of its result set).
+
+    The whole batch is committed as one transaction, or rolled back when the
+    procedure reports that nothing changed.  Like call_procedure, the batch is
+    run again after a deadlock or lock wait timeout.
+    """
+    def work():
+        cursor = conn.cursor()
+        try:
+            cursor.callproc(name, (airport_id, ','.join(flight_ids) or None))
+            rows = [row for result in cursor.stored_results() for row in result.fetchall()]
+            cursor.execute("SELECT @sp_status")
+            status = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+        if status in CHANGED_STATUSES:
+            commit(conn)
+        else:
+            conn.rollback()
+        return status, rows
+
+    return retry_transaction(conn, name, work)
+
+
+def _missing(rows, flight_ids, *values):
+    # Listed flights that do not exist are not in the result set.
+    found = {row[0].lower() for row in rows}
+    return [(flight_id, 'not_on_ground') + values for flight_id in flight_ids if flight_id.lower() not in found]
+
+
+def board_flights(conn, airport_id=None, flight_ids=None):
+    """Board passengers onto many flights with one passengers_board_batch call.
+
+    Returns (status, message, flights), where flights has one entry per flight
+    considered (or requested): flightID, status, boarded and a message taken
+    from passengers_board.  The boarding is committed as one transaction.
+    """
+    flight_ids = list(flight_ids or [])
+    status, rows = _call_batch(conn, 'passengers_board_batch', airport_id, flight_ids)
+    rows += _missing(rows, flight_ids, 0)
+    messages = PROCEDURE_MESSAGES['passengers_board']
+    flights = [{
+        'flightID': flight_id,
+        'status': flight_status,
+        'boarded': boarded,
+        'message': messages.get(flight_status, flight_status)
+    } for flight_id, flight_status, boarded in rows]
+    return status, PROCEDURE_MESSAGES['passengers_board_batch'].get(status, status), flights
+
+
+def crew_flights(conn, airport_id=None, flight_ids=None):
+    """Assign pilots to many flights with one auto_crew call.
+
+    Returns (status, message, flights), where flights has one entry per flight
+    considered (or requested): flightID, status, needed, assigned and a
+    message.  All assignments are committed as one transaction.
+    """
+    flight_ids = list(flight_ids or [])
+    status, rows = _call_batch(conn, 'auto_crew', airport_id, flight_ids)
+    rows += _missing(rows, flight_ids, 0, 0)
+    flights = [{
+        'flightID': flight_id,
+        'status': flight_status,
+        'needed': needed,
+        'assigned': assigned,
+        'message': CREW_MESSAGES.get(flight_status, flight_status)
+    } for flight_id, flight_status, needed, assigned in rows]
+    return status, PROCEDURE_MESSAGES['auto_crew'].get(status, status), flights
@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+
+from flask import current_app, g, message_flashed, request
+
+from db.config import RECORDING_CONFIG
+
+# Traffic recording for bench.replay, installed by init_app() when a log path
+# is configured.  Every request is appended to a JSONL file as one line: the
+# time it arrived, method, path and query string, form fields or JSON body,
+# the status, the messages it flashed (or the status/error of a JSON reply)
+# and its latency.  Each line is written with a single os.write() on an
+# O_APPEND file, so gunicorn workers can share one log without mixing lines.
+# Flashes are taken from the message_flashed signal, since a page that flashes
+# and renders in the same request has popped them from the session by the end.
+#
+# init_app() must run after metrics.init_app(): Flask calls teardown hooks in
+# reverse order, so ours sees g.streaming before the metrics hook clears it and
+# a streamed page is recorded once, after its body has been sent.
+
+_lock = threading.Lock()
+_files = {}
+
+
+def _skipped(path):
+    return any(path == prefix or path.startswith(prefix.rstrip('/') + '/') for prefix in RECORDING_CONFIG['skip'])
+
+
+def _before_request():
+    if _skipped(request.path):
+        return
+    g.record = {
+        'at': time.time(),
+        'method': request.method,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'path': request.path,
+        'query': request.query_string.decode('latin-1')
+    }
+    if request.is_json:
+        g.record['json'] = request.get_json(silent=True)
+    elif request.form:
+        g.record['form'] = request.form.to_dict(flat=False)
+    if request.files:
+        g.record['files'] = sorted(request.files)
+    g.record['flashed'] = []
+    g.record_start = time.perf_counter()
+
+
+def _after_request(response):
+    record = g.get('record')
+    if record is None:
+        return response
+    record['status'] = response.status_code
+    if response.is_json and not response.is_streamed and 'Content-Encoding' not in response.headers:
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            record['result'] = data.get('status', data.get('error'))
+    return response
+
+
+def _teardown_request(exc=None):
+    if g.get('streaming') or 'record_start' not in g:
+        return
+    record = g.pop('record')
+    record['latency_ms'] = round(1000 * (time.perf_counter() - g.pop('record_start')), 3)
+    record.setdefault('status', 500)
+    os.write(current_app.extensions['recording'], (json.dumps(record, default=str) + '\n').encode('utf-8'))
+
+
+def _flashed(sender, message, category, **extra):
+    record = g.get('record')
+    if record is not None:
+        record['flashed'].append(message)
+
+
+def init_app(app):
+    """Record requests to app.config['RECORD_PATH'], or RECORDING_CONFIG['path'] by default."""
+    path = app.config.get('RECORD_PATH', RECORDING_CONFIG['path'])
+    if not path:
+        return
+    with _lock:
+        if path not in _files:
+            _files[path] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    app.extensions['recording'] = _files[path]
+    message_flashed.connect(_flashed, app)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from db.config import ROUTE_INDEX_CONFIG
+
+# Route and leg data is effectively static while the site runs, so instead of
+# joining route_path and leg on every lookup the whole topology is read once
+# and kept in memory.  Changes made through this process call
+# invalidate_routes(); the ttl covers changes made elsewhere.
+
+ROUTE_LEGS_SQL = """
+    SELECT rp.routeID, rp.sequence, l.legID, l.departure, l.arrival, l.distance
+    FROM route_path rp JOIN leg l ON rp.legID = l.legID
+    ORDER BY rp.routeID, rp.sequence
+"""
+
+
+class Route:
+    """The ordered legs of one route.
+
+    Each leg is a dict with routeID, sequence, legID, departure, arrival,
+    distance and cumulative_distance (distance flown once the leg is done).
+    """
+
+    __slots__ = ('routeID', 'legs', '_by_sequence')
+
+    def __init__(self, route_id, legs):
+        self.routeID = route_id
+        self.legs = legs
+        self._by_sequence = {leg['sequence']: leg for leg in legs}
+
+    @property
+    def leg_count(self):
+        return len(self.legs)
+
+    @property
+    def distance(self):
+        return self.legs[-1]['cumulative_distance'] if self.legs else 0
+
+    def leg(self, sequence):
+        return self._by_sequence.get(sequence)
+
+    def departure(self):
+        return self.legs[0]['departure'] if self.legs else None
+
+    def arrival(self):
+        return self.legs[-1]['arrival'] if self.legs else None
+
+
+class RouteIndex:
+    """Routes keyed by lower-cased routeID, loaded on first use."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._routes = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _stale(self):
+        return self._routes is None or \
+            (self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl)
+
+    def _load(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(ROUTE_LEGS_SQL)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        grouped = {}
+        for row in rows:
+            key = row['routeID'].lower()
+            legs = grouped.setdefault(key, [])
+            row['cumulative_distance'] = (legs[-1]['cumulative_distance'] if legs else 0) + row['distance']
+            legs.append(row)
+        return {key: Route(legs[0]['routeID'], legs) for key, legs in grouped.items()}
+
+    def routes(self, conn):
+        """All routes, reloaded through conn when the index is empty or stale.
+
+        The returned dict is never modified, so callers can keep using it for
+        the rest of an operation.
+        """
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self._routes = self._load(conn)
+                    self._loaded_at = time.monotonic()
+                    self.loads += 1
+        return self._routes
+
+    def get(self, conn, route_id):
+        return self.routes(conn).get(route_id.lower()) if route_id is not None else None
+
+    def invalidate(self):
+        with self._lock:
+            self._routes = None
+
+
+route_index = RouteIndex(**ROUTE_INDEX_CONFIG)
+
+
+def invalidate_routes():
+    route_index.invalidate()
@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+from db.db import commit as commit_changes
+from db.routes import route_index
+
+# Same selection simulation_cycle() uses to pick the flight it acts on.  The
+# route length comes from the route index.
+NEXT_FLIGHT_SQL = """
+    SELECT f.flightID, f.routeID, f.airplane_status, f.next_time, f.progress
+    FROM flight f
+    WHERE f.next_time <=> (SELECT next_time FROM flight ORDER BY next_time ASC LIMIT 1)
+    ORDER BY CASE WHEN f.airplane_status = 'in_flight' THEN 0 ELSE 1 END,
+             f.flightID ASC
+    LIMIT 1
+"""
+
+FLIGHT_STATE_SQL = """
+    SELECT airplane_status, next_time, progress FROM flight WHERE flightID = %s
+"""
+
+# Upper bound on steps when only a target time is given.
+MAX_STEPS = 10000
+
+
+def parse_clock(value):
+    """Parse 'HH:MM:SS' (or 'HH:MM') into the timedelta MySQL uses for TIME columns."""
+    for fmt in ('%H:%M:%S', '%H:%M'):
+        try:
+            t = datetime.strptime(value, fmt)
+            return timedelta(hours=t.hour, minutes=t.minute, seconds=t.second)
+        except ValueError:
+            continue
+    raise ValueError("Time must be in HH:MM:SS format.")
+
+
+def read_simulation_params(source):
+    steps = str(source.get('steps', '') or '').strip()
+    until = str(source.get('until', '') or '').strip()
+    batch_size = str(source.get('batch_size', '') or '').strip()
+
+    if steps and not steps.isdigit():
+        raise ValueError("Steps must be a non-negative integer.")
+    if batch_size and not batch_size.isdigit():
+        raise ValueError("Batch size must be a non-negative integer.")
+
+    return (
+        int(steps) if steps else None,
+        parse_clock(until) if until else None,
+        int(batch_size) if batch_size else 0
+    )
+
+
+def format_clock(value):
+    if value is None:
+        return None
+    total = int(value.total_seconds())
+    return f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}"
+
+
+def branch_for(status, progress, total_legs):
+    if status == 'in_flight':
+        return 'landing'
+    if status == 'on_ground':
+        return 'retire' if progress == total_legs else 'takeoff'
+    return None
+
+
+def run_simulation(conn, max_steps=None, until=None, batch_size=0, commit=True):
+    """Call simulation_cycle() repeatedly on one connection.
+
+    Stops after max_steps steps, once the next flight's next_time is later than
+    until, when no flights are left, or when a step leaves its flight unchanged
+    (the procedure would keep picking it forever).  With batch_size 0 every step
+    runs in one transaction; otherwise a commit is issued every batch_size steps.
+    With commit=False nothing is committed and the caller owns the transaction.
+
+    Returns a dict with the per-step summary, the number of committed steps and
+    the reason the run stopped.
+    """
+    if max_steps is None:
+        max_steps = MAX_STEPS
+    routes = route_index.routes(conn)
+    cursor = conn.cursor(dictionary=True)
+    steps = []
+    committed = 0
+    stop_reason = 'max_steps'
+    error = None
+
+    try:
+        while len(steps) < max_steps:
+            cursor.execute(NEXT_FLIGHT_SQL)
+            flight = cursor.fetchone()
+            if not flight:
+                stop_reason = 'no_flights'
+                break
+            if until is not None and flight['next_time'] is not None and flight['next_time'] > until:
+                stop_reason = 'reached_time'
+                break
+
+            route = routes.get(flight['routeID'].lower())
+            branch = branch_for(flight['airplane_status'], flight['progress'], route.leg_count if route else 0)
+            cursor.callproc('simulation_cycle')
+
+            cursor.execute(FLIGHT_STATE_SQL, (flight['flightID'],))
+            after = cursor.fetchone()
+            if after and (after['airplane_status'], after['next_time'], after['progress']) == \
+                    (flight['airplane_status'], flight['next_time'], flight['progress']):
+                stop_reason = 'stalled'
+                break
+
+            steps.append({
+                'step': len(steps) + 1,
+                'flight': flight['flightID'],
+                'branch': branch,
+                'time': format_clock(flight['next_time']),
+                'next_time': format_clock(after['next_time']) if after else None,
+                'retired': after is None
+            })
+
+            if commit and batch_size and len(steps) % batch_size == 0:
+                commit_changes(conn)
+                committed = len(steps)
+
+        if commit:
+            commit_changes(conn)
+            committed = len(steps)
+
+    except mysql.connector.Error as err:
+        conn.rollback()
+        error = err.msg
+        stop_reason = 'error'
+    finally:
+        cursor.close()
+
+    return {
+        'steps': steps,
+        'executed': len(steps),
+        'committed': committed,
+        'stop_reason': stop_reason,
+        'error': error
+    }
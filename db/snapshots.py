@@ -0,0 +1,173 @@
+import re
+import time
+
+import mysql.connector
+
+from db.config import DB_CONFIG
+from db.db import commit
+from db.leaderboard import leaderboard
+from db.routes import invalidate_routes
+
+# Named snapshots of every table in the database, for resetting a scenario
+# between test and benchmark runs without re-running the SQL scripts.
+#
+# A snapshot is a schema next to the live one, flight_tracking__snapshot__<name>,
+# with a copy of each base table (CREATE TABLE ... LIKE, so the same columns and
+# indexes but no foreign keys).  Everything is copied inside the server with
+# INSERT ... SELECT; restoring truncates the live tables and copies the rows
+# back with foreign key and unique checks off, as a dump load would.  Derived
+# tables (route_summary, flight_position, ...) and the event and miles logs are
+# snapshotted like the rest, so nothing has to be recomputed after a restore.
+
+SNAPSHOT_PREFIX = f"{DB_CONFIG['database']}__snapshot__"
+# Restoring the data version would let other processes miss the restore.
+NOT_SNAPSHOTTED = {'data_version'}
+NAME_PATTERN = re.compile(r'^[a-z0-9_]{1,32}$')
+
+TABLES_SQL = """
+    SELECT table_name FROM information_schema.tables
+    WHERE table_schema = %s AND table_type = 'BASE TABLE'
+    ORDER BY table_name
+"""
+COLUMNS_SQL = """
+    SELECT column_name FROM information_schema.columns
+    WHERE table_schema = %s AND table_name = %s
+    ORDER BY ordinal_position
+"""
+SNAPSHOTS_SQL = """
+    SELECT s.schema_name, COUNT(t.table_name), COALESCE(SUM(t.table_rows), 0), MIN(t.create_time)
+    FROM information_schema.schemata s
+    LEFT JOIN information_schema.tables t ON t.table_schema = s.schema_name
+    WHERE s.schema_name LIKE %s
+    GROUP BY s.schema_name
+    ORDER BY s.schema_name
+"""
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class UnknownSnapshot(SnapshotError):
+    pass
+
+
+def _schema(name):
+    if not NAME_PATTERN.match(name or ''):
+        raise SnapshotError("Snapshot names are 1 to 32 lower-case letters, digits or underscores.")
+    return SNAPSHOT_PREFIX + name
+
+
+def _tables(cursor, schema):
+    cursor.execute(TABLES_SQL, (schema,))
+    return [row[0] for row in cursor.fetchall() if row[0] not in NOT_SNAPSHOTTED]
+
+
+def _columns(cursor, schema, table):
+    cursor.execute(COLUMNS_SQL, (schema, table))
+    return ', '.join(f'`{row[0]}`' for row in cursor.fetchall())
+
+
+def list_snapshots(conn):
+    """Snapshots with their table count, approximate row count and creation time."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(SNAPSHOTS_SQL, (SNAPSHOT_PREFIX.replace('_', '\\_') + '%',))
+        return [{
+            'name': schema[len(SNAPSHOT_PREFIX):],
+            'tables': tables,
+            'rows': int(rows),
+            'created_at': created.isoformat() if created else None
+        } for schema, tables, rows, created in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def save_snapshot(conn, name):
+    """Copy every table into the snapshot schema, replacing an older snapshot of that name.
+
+    The tables are created first, since DDL commits; the rows are then copied
+    in one transaction, so the snapshot is consistent across tables.
+    """
+    schema = _schema(name)
+    live = DB_CONFIG['database']
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        tables = _tables(cursor, live)
+        cursor.execute(f"DROP SCHEMA IF EXISTS `{schema}`")
+        cursor.execute(f"CREATE SCHEMA `{schema}`")
+        for table in tables:
+            cursor.execute(f"CREATE TABLE `{schema}`.`{table}` LIKE `{live}`.`{table}`")
+        rows = 0
+        for table in tables:
+            cursor.execute(f"INSERT INTO `{schema}`.`{table}` SELECT * FROM `{live}`.`{table}`")
+            rows += cursor.rowcount
+        conn.commit()
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {'name': name, 'tables': len(tables), 'rows': rows, 'seconds': time.perf_counter() - start}
+
+
+def restore_snapshot(conn, name):
+    """Replace the contents of every snapshotted table with the snapshot's rows.
+
+    Tables that exist now but not in the snapshot are left alone and listed
+    under 'skipped'.  The view cache, route index and leaderboard of this
+    process are reset, and other processes reset theirs on their next request.
+    TRUNCATE commits, so a restore that fails part way leaves tables empty;
+    run it again.
+    """
+    schema = _schema(name)
+    live = DB_CONFIG['database']
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        saved = _tables(cursor, schema)
+        if not saved:
+            raise UnknownSnapshot(f"Snapshot {name} does not exist.")
+        current = _tables(cursor, live)
+        tables = [table for table in saved if table in current]
+
+        cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+        try:
+            for table in tables:
+                cursor.execute(f"TRUNCATE TABLE `{live}`.`{table}`")
+            rows = 0
+            for table in tables:
+                columns = _columns(cursor, schema, table)
+                cursor.execute(f"INSERT INTO `{live}`.`{table}` ({columns}) "
+                               f"SELECT {columns} FROM `{schema}`.`{table}`")
+                rows += cursor.rowcount
+            commit(conn, reload=True)
+        finally:
+            cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+    except mysql.connector.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    invalidate_routes()
+    leaderboard.invalidate()
+    return {
+        'name': name,
+        'tables': len(tables),
+        'rows': rows,
+        'skipped': [table for table in current if table not in saved],
+        'seconds': time.perf_counter() - start
+    }
+
+
+def drop_snapshot(conn, name):
+    schema = _schema(name)
+    cursor = conn.cursor()
+    try:
+        if not _tables(cursor, schema):
+            raise UnknownSnapshot(f"Snapshot {name} does not exist.")
+        cursor.execute(f"DROP SCHEMA `{schema}`")
+    finally:
+        cursor.close()
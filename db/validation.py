@@ -0,0 +1,249 @@
+import re
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# Input checks shared by the form routes, the JSON API and the bulk importer.  Each
+# validate_* function takes a mapping (request.form or an imported row) and
+# returns (values, error): the cleaned values in the stored procedure's
+# argument order, and the first rule the input breaks, or None.
+
+TAX_ID_PATTERN = re.compile(r'^\d{3}-\d{2}-\d{4}$')
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n', 'off'}
+
+
+def _text(data, name):
+    value = data.get(name)
+    return '' if value is None else str(value).strip()
+
+
+def _int(data, name):
+    value = _text(data, name)
+    return int(value) if value else None
+
+
+def _amount(data, name):
+    # The form accepts cents (step 0.01); funds are stored as whole units.
+    value = _text(data, name)
+    if not value:
+        return None
+    try:
+        return int(Decimal(value).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"{name} is not a number")
+
+
+def _flag(data, name, default=None):
+    value = _text(data, name).lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    return default
+
+
+def validate_airport(data):
+    values = {
+        'airport_id': _text(data, 'airport_id'),
+        'name': _text(data, 'name'),
+        'city': _text(data, 'city'),
+        'state': _text(data, 'state'),
+        'country': _text(data, 'country'),
+        'location_id': _text(data, 'location_id')
+    }
+
+    if not values['airport_id'] or len(values['airport_id']) != 3:
+        return values, "Airport ID must be exactly 3 characters."
+    if not values['city'] or not values['state'] or not values['country'] or not values['location_id']:
+        return values, "City, state, country, and location ID are required."
+    return values, None
+
+
+def validate_person(data):
+    values = {
+        'person_id': _text(data, 'person_id'),
+        'first_name': _text(data, 'first_name'),
+        'last_name': _text(data, 'last_name') or None,
+        'location_id': _text(data, 'location_id'),
+        'tax_id': _text(data, 'tax_id') or None,
+        'experience': None,
+        'miles': None,
+        'funds': None
+    }
+
+    if not values['person_id']:
+        return values, "Person ID is required."
+    if not values['first_name']:
+        return values, "First name is required."
+    if not values['location_id']:
+        return values, "Location ID is required."
+
+    try:
+        values['experience'] = _int(data, 'experience')
+        values['miles'] = _int(data, 'miles')
+        values['funds'] = _amount(data, 'funds')
+    except ValueError:
+        return values, "Experience and miles must be whole numbers, and funds a number."
+
+    is_pilot = values['tax_id'] is not None or values['experience'] is not None
+    is_passenger = values['miles'] is not None or values['funds'] is not None
+
+    if is_pilot and is_passenger:
+        return values, "A person cannot be both a pilot and a passenger."
+    if not is_pilot and not is_passenger:
+        return values, "A person must be a pilot or a passenger."
+    if is_pilot and (values['tax_id'] is None or values['experience'] is None):
+        return values, "Pilots must have both a tax ID and experience."
+    if is_passenger and (values['miles'] is None or values['funds'] is None):
+        return values, "Passengers must have both miles and funds."
+
+    if values['experience'] is not None and values['experience'] < 0:
+        return values, "Experience must be non-negative."
+    if values['miles'] is not None and values['miles'] < 0:
+        return values, "Miles must be non-negative."
+    if values['funds'] is not None and values['funds'] < 0:
+        return values, "Funds must be non-negative."
+    if values['tax_id'] and not TAX_ID_PATTERN.match(values['tax_id']):
+        return values, "Tax ID is in the wrong format."
+    return values, None
+
+
+def validate_airplane(data):
+    plane_type = _text(data, 'plane_type') or None
+    model = _text(data, 'model') or None
+    # A missing neo value is None, so an unticked form checkbox still counts
+    # as "not specified" while imported rows can say neo=false explicitly.
+    is_neo = _flag(data, 'is_neo')
+    normalized_type = plane_type.lower() if plane_type else None
+
+    values = {
+        'airline_id': _text(data, 'airline_id'),
+        'tail_num': _text(data, 'tail_num'),
+        'seat_cap': None,
+        'speed': None,
+        'location_id': _text(data, 'location_id'),
+        'plane_type': plane_type,
+        'maintained': _flag(data, 'maintained', default=False),
+        'model': model if normalized_type == 'boeing' else None,
+        'neo': is_neo if normalized_type == 'airbus' else None
+    }
+
+    if not values['airline_id'] or not values['tail_num']:
+        return values, "Airline ID and tail number are required."
+    if not values['location_id']:
+        return values, "Location ID is required."
+
+    try:
+        values['seat_cap'] = _int(data, 'seat_cap')
+        values['speed'] = _int(data, 'speed')
+    except ValueError:
+        return values, "Seat capacity and speed must be valid integers."
+    if values['seat_cap'] is None or values['speed'] is None:
+        return values, "Seat capacity and speed must be valid integers."
+    if values['seat_cap'] <= 0 or values['speed'] <= 0:
+        return values, "Seat capacity and speed must be greater than 0."
+
+    if plane_type is None:
+        if model is not None or is_neo:
+            return values, "Non-specified types must not include model or neo values."
+    elif normalized_type == 'boeing':
+        if model is None:
+            return values, "Boeing airplanes must have a model."
+        if is_neo:
+            return values, "Boeing airplanes must not specify neo."
+    elif normalized_type == 'airbus':
+        if is_neo is None:
+            return values, "Airbus airplanes must specify neo."
+        if model is not None:
+            return values, "Airbus airplanes must not specify model."
+    else:
+        if model is not None or is_neo:
+            return values, "Other airplane types must not specify model or neo."
+    return values, None
+
+
+def validate_flight(data):
+    """The flight ID of flight_takeoff, flight_landing, passengers_board and the other one-flight operations."""
+    values = {'flight_id': _text(data, 'flight_id')}
+    if not values['flight_id']:
+        return values, "Flight ID is required."
+    return values, None
+
+
+def validate_assign_pilot(data):
+    values = {
+        'flight_id': _text(data, 'flight_id'),
+        'person_id': _text(data, 'person_id')
+    }
+    if not values['flight_id']:
+        return values, "Flight ID is required."
+    if not values['person_id']:
+        return values, "Pilot Person ID is required."
+    return values, None
+
+
+def validate_pilot_license(data):
+    values = {
+        'person_id': _text(data, 'person_id'),
+        'license_type': _text(data, 'license_type')
+    }
+    if not values['person_id']:
+        return values, "Person ID is required."
+    if not values['license_type']:
+        return values, "License type is required."
+    return values, None
+
+
+def validate_offer_flight(data):
+    values = {
+        'flight_id': _text(data, 'flight_id'),
+        'route_id': _text(data, 'route_id'),
+        'support_airline': _text(data, 'support_airline') or None,
+        'support_tail': _text(data, 'support_tail') or None,
+        'progress': _text(data, 'progress'),
+        'next_time': _text(data, 'next_time'),
+        'cost': _text(data, 'cost')
+    }
+
+    if not values['flight_id']:
+        return values, "Flight ID is required."
+    if not values['route_id']:
+        return values, "Route ID is required."
+    if not values['progress'].isdigit():
+        return values, "Progress must be a non-negative integer."
+    values['progress'] = int(values['progress'])
+    if not values['cost'].isdigit():
+        return values, "Cost must be a non-negative integer."
+    values['cost'] = int(values['cost'])
+    if not values['next_time']:
+        return values, "Next time is required."
+    try:
+        datetime.strptime(values['next_time'], '%H:%M:%S')
+    except ValueError:
+        return values, "Next time must be in the correct format."
+    if (values['support_airline'] is None) != (values['support_tail'] is None):
+        return values, "Both support airline and support tail must be provided together."
+    return values, None
+
+
+def validate_flight_batch(data):
+    """Airport ID and flight IDs for the batch procedures (passengers_board_batch, auto_crew).
+
+    flight_ids may be a list (JSON) or a string separated by commas, spaces or
+    new lines (forms).
+    """
+    flight_ids = data.get('flight_ids') or []
+    if isinstance(flight_ids, str):
+        flight_ids = re.split(r'[\s,]+', flight_ids)
+    values = {
+        'airport_id': _text(data, 'airport_id').upper() or None,
+        'flight_ids': list(dict.fromkeys(str(flight_id).strip() for flight_id in flight_ids if str(flight_id).strip()))
+    }
+
+    if not values['airport_id'] and not values['flight_ids']:
+        return values, "An airport ID or a list of flight IDs is required."
+    if values['airport_id'] and len(values['airport_id']) != 3:
+        return values, "Airport ID must be exactly 3 characters."
+    if any(',' in flight_id for flight_id in values['flight_ids']):
+        return values, "Flight IDs cannot contain commas."
+    return values, None
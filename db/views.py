@@ -0,0 +1,128 @@
+import mysql.connector
+
+from db.cache import view_cache
+from db.config import VIEW_CONFIG
+
+# Unique sort key of every reporting view, used for keyset pagination: a page
+# is "WHERE key > last key of the previous page ORDER BY key LIMIT n", so any
+# page costs the same no matter how far into the view it starts.
+VIEW_KEYS = {
+    'flights_in_the_air': ('departure_airport', 'arrival_airport'),
+    'flights_on_the_ground': ('departing_from',),
+    'people_in_the_air': ('departing_from', 'arriving_at'),
+    'people_on_the_ground': ('departing_from',),
+    'route_summary': ('route',),
+    'alternative_airports': ('city', 'state', 'country'),
+    'top_frequent_fliers': ('miles_rank', 'personID')
+}
+
+
+def read_page_params(view, args):
+    """Return (after, limit) from the query string, or raise ValueError."""
+    after = [value for value in args.getlist('after') if value != ''] or None
+    if after is not None and len(after) != len(VIEW_KEYS[view]):
+        raise ValueError(f"after needs {len(VIEW_KEYS[view])} value(s): {', '.join(VIEW_KEYS[view])}.")
+
+    limit = args.get('limit', '').strip()
+    if not limit:
+        return after, VIEW_CONFIG['page_size']
+    if not limit.isdigit() or not 0 < int(limit) <= VIEW_CONFIG['max_page_size']:
+        raise ValueError(f"limit must be between 1 and {VIEW_CONFIG['max_page_size']}.")
+    return after, int(limit)
+
+
+def page_query(view, after, limit, fields=None, filters=None):
+    """Build the SQL for one page.  fields and filter columns must be view columns."""
+    keys = VIEW_KEYS[view]
+    if fields:
+        select = ', '.join(list(fields) + [key for key in keys if key not in fields])
+    else:
+        select = '*'
+    sql = f"SELECT {select} FROM {view}"
+    conditions, params = [], []
+    for column, value in (filters or {}).items():
+        conditions.append(f"{column} = %s")
+        params.append(value)
+    if after:
+        if len(keys) == 1:
+            conditions.append(f"{keys[0]} > %s")
+        else:
+            conditions.append(f"({', '.join(keys)}) > ({', '.join(['%s'] * len(keys))})")
+        params.extend(after)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # One extra row tells whether there is a next page.
+    sql += f" ORDER BY {', '.join(keys)} LIMIT %s"
+    params.append(limit + 1)
+    return sql, params
+
+
+def page_key(view, after, limit, fields=None, filters=None):
+    """Cache key of one page, shared by the row and fragment caches."""
+    return (view, tuple(after or ()), limit, tuple(fields or ()), tuple(sorted((filters or {}).items())))
+
+
+_columns = {}
+
+
+def view_columns(conn, view):
+    """Column names of a view, read once per process."""
+    if view not in _columns:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT * FROM {view} LIMIT 0")
+            cursor.fetchall()
+            _columns[view] = list(cursor.column_names)
+        finally:
+            cursor.close()
+    return _columns[view]
+
+
+class ViewPage:
+    """One page of a reporting view whose rows are read while they are rendered.
+
+    The query runs when the page is created, so database errors surface before
+    the response starts.  Rows then come straight off an unbuffered cursor, and
+    next_after (the key to request the following page with) is known once rows
+    has been consumed.  A fully read page is stored in the view cache.
+    """
+
+    def __init__(self, conn, view, after=None, limit=None, fields=None, filters=None):
+        self.view = view
+        self.after = after
+        self.limit = limit or VIEW_CONFIG['page_size']
+        self.next_after = None
+        self._key = page_key(view, after, self.limit, fields, filters)
+
+        cached = view_cache.get(self._key)
+        if cached is not None:
+            self.columns, rows, self.next_after = cached
+            self.rows = iter(rows)
+            return
+
+        self._version = view_cache.version
+        self._cursor = conn.cursor(buffered=False)
+        try:
+            self._cursor.execute(*page_query(view, after, self.limit, fields, filters))
+        except mysql.connector.Error:
+            self._cursor.close()
+            raise
+        self.columns = list(self._cursor.column_names)
+        self.rows = self._stream()
+
+    def _stream(self):
+        key_index = [self.columns.index(key) for key in VIEW_KEYS[self.view]]
+        rows = []
+        try:
+            for row in self._cursor:
+                if len(rows) == self.limit:
+                    self.next_after = [rows[-1][i] for i in key_index]
+                    continue
+                rows.append(row)
+                yield row
+            view_cache.put(self._key, (self.columns, rows, self.next_after), self._version)
+        finally:
+            try:
+                self._cursor.close()
+            except mysql.connector.Error:
+                pass
@@ -0,0 +1,24 @@
+# Production server settings:  gunicorn -c gunicorn.conf.py
+#
+# Workers and threads come from SERVER_CONFIG in db/config.py; -w and --threads
+# on the command line override them.  Each worker imports the app and calls
+# create_app() after it has been forked, so connection pools are never shared
+# between processes.
+from db.config import SERVER_CONFIG
+
+wsgi_app = 'app:create_app()'
+bind = SERVER_CONFIG['bind']
+workers = SERVER_CONFIG['workers']
+threads = SERVER_CONFIG['threads']
+worker_class = 'gthread'
+
+
+def post_worker_init(worker):
+    # With --preload the app (and its warm start) was built in the master; the
+    # worker starts with an empty pool, so open its connections here instead.
+    if worker.cfg.preload_app and SERVER_CONFIG['warm_start']:
+        from db.db import warm_pool
+        try:
+            warm_pool()
+        except Exception as err:
+            worker.log.warning("Warm start skipped the database: %s", err)
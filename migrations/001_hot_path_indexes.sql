@@ -0,0 +1,36 @@
+-- Indexes for the simulation and people view hot paths.
+-- Run after the database and stored procedure scripts.  Safe to run again.
+
+set names utf8mb4;
+use flight_tracking;
+
+/* InnoDB already created an index for every foreign key column, so the joins
+on person.locationID (fk8), pilot.commanding_flight (fk9), airport.locationID
+(fk2), airplane.locationID (fk3) and flight.routeID (fk14) are indexed.  What
+is missing are indexes on the flight columns the simulation and the airborne
+views filter and sort on:
+
+  flight_next_time  - simulation_cycle() reads the earliest next_time from it
+                      and then only the flights due at that time
+  flight_status     - flights_in_the_air / people_in_the_air select in-flight
+                      flights and join route_path on (routeID, progress) */
+
+drop procedure if exists add_index_if_missing;
+delimiter //
+create procedure add_index_if_missing (in ip_table varchar(64), in ip_index varchar(64),
+    in ip_columns varchar(255))
+sp_main: begin
+    if exists (select * from information_schema.statistics
+               where table_schema = database() and table_name = ip_table and index_name = ip_index) then
+        leave sp_main;
+    end if;
+
+    set @ddl = concat('create index ', ip_index, ' on ', ip_table, ' (', ip_columns, ')');
+    prepare stmt from @ddl;
+    execute stmt;
+    deallocate prepare stmt;
+end //
+delimiter ;
+
+call add_index_if_missing('flight', 'flight_next_time', 'next_time, airplane_status, flightID');
+call add_index_if_missing('flight', 'flight_status', 'airplane_status, routeID, progress');
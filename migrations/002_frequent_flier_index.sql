@@ -0,0 +1,11 @@
+-- Index for the frequent flier leaderboard.
+-- Run after 001_hot_path_indexes.sql, which creates add_index_if_missing().  Safe to run again.
+
+set names utf8mb4;
+use flight_tracking;
+
+/* top_frequent_fliers reads the passengers with the most miles from the end of
+this index, and ranks each one by counting the entries above it.  The in-process
+leaderboard (db/leaderboard.py) loads all passengers in this order. */
+
+call add_index_if_missing('passenger', 'passenger_miles', 'miles, personID');